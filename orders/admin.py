@@ -1,6 +1,8 @@
 import nested_admin
 from django.contrib import admin
-from .models import Client, Order, OrderItem, ComponentFinish
+from .models import (Client, Order, OrderItem, ComponentFinish,
+                     DuplicateClientCandidate, defer_order_updates)
+from .duplicates import merge_duplicate_clients
 
 
 @admin.register(Client)
@@ -9,6 +11,35 @@ class ClientAdmin(admin.ModelAdmin):
                     'client_email', 'created_on')
 
 
+@admin.register(DuplicateClientCandidate)
+class DuplicateClientCandidateAdmin(admin.ModelAdmin):
+    list_display = ('client', 'client_details', 'duplicate',
+                    'duplicate_details', 'score', 'status', 'created_on')
+    list_filter = ['status']
+    actions = ['merge_duplicates', 'dismiss_duplicates']
+
+    # Optimize the queryset to avoid N+1 issues
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return queryset.select_related('client', 'duplicate')
+
+    def client_details(self, obj):
+        return f"{obj.client.client_phone} {obj.client.client_email}"
+
+    def duplicate_details(self, obj):
+        return f"{obj.duplicate.client_phone} {obj.duplicate.client_email}"
+
+    @admin.action(description='Merge the duplicates into the oldest client')
+    def merge_duplicates(self, request, queryset):
+        merged = merge_duplicate_clients(queryset)
+        self.message_user(request, f"Merged {merged} duplicate clients.")
+
+    @admin.action(description='Dismiss the selected duplicates')
+    def dismiss_duplicates(self, request, queryset):
+        dismissed = queryset.update(status=2)
+        self.message_user(request, f"Dismissed {dismissed} duplicates.")
+
+
 @admin.register(Order)
 class OrderAdmin(nested_admin.NestedModelAdmin):
 
@@ -22,7 +53,8 @@ class OrderAdmin(nested_admin.NestedModelAdmin):
         extra = 0
         inlines = [ComponentFinishInLine]
 
-    readonly_fields = ['order_status']
+    # The status and totals are derived from the items
+    readonly_fields = ['order_status', 'order_value', 'discount']
     list_display = ('order_number', 'client', 'order_value',
                     'order_status', 'created_on',
                     'updated_on')
@@ -33,3 +65,12 @@ class OrderAdmin(nested_admin.NestedModelAdmin):
     # render the order number from the primary key
     def order_number(self, obj):
         return f"Order#{obj.pk}"  # Format the order number as "Order#pk"
+
+    def save_related(self, request, form, formsets, change):
+        # Recompute the order status and totals once after all the
+        # inline order items are saved
+        with defer_order_updates():
+            super().save_related(request, form, formsets, change)
+        # Intern the configurations of the items from their saved option
+        # values and component finishes
+        form.instance.items.all().update_configurations()
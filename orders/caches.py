@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+from django.db import connection, transaction
+
+
+class PrefixCache:
+    """
+    In-process LRU cache of the results of typeahead queries, bounded in
+    size and with a TTL. The results of a query can be reused for longer
+    queries starting with it, if they are complete, i.e. they include all
+    the matches of the query.
+    """
+
+    def __init__(self, max_size=512, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.prefix_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, query):
+        """
+        Return the cached results of the query and whether they are
+        complete, or the complete results of the longest cached prefix of
+        the query with the prefix, or None.
+        """
+        with self.lock:
+            now = time.monotonic()
+            for length in range(len(query), 0, -1):
+                prefix = query[:length]
+                entry = self.entries.get(prefix)
+                if entry is None:
+                    continue
+                expires, results, complete = entry
+                if expires <= now:
+                    del self.entries[prefix]
+                    continue
+                if prefix == query:
+                    self.hits += 1
+                elif complete:
+                    self.prefix_hits += 1
+                else:
+                    # Incomplete results of a prefix are not reusable
+                    continue
+                self.entries.move_to_end(prefix)
+                return prefix, results, complete
+            self.misses += 1
+            return None
+
+    def set(self, query, results, complete):
+        with self.lock:
+            self.entries[query] = (time.monotonic() + self.ttl,
+                                   results, complete)
+            self.entries.move_to_end(query)
+            # Evict the least recently used entries
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.prefix_hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'prefix_hits': self.prefix_hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': ((self.hits + self.prefix_hits) / lookups
+                             if lookups else 0),
+            }
+
+
+# Cache of the client search results, cleared on client writes
+client_search_cache = PrefixCache()
+
+
+def invalidate_client_search():
+    """Clear the client search results after a client write."""
+    client_search_cache.clear()
+    # Clear again on commit the results cached by concurrent searches
+    # before the write was committed
+    if connection.in_atomic_block:
+        transaction.on_commit(client_search_cache.clear)
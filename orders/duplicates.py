@@ -0,0 +1,146 @@
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from django.db import transaction
+from django.db.models import Case, When, Value
+from .models import Client, Order, DuplicateClientCandidate
+
+
+# Blocks with more clients are skipped, as their keys are too common
+# to tell duplicates apart, e.g. a shared office phone number
+MAX_BLOCK_SIZE = 200
+
+# Number of candidate pairs compared by a worker at a time
+PAIRS_PER_TASK = 5000
+
+
+def blocking_keys(name_key, email_key, phone_key):
+    """
+    Return the keys of the blocks of a client. Only the clients sharing
+    a block are compared.
+    """
+    keys = set()
+    if email_key:
+        keys.add(f'email:{email_key}')
+        keys.add(f'email_user:{email_key.split("@")[0]}')
+    if phone_key:
+        keys.add(f'phone:{phone_key}')
+    if name_key:
+        # The name words in any order, e.g. 'doe jane' for 'Jane Doe'
+        keys.add(f'name:{" ".join(sorted(name_key.split()))}')
+    return keys
+
+
+def similarity(a, b):
+    """
+    Score the similarity of two clients, given as (id, name_key,
+    email_key, phone_key) tuples, from 0 to 1.
+    """
+    _, a_name, a_email, a_phone = a
+    _, b_name, b_email, b_phone = b
+    name_score = SequenceMatcher(
+        None, ' '.join(sorted(a_name.split())),
+        ' '.join(sorted(b_name.split()))).ratio()
+    email_score = (1.0 if a_email == b_email else SequenceMatcher(
+        None, a_email.split('@')[0], b_email.split('@')[0]).ratio())
+    phone_score = 1.0 if a_phone and a_phone == b_phone else 0.0
+    return 0.5 * name_score + 0.3 * email_score + 0.2 * phone_score
+
+
+def score_pairs(pairs, threshold):
+    """
+    Return the (client id, duplicate id, score) of the pairs scoring at
+    least the threshold. Runs in the worker processes.
+    """
+    scored = []
+    for a, b in pairs:
+        score = similarity(a, b)
+        if score >= threshold:
+            scored.append((a[0], b[0], round(score, 4)))
+    return scored
+
+
+def candidate_pairs(clients):
+    """
+    Return the distinct pairs of clients sharing a block, the oldest
+    client first.
+    """
+    blocks = defaultdict(list)
+    for client in clients:
+        for key in blocking_keys(*client[1:]):
+            blocks[key].append(client)
+
+    pairs = {}
+    for block in blocks.values():
+        if len(block) > MAX_BLOCK_SIZE:
+            continue
+        block.sort()
+        for index, a in enumerate(block):
+            for b in block[index + 1:]:
+                pairs[(a[0], b[0])] = (a, b)
+    return list(pairs.values())
+
+
+def find_duplicate_clients(threshold=0.8, workers=None):
+    """
+    Find the likely duplicate clients, comparing the pairs of clients
+    sharing a block in parallel across a pool of processes, and store
+    them for review. Returns the number of candidate pairs compared and
+    the number of duplicates found.
+    """
+    clients = list(Client.objects.values_list(
+        'id', 'name_key', 'email_key', 'phone_key'))
+    pairs = candidate_pairs(clients)
+    tasks = [pairs[start:start + PAIRS_PER_TASK]
+             for start in range(0, len(pairs), PAIRS_PER_TASK)]
+
+    if workers == 1 or len(tasks) <= 1:
+        results = [score_pairs(task, threshold) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(score_pairs, tasks,
+                                        [threshold] * len(tasks)))
+
+    duplicates = [
+        DuplicateClientCandidate(client_id=client_id,
+                                 duplicate_id=duplicate_id, score=score)
+        for scored in results for client_id, duplicate_id, score in scored
+    ]
+    # Update the scores of the pairs already found, keeping their status
+    DuplicateClientCandidate.objects.bulk_create(
+        duplicates, batch_size=1000, update_conflicts=True,
+        unique_fields=['client', 'duplicate'], update_fields=['score'])
+    return len(pairs), len(duplicates)
+
+
+@transaction.atomic
+def merge_duplicate_clients(candidates):
+    """
+    Merge the duplicate clients of the candidate pairs into the oldest
+    client of each group of duplicates, moving their orders with a single
+    UPDATE. Returns the number of clients merged.
+    """
+    # Group the chained pairs, e.g. A-B and B-C, under the oldest client
+    parents = {}
+
+    def find(client_id):
+        while parents.get(client_id, client_id) != client_id:
+            client_id = parents[client_id]
+        return client_id
+
+    for candidate in candidates:
+        client_id = find(candidate.client_id)
+        duplicate_id = find(candidate.duplicate_id)
+        if client_id != duplicate_id:
+            parents[max(client_id, duplicate_id)] = min(client_id,
+                                                        duplicate_id)
+    merged = {duplicate_id: find(duplicate_id) for duplicate_id in parents}
+    if not merged:
+        return 0
+
+    Order.objects.filter(client_id__in=merged).update(client_id=Case(
+        *[When(client_id=duplicate_id, then=Value(client_id))
+          for duplicate_id, client_id in merged.items()]))
+    # Deleting the duplicates also deletes their candidate pairs
+    Client.objects.filter(id__in=merged).delete()
+    return len(merged)
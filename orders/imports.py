@@ -0,0 +1,198 @@
+import json
+import time
+from django.db import IntegrityError, transaction
+from .models import Client, Order
+from .normalizers import normalize_phone, normalize_email
+from .serializers import OrderImportSerializer
+from .utils import (OrderCatalog, build_order_items, bulk_create_order_items,
+                    upsert_clients)
+
+
+class OrderImporter:
+    """
+    Imports orders from NDJSON lines, one order per line, in the format of
+    the order creation API plus an idempotency_key and the optional
+    created_on, archived and item_status fields of historical orders.
+    The lines are streamed and committed in chunks, each in its own
+    transaction, so a failed import can be safely run again: orders with
+    an idempotency_key that was already imported are skipped.
+    """
+
+    def __init__(self, chunk_size=500):
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self.created = 0
+        self.skipped = 0
+        self.items = 0
+        self.errors = []
+        self.seconds = 0
+
+    def run(self, lines):
+        """Import the orders of the given iterable of NDJSON lines."""
+        start = time.perf_counter()
+        chunk = []
+        for line_number, line in enumerate(lines, start=1):
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            # Skip blank lines
+            if not line.strip():
+                continue
+            self.rows += 1
+            chunk.append((line_number, line))
+            if len(chunk) >= self.chunk_size:
+                self.import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.import_chunk(chunk)
+        self.seconds = time.perf_counter() - start
+        return self.summary()
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0
+
+    def summary(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'skipped': self.skipped,
+            'failed': len(self.errors),
+            'items': self.items,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+            'errors': self.errors,
+        }
+
+    def add_error(self, line_number, errors):
+        self.errors.append({'line': line_number, 'errors': errors})
+
+    def import_chunk(self, chunk):
+        # Parse and validate the fields of each order
+        orders_data = []
+        for line_number, line in chunk:
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                self.add_error(line_number, f"Invalid JSON: {e}")
+                continue
+            serializer = OrderImportSerializer(data=data)
+            if not serializer.is_valid():
+                self.add_error(line_number, serializer.errors)
+                continue
+            orders_data.append((line_number, serializer.validated_data))
+
+        # Skip the orders already imported
+        imported_keys = self.imported_keys(orders_data)
+        new_orders_data = []
+        for line_number, data in orders_data:
+            if data['idempotency_key'] in imported_keys:
+                self.skipped += 1
+                continue
+            new_orders_data.append((line_number, data))
+
+        # Validate the clients and the catalog objects of the whole chunk
+        # with one query per model
+        clients = Client.objects.in_bulk(
+            {data['client']['id'] for _, data in new_orders_data
+             if data['client'].get('id')})
+        catalog = OrderCatalog.from_items(
+            [item for _, data in new_orders_data for item in data['items']])
+        valid_orders_data = []
+        for line_number, data in new_orders_data:
+            errors = {}
+            client_id = data['client'].get('id')
+            if client_id and client_id not in clients:
+                errors['client'] = [f"Invalid client: {client_id}"]
+            item_errors = catalog.resolve_items(data['items'])
+            if any(item_errors):
+                errors['items'] = item_errors
+            if errors:
+                self.add_error(line_number, errors)
+                continue
+            # Skip the orders repeated in the chunk, reserving the key only
+            # for a valid order, so a later valid line is still imported
+            if data['idempotency_key'] in imported_keys:
+                self.skipped += 1
+                continue
+            imported_keys.add(data['idempotency_key'])
+            valid_orders_data.append((line_number, data))
+
+        while valid_orders_data:
+            try:
+                with transaction.atomic():
+                    self.save_orders([data for _, data in valid_orders_data],
+                                     clients)
+                break
+            except IntegrityError:
+                # A concurrent import committed some of the keys first, so
+                # skip their orders and save the rest again
+                conflicting_keys = self.imported_keys(valid_orders_data)
+                if not conflicting_keys:
+                    raise
+                self.skipped += sum(
+                    data['idempotency_key'] in conflicting_keys
+                    for _, data in valid_orders_data)
+                valid_orders_data = [
+                    (line_number, data)
+                    for line_number, data in valid_orders_data
+                    if data['idempotency_key'] not in conflicting_keys]
+
+    def imported_keys(self, orders_data):
+        """Return the idempotency keys of the orders already imported."""
+        return set(Order.objects.filter(
+            idempotency_key__in=[data['idempotency_key']
+                                 for _, data in orders_data]
+        ).values_list('idempotency_key', flat=True))
+
+    def save_orders(self, orders_data, clients):
+        """
+        Insert the orders of a chunk with their new clients and items,
+        with the derived fields computed in memory.
+        """
+        # Create the new clients, once for a client repeated in the chunk,
+        # or use the existing clients with the same email and phone
+        def client_key(client_data):
+            return (normalize_email(client_data['client_email']),
+                    normalize_phone(client_data['client_phone']))
+
+        new_clients = {}
+        for data in orders_data:
+            if not data['client'].get('id'):
+                new_clients.setdefault(client_key(data['client']), Client(
+                    client_name=data['client']['client_name'],
+                    client_phone=data['client']['client_phone'],
+                    client_email=data['client']['client_email']))
+        upsert_clients(list(new_clients.values()))
+
+        # Build the orders and their items, setting the order totals,
+        # order status and items completed fields once for the chunk
+        orders = []
+        items = []
+        for data in orders_data:
+            client_id = data['client'].get('id')
+            order = Order(
+                client=(clients[client_id] if client_id
+                        else new_clients[client_key(data['client'])]),
+                deposit=data['deposit'],
+                paid=data['paid'],
+                archived=data['archived'],
+                idempotency_key=data['idempotency_key'],
+            )
+            items.extend(build_order_items(order, data['items']))
+            orders.append(order)
+        Order.objects.bulk_create(orders)
+
+        # Bulk inserts set the creation dates to now,
+        # so restore the dates of the historical orders
+        dated_orders = []
+        for order, data in zip(orders, orders_data):
+            if data.get('created_on'):
+                order.created_on = data['created_on']
+                dated_orders.append(order)
+        if dated_orders:
+            Order.objects.bulk_update(dated_orders, ['created_on'])
+
+        bulk_create_order_items(items)
+
+        self.created += len(orders)
+        self.items += len(items)
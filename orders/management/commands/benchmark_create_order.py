@@ -0,0 +1,100 @@
+import time
+from statistics import mean
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+from products.models import (Product, Option, OptionValue, Component,
+                             Finish, FinishOption, ProductComponent)
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the submission time of the create order form for "
+            "orders with a large number of configured items. All the data "
+            "created is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=100,
+                            help='Number of item forms per order.')
+        parser.add_argument('--runs', type=int, default=5,
+                            help='Number of order submissions to time.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            timings = self.run_benchmark(options['items'], options['runs'])
+            # Discard all the benchmark data
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['items']}-item order submission over "
+            f"{options['runs']} runs: mean {mean(timings):.1f} ms, "
+            f"min {min(timings):.1f} ms, max {max(timings):.1f} ms"))
+
+    def run_benchmark(self, num_items, runs):
+        user = User.objects.create(username='benchmark_create_order')
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+
+        data = self.build_order_data(num_items)
+        url = reverse('create_order')
+
+        timings = []
+        for run in range(runs):
+            data['client_name'] = f'Benchmark Client {run}'
+            start = time.perf_counter()
+            response = client.post(url, data)
+            timings.append((time.perf_counter() - start) * 1000)
+            # A redirect means that the order was created successfully
+            if response.status_code != 302:
+                raise RuntimeError('The benchmark order was not created.')
+        return timings
+
+    def build_order_data(self, num_items):
+        """
+        Create a configurable product and the POST data of an order with
+        the given number of configured items.
+        """
+        finish = Finish.objects.create(name='Benchmark Finish')
+        finish_option = FinishOption.objects.create(finish=finish,
+                                                    name='Benchmark')
+        product = Product.objects.create(name='Benchmark Product',
+                                         slug='benchmark-product',
+                                         base_price=100)
+        component = Component(name='Benchmark Component',
+                              slug='benchmark-component')
+        component.save()
+        option_component = Component(name='Benchmark Option Component',
+                                     slug='benchmark-option-component')
+        option_component.save()
+        option = Option.objects.create(name='Size', product=product)
+        option_value = OptionValue.objects.create(option=option,
+                                                  value='Large')
+        ProductComponent.objects.create(product=product, component=component)
+        ProductComponent.objects.create(product=product,
+                                        component=option_component,
+                                        option_value=option_value)
+
+        data = {
+            'client_phone': '+35799999999',
+            'client_email': 'benchmark@example.com',
+            'order_value': f'{100 * num_items}.00',
+            'deposit': '0.00',
+            'items-TOTAL_FORMS': str(num_items),
+            'items-INITIAL_FORMS': '0',
+        }
+        for index in range(num_items):
+            prefix = f'items-{index}'
+            data.update({
+                f'{prefix}-product': product.id,
+                f'{prefix}-quantity': '1',
+                f'{prefix}-base_price': '100.00',
+                f'{prefix}-discount': '0.00',
+                f'{prefix}-item_value': '100.00',
+                f'{prefix}-option_{option.id}': option_value.id,
+                f'{prefix}-component_finish-{component.id}':
+                    finish_option.id,
+                f'{prefix}-option_finish_component-{option_component.id}':
+                    finish_option.id,
+            })
+        return data
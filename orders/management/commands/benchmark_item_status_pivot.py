@@ -0,0 +1,83 @@
+import random
+import time
+from statistics import mean
+from django.core.management.base import BaseCommand
+from orders.models import OrderItem
+from slotted_need.pivot import Pivot
+
+
+class Command(BaseCommand):
+    help = ("Benchmark building the product by item status matrix of the "
+            "item status chart from its grouped counts, scanning the counts "
+            "for each cell against pivoting them. No database is used.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000,
+                            help='Number of products, i.e. matrix rows.')
+        parser.add_argument('--runs', type=int, default=3,
+                            help='Number of matrices to time.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the random counts.')
+
+    def handle(self, *args, **options):
+        products, statuses, status_counts = self.build_counts(
+            options['products'], options['seed'])
+
+        scan_timings, scanned = self.time_runs(
+            options['runs'],
+            lambda: self.scan_matrix(products, statuses, status_counts))
+        pivot_timings, pivoted = self.time_runs(
+            options['runs'],
+            lambda: Pivot.from_rows(
+                status_counts, 'product_id', 'item_status', 'count',
+                row_keys=products, column_keys=statuses).matrix.tolist())
+        if scanned != pivoted:
+            raise RuntimeError('The pivoted matrix differs from the scanned.')
+
+        for name, timings in (('Scan', scan_timings),
+                              ('Pivot', pivot_timings)):
+            self.stdout.write(
+                f"{name}: mean {mean(timings):.1f} ms, "
+                f"min {min(timings):.1f} ms, max {max(timings):.1f} ms")
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(products)} products x {len(statuses)} statuses from "
+            f"{len(status_counts)} counts over {options['runs']} runs: "
+            f"pivot {mean(scan_timings) / mean(pivot_timings):.0f}x faster"))
+
+    def build_counts(self, num_products, seed):
+        """
+        Return the product ids, the statuses and the grouped counts of a
+        random subset of the product and status pairs.
+        """
+        rng = random.Random(seed)
+        products = list(range(1, num_products + 1))
+        statuses = list(OrderItem.STATUS_CHOICES.keys())
+        status_counts = [
+            {'product_id': product_id, 'item_status': status_code,
+             'count': rng.randint(1, 50)}
+            for product_id in products for status_code in statuses
+            if rng.random() < 0.6]
+        rng.shuffle(status_counts)
+        return products, statuses, status_counts
+
+    def scan_matrix(self, products, statuses, status_counts):
+        """Build the matrix as the chart did, scanning the counts per cell."""
+        matrix = []
+        for product_id in products:
+            count_data = []
+            for status_code in statuses:
+                matching = next((item for item in status_counts
+                                 if item['product_id'] == product_id
+                                 and item['item_status'] == status_code),
+                                None)
+                count_data.append(matching['count'] if matching else 0)
+            matrix.append(count_data)
+        return matrix
+
+    def time_runs(self, runs, build):
+        timings = []
+        for run in range(runs):
+            start = time.perf_counter()
+            result = build()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings, result
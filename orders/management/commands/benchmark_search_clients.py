@@ -0,0 +1,68 @@
+import random
+import time
+from statistics import mean, quantiles
+from faker import Faker
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from orders.models import Client
+from orders.caches import client_search_cache
+from orders.search import find_clients
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the client typeahead search over a large number of "
+            "clients. All the data created is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100000,
+                            help='Number of clients to search.')
+        parser.add_argument('--names', type=int, default=20,
+                            help='Number of client names to type.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the generated data.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            clients = self.create_clients(options['clients'],
+                                          options['seed'])
+            random.seed(options['seed'])
+            timings = self.run_benchmark(
+                random.sample(clients, options['names']))
+            # Discard all the benchmark data
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Client search over {options['clients']} clients: "
+            f"mean {mean(timings):.2f} ms, "
+            f"p95 {quantiles(timings, n=20)[-1]:.2f} ms, "
+            f"max {max(timings):.2f} ms, "
+            f"cache hit rate {client_search_cache.stats()['hit_rate']:.0%}"))
+
+    def create_clients(self, num_clients, seed):
+        """Create clients with realistic names and unique identities."""
+        fake = Faker()
+        fake.seed_instance(seed)
+        clients = []
+        for index in range(num_clients):
+            first_name, last_name = fake.first_name(), fake.last_name()
+            clients.append(Client(
+                client_name=f'{first_name} {last_name}',
+                client_phone=f'+3579{index:07d}',
+                client_email=(f'{first_name}.{last_name}{index}@'
+                              f'{fake.free_email_domain()}')))
+        Client.objects.bulk_create(clients, batch_size=5000)
+        return clients
+
+    def run_benchmark(self, clients):
+        """
+        Time the searches of the typeahead while typing the names and the
+        phone numbers of the clients, one character at a time.
+        """
+        timings = []
+        for client in clients:
+            for value in (client.client_name, str(client.client_phone)[4:]):
+                for length in range(1, len(value) + 1):
+                    start = time.perf_counter()
+                    find_clients(value[:length])
+                    timings.append((time.perf_counter() - start) * 1000)
+        return timings
@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from orders.duplicates import find_duplicate_clients
+
+
+class Command(BaseCommand):
+    help = ("Find the likely duplicate clients, comparing the clients "
+            "sharing a normalized name, email or phone number in parallel, "
+            "and store them for review in the admin.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=0.8,
+                            help='Minimum similarity of duplicates, '
+                                 'from 0 to 1.')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of worker processes, '
+                                 'defaults to the number of CPUs.')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['threshold'] <= 1:
+            raise CommandError('The threshold must be between 0 and 1.')
+        if options['workers'] is not None and options['workers'] < 1:
+            raise CommandError('The number of workers must be positive.')
+
+        start = time.perf_counter()
+        compared, found = find_duplicate_clients(options['threshold'],
+                                                 options['workers'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Found {found} likely duplicate clients in {compared} "
+            f"compared pairs in {time.perf_counter() - start:.2f} s"))
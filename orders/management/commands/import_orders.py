@@ -0,0 +1,40 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from orders.imports import OrderImporter
+
+
+class Command(BaseCommand):
+    help = ("Import orders from an NDJSON file, one order per line, "
+            "committing in chunks and skipping orders with an "
+            "idempotency_key that was already imported.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path',
+                            help="Path of the NDJSON file, or '-' for stdin.")
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Number of orders committed per chunk.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('The chunk size must be a positive integer.')
+
+        importer = OrderImporter(chunk_size=options['chunk_size'])
+        if options['path'] == '-':
+            summary = importer.run(sys.stdin)
+        else:
+            try:
+                with open(options['path'], encoding='utf-8') as lines:
+                    summary = importer.run(lines)
+            except OSError as e:
+                raise CommandError(e)
+
+        # Report the errors of the orders that were not imported
+        for error in summary['errors']:
+            self.stderr.write(f"Line {error['line']}: {error['errors']}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['created']} of {summary['rows']} orders "
+            f"({summary['items']} items), skipped {summary['skipped']} "
+            f"already imported, {summary['failed']} failed, in "
+            f"{summary['seconds']} s ({summary['rows_per_second']} rows/sec)"
+        ))
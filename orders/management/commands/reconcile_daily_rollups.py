@@ -0,0 +1,31 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from orders.models import reconcile_daily_rollups
+
+
+class Command(BaseCommand):
+    help = ("Recalculate the daily rollups of the order items with SQL "
+            "aggregates and correct the ones that drifted, e.g. after "
+            "fixture loads or raw SQL bypassing the incremental updates. "
+            "Meant to run nightly.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Only reconcile the rollups of the orders '
+                                 'created in the last number of days.')
+
+    def handle(self, *args, **options):
+        dates = None
+        if options['days'] is not None:
+            today = timezone.localdate()
+            dates = [today - timedelta(days=day)
+                     for day in range(options['days'])]
+        corrected = reconcile_daily_rollups(dates)
+
+        if corrected:
+            self.stdout.write(self.style.WARNING(
+                f"Corrected {corrected} drifted daily rollups."))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                'All the daily rollups match the order items.'))
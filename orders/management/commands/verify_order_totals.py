@@ -0,0 +1,64 @@
+import operator
+from decimal import Decimal
+from functools import reduce
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from orders.models import Order, recalculate_order_totals
+
+
+# Largest difference of the totals not reported, to tolerate the
+# rounding of the sums of decimals on SQLite
+TOLERANCE = Decimal('0.005')
+
+
+class Command(BaseCommand):
+    help = ("Verify the incrementally maintained order totals and item "
+            "status counts against the order items, recalculated with SQL "
+            "aggregates, and optionally fix the orders that drifted.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Recalculate the totals, item status '
+                                 'counts and status of the orders that '
+                                 'drifted.')
+
+    def handle(self, *args, **options):
+        items_totals = Order.items_totals()
+        status_counts = Order.items_status_counts()
+        drifted = Order.objects.alias(
+            items_value=items_totals['order_value'],
+            items_discount=items_totals['discount'],
+            **{f'counted_{field}': count
+               for field, count in status_counts.items()},
+        ).filter(
+            Q(items_value__gt=F('order_value') + TOLERANCE)
+            | Q(items_value__lt=F('order_value') - TOLERANCE)
+            | Q(items_discount__gt=Coalesce(
+                F('discount'), Value(Decimal('0.00'))) + TOLERANCE)
+            | Q(items_discount__lt=Coalesce(
+                F('discount'), Value(Decimal('0.00'))) - TOLERANCE)
+            | reduce(operator.or_, [
+                ~Q(**{f'counted_{field}': F(field)})
+                for field in status_counts])
+        )
+        drifted_ids = list(drifted.order_by('pk').values_list('pk',
+                                                              flat=True))
+
+        if not drifted_ids:
+            self.stdout.write(self.style.SUCCESS(
+                'All the order totals and status counts match their '
+                'items.'))
+            return
+
+        listed_ids = ', '.join(str(pk) for pk in drifted_ids[:50])
+        self.stdout.write(self.style.WARNING(
+            f"{len(drifted_ids)} orders have totals or status counts not "
+            f"matching their items: {listed_ids}"
+            f"{'...' if len(drifted_ids) > 50 else ''}"))
+        if options['fix']:
+            fixed = recalculate_order_totals(
+                Order.objects.filter(pk__in=drifted_ids))
+            self.stdout.write(self.style.SUCCESS(
+                f"Recalculated the totals and status counts of {fixed} "
+                f"orders."))
@@ -0,0 +1,44 @@
+# Generated by Django 5.1 on 2026-10-18 07:26
+
+from django.db import migrations, models
+from orders.normalizers import normalize_name, normalize_phone, normalize_email
+
+
+def backfill_identity_keys(apps, schema_editor):
+    """Set the normalized identity keys of the existing clients."""
+    Client = apps.get_model('orders', 'Client')
+    clients = list(Client.objects.all())
+    for client in clients:
+        client.name_key = normalize_name(client.client_name)
+        client.phone_key = normalize_phone(client.client_phone)
+        client.email_key = normalize_email(client.client_email)
+    Client.objects.bulk_update(clients,
+                               ['name_key', 'phone_key', 'email_key'],
+                               batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='email_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='name_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='phone_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=128),
+        ),
+        migrations.RunPython(backfill_identity_keys,
+                             reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-18 07:34
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_client_identity_keys'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='client',
+            options={'base_manager_name': 'objects'},
+        ),
+    ]
@@ -0,0 +1,94 @@
+from django.db import migrations
+
+
+# SQLite: an external content FTS5 index of the client identity keys with
+# prefix indexes for typeahead queries, kept in sync by triggers.
+# SQLite migrations that remake the clients table drop its triggers,
+# so such migrations must create them again.
+SQLITE_CREATE_INDEX = [
+    """
+    CREATE VIRTUAL TABLE orders_client_fts USING fts5(
+        name_key, email_key, phone_key,
+        content='orders_client', content_rowid='id', prefix='1 2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER orders_client_fts_insert AFTER INSERT ON orders_client
+    BEGIN
+        INSERT INTO orders_client_fts(rowid, name_key, email_key, phone_key)
+        VALUES (new.id, new.name_key, new.email_key, new.phone_key);
+    END
+    """,
+    """
+    CREATE TRIGGER orders_client_fts_delete AFTER DELETE ON orders_client
+    BEGIN
+        INSERT INTO orders_client_fts(orders_client_fts, rowid, name_key,
+                                      email_key, phone_key)
+        VALUES ('delete', old.id, old.name_key, old.email_key, old.phone_key);
+    END
+    """,
+    """
+    CREATE TRIGGER orders_client_fts_update AFTER UPDATE ON orders_client
+    BEGIN
+        INSERT INTO orders_client_fts(orders_client_fts, rowid, name_key,
+                                      email_key, phone_key)
+        VALUES ('delete', old.id, old.name_key, old.email_key, old.phone_key);
+        INSERT INTO orders_client_fts(rowid, name_key, email_key, phone_key)
+        VALUES (new.id, new.name_key, new.email_key, new.phone_key);
+    END
+    """,
+    # Index the existing clients
+    "INSERT INTO orders_client_fts(orders_client_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DROP_INDEX = [
+    "DROP TRIGGER IF EXISTS orders_client_fts_insert",
+    "DROP TRIGGER IF EXISTS orders_client_fts_delete",
+    "DROP TRIGGER IF EXISTS orders_client_fts_update",
+    "DROP TABLE IF EXISTS orders_client_fts",
+]
+
+# Postgres: trigram GIN indexes supporting the substring matches
+POSTGRES_CREATE_INDEX = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS orders_client_name_key_trgm "
+    "ON orders_client USING gin (name_key gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS orders_client_email_key_trgm "
+    "ON orders_client USING gin (email_key gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS orders_client_phone_key_trgm "
+    "ON orders_client USING gin (phone_key gin_trgm_ops)",
+]
+
+POSTGRES_DROP_INDEX = [
+    "DROP INDEX IF EXISTS orders_client_name_key_trgm",
+    "DROP INDEX IF EXISTS orders_client_email_key_trgm",
+    "DROP INDEX IF EXISTS orders_client_phone_key_trgm",
+]
+
+
+def run_statements(schema_editor, statements):
+    statements = statements.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    run_statements(schema_editor, {'sqlite': SQLITE_CREATE_INDEX,
+                                   'postgresql': POSTGRES_CREATE_INDEX})
+
+
+def drop_search_index(apps, schema_editor):
+    run_statements(schema_editor, {'sqlite': SQLITE_DROP_INDEX,
+                                   'postgresql': POSTGRES_DROP_INDEX})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_client_base_manager'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index,
+                             reverse_code=drop_search_index),
+    ]
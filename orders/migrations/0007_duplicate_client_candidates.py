@@ -0,0 +1,29 @@
+# Generated by Django 5.1 on 2026-10-18 07:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_client_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DuplicateClientCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('status', models.IntegerField(choices=[(1, 'Pending'), (2, 'Dismissed')], default=1)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='orders.client')),
+                ('duplicate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='orders.client')),
+            ],
+            options={
+                'ordering': ['-score'],
+                'constraints': [models.UniqueConstraint(fields=('client', 'duplicate'), name='unique_duplicate_client_pair'), models.CheckConstraint(condition=models.Q(('client__lt', models.F('duplicate'))), name='duplicate_client_pair_order')],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.1 on 2026-10-18 08:01
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+STATUS_COUNT_FIELDS = {1: 'items_not_started',
+                       2: 'items_in_progress',
+                       3: 'items_made',
+                       4: 'items_delivered'}
+
+
+def count_item_statuses(apps, schema_editor):
+    """
+    Set the item status counts of the existing orders from their items,
+    with a single UPDATE.
+    """
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    items = OrderItem.objects.filter(
+        order=OuterRef('pk')).order_by().values('order')
+    Order.objects.update(**{
+        field: Coalesce(Subquery(
+            items.filter(item_status=status).annotate(
+                total=Count('pk')).values('total')),
+            Value(0))
+        for status, field in STATUS_COUNT_FIELDS.items()
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_duplicate_client_candidates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='items_delivered',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='items_in_progress',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='items_made',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='items_not_started',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_item_statuses,
+                             reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 08:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_order_item_status_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 5.1 on 2026-10-18 08:25
+
+import hashlib
+import json
+from collections import defaultdict
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+
+
+def intern_configurations(apps, schema_editor):
+    """
+    Set the interned configurations of the existing order items from their
+    product, option values, product finish and component finishes, with
+    bulk queries.
+    """
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    Configuration = apps.get_model('orders', 'Configuration')
+    ComponentFinish = apps.get_model('orders', 'ComponentFinish')
+    Product = apps.get_model('products', 'Product')
+    OptionValue = apps.get_model('products', 'OptionValue')
+    FinishOption = apps.get_model('products', 'FinishOption')
+
+    items = list(OrderItem.objects.values_list(
+        'id', 'product_id', 'product_finish_id'))
+    option_value_ids = defaultdict(set)
+    for item_id, option_value_id in (
+            OrderItem.option_values.through.objects.values_list(
+                'orderitem_id', 'optionvalue_id')):
+        option_value_ids[item_id].add(option_value_id)
+    finishes = defaultdict(set)
+    for item_id, component_id, finish_option_id in (
+            ComponentFinish.objects.values_list(
+                'order_item_id', 'component_id', 'finish_option_id')):
+        finishes[item_id].add((component_id, finish_option_id))
+
+    product_names = dict(Product.objects.values_list('id', 'name'))
+    values = dict(OptionValue.objects.values_list('id', 'value'))
+    finish_names = dict(FinishOption.objects.values_list('id', 'name'))
+    configurations = {}
+    item_keys = {}
+    for item_id, product_id, product_finish_id in items:
+        key = hashlib.sha256(json.dumps([
+            product_id, sorted(option_value_ids[item_id]),
+            product_finish_id, sorted(finishes[item_id])]).encode()
+        ).hexdigest()
+        item_keys[item_id] = key
+        if key in configurations:
+            continue
+        finish_labels = sorted(finish_names[finish_option_id]
+                               for _, finish_option_id in finishes[item_id])
+        if product_finish_id:
+            finish_labels.insert(0, finish_names[product_finish_id])
+        option_values_str = ', '.join(sorted(
+            values[value_id] for value_id in option_value_ids[item_id]))
+        finishes_str = ', '.join(finish_labels)
+        configurations[key] = Configuration(
+            key=key, product_id=product_id,
+            label=(f"{product_names[product_id]}"
+                   + (f" | {option_values_str}" if option_values_str else "")
+                   + (f" | {finishes_str}" if finishes_str else "")))
+    Configuration.objects.bulk_create(configurations.values(),
+                                      batch_size=500)
+
+    configuration_ids = dict(Configuration.objects.values_list('key', 'id'))
+    item_ids = list(item_keys)
+    for start in range(0, len(item_ids), 500):
+        batch = item_ids[start:start + 500]
+        OrderItem.objects.filter(pk__in=batch).update(
+            configuration_id=Case(*[
+                When(pk=item_id,
+                     then=Value(configuration_ids[item_keys[item_id]]))
+                for item_id in batch]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_order_item_version'),
+        ('products', '0010_cost_rollup'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='orderitem',
+            options={'base_manager_name': 'objects'},
+        ),
+        migrations.CreateModel(
+            name='Configuration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('label', models.TextField()),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='configurations', to='products.product')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='configuration',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='orders.configuration'),
+        ),
+        migrations.RunPython(intern_configurations,
+                             reverse_code=migrations.RunPython.noop),
+    ]
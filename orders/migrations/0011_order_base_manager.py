@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-18 08:36
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_order_item_configuration'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='order',
+            options={'base_manager_name': 'objects', 'ordering': ['-created_on']},
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1 on 2026-10-18 08:39
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def build_daily_rollups(apps, schema_editor):
+    """
+    Create the daily rollups of the existing order items with a single
+    aggregate query.
+    """
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    ProductDailyRollup = apps.get_model('orders', 'ProductDailyRollup')
+    ProductDailyRollup.objects.bulk_create([
+        ProductDailyRollup(date=row['date'], product_id=row['product_id'],
+                           item_status=row['item_status'], paid=row['paid'],
+                           item_count=row['count'], revenue=row['revenue'])
+        for row in OrderItem.objects.values(
+            'product_id', 'item_status', date=TruncDate('order__created_on'),
+            paid=F('order__paid')).annotate(
+            count=Count('id'), revenue=Sum('item_value')).order_by()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_order_base_manager'),
+        ('products', '0010_cost_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('item_status', models.IntegerField()),
+                ('paid', models.IntegerField()),
+                ('item_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='products.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'product', 'item_status', 'paid'), name='unique_product_daily_rollup')],
+            },
+        ),
+        migrations.RunPython(build_daily_rollups,
+                             reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.1 on 2026-10-18 09:09
+
+from collections import defaultdict
+from django.db import migrations, models
+
+
+def set_configuration_specs(apps, schema_editor):
+    """
+    Set the specs of the existing configurations from the product, option
+    values, product finish and component finishes of one of their items,
+    and rebuild their labels from the current names. The configurations
+    without items, whose specs are unknown, are deleted, and interned
+    again when used.
+    """
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    Configuration = apps.get_model('orders', 'Configuration')
+    ComponentFinish = apps.get_model('orders', 'ComponentFinish')
+    Product = apps.get_model('products', 'Product')
+    OptionValue = apps.get_model('products', 'OptionValue')
+    FinishOption = apps.get_model('products', 'FinishOption')
+
+    Configuration.objects.filter(order_items__isnull=True).delete()
+    items = {}
+    for item_id, configuration_id, product_id, product_finish_id in (
+            OrderItem.objects.filter(configuration__isnull=False)
+            .order_by('id').values_list('id', 'configuration_id',
+                                        'product_id', 'product_finish_id')):
+        items.setdefault(configuration_id,
+                         (item_id, product_id, product_finish_id))
+    item_ids = [item_id for item_id, _, _ in items.values()]
+    option_value_ids = defaultdict(set)
+    for item_id, option_value_id in (
+            OrderItem.option_values.through.objects.filter(
+                orderitem_id__in=item_ids).values_list(
+                'orderitem_id', 'optionvalue_id')):
+        option_value_ids[item_id].add(option_value_id)
+    finishes = defaultdict(set)
+    for item_id, component_id, finish_option_id in (
+            ComponentFinish.objects.filter(
+                order_item_id__in=item_ids).values_list(
+                'order_item_id', 'component_id', 'finish_option_id')):
+        finishes[item_id].add((component_id, finish_option_id))
+
+    product_names = dict(Product.objects.values_list('id', 'name'))
+    values = dict(OptionValue.objects.values_list('id', 'value'))
+    finish_names = dict(FinishOption.objects.values_list('id', 'name'))
+    configurations = []
+    for configuration in Configuration.objects.filter(pk__in=items):
+        item_id, product_id, product_finish_id = items[configuration.pk]
+        configuration.spec = [
+            product_id, sorted(option_value_ids[item_id]), product_finish_id,
+            [list(finish) for finish in sorted(finishes[item_id])]]
+        finish_labels = sorted(finish_names[finish_option_id]
+                               for _, finish_option_id in finishes[item_id])
+        if product_finish_id:
+            finish_labels.insert(0, finish_names[product_finish_id])
+        option_values_str = ', '.join(sorted(
+            values[value_id] for value_id in option_value_ids[item_id]))
+        finishes_str = ', '.join(finish_labels)
+        configuration.label = (
+            f"{product_names[product_id]}"
+            + (f" | {option_values_str}" if option_values_str else "")
+            + (f" | {finishes_str}" if finishes_str else ""))
+        configurations.append(configuration)
+    Configuration.objects.bulk_update(configurations, ['spec', 'label'],
+                                      batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_product_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='configuration',
+            name='spec',
+            field=models.JSONField(default=list, editable=False),
+        ),
+        migrations.RunPython(set_configuration_specs,
+                             reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-18 09:14
+
+from django.db import migrations, models
+
+
+def create_chart_data_version(apps, schema_editor):
+    """Create the single row of the chart data version counter."""
+    ChartDataVersion = apps.get_model('orders', 'ChartDataVersion')
+    ChartDataVersion.objects.create(pk=1, version=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_configuration_spec'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChartDataVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_chart_data_version,
+                             reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.1 on 2026-10-18 10:02
+
+from importlib import import_module
+from django.db import migrations, models
+
+search_index = import_module('orders.migrations.0006_client_search_index')
+
+
+def queue_duplicate_clients(apps, schema_editor):
+    """
+    Queue the existing clients with the same normalized email and phone as
+    an older client as duplicate client candidates, to be reviewed in the
+    admin, as the identity constraint can't be added while they exist. No
+    client is merged or deleted here.
+    """
+    Client = apps.get_model('orders', 'Client')
+    DuplicateClientCandidate = apps.get_model('orders',
+                                              'DuplicateClientCandidate')
+    duplicates = (Client.objects.values('email_key', 'phone_key')
+                  .annotate(client_id=models.Min('id'),
+                            count=models.Count('id'))
+                  .filter(count__gt=1))
+    candidates = []
+    for duplicate in duplicates:
+        candidates.extend(
+            DuplicateClientCandidate(client_id=duplicate['client_id'],
+                                     duplicate_id=duplicate_id, score=1.0)
+            for duplicate_id in Client.objects.filter(
+                email_key=duplicate['email_key'],
+                phone_key=duplicate['phone_key']
+            ).exclude(id=duplicate['client_id']).values_list('id', flat=True))
+    if not candidates:
+        return
+    DuplicateClientCandidate.objects.bulk_create(candidates,
+                                                 ignore_conflicts=True)
+    raise RuntimeError(
+        f"{len(candidates)} clients have the same email and phone as an "
+        f"older client. They are queued as duplicate client candidates: "
+        f"merge them, or change their email or phone, in the admin and "
+        f"run migrate again.")
+
+
+def rebuild_search_index(apps, schema_editor):
+    """
+    Create the SQLite search index triggers again, dropped with the
+    clients table remade to add or remove the constraint.
+    """
+    search_index.drop_search_index(apps, schema_editor)
+    search_index.create_search_index(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+    # Keep the queued candidates if the migration stops on duplicates
+    atomic = False
+
+    dependencies = [
+        ('orders', '0014_chart_data_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(queue_duplicate_clients,
+                             reverse_code=rebuild_search_index),
+        migrations.AddConstraint(
+            model_name='client',
+            constraint=models.UniqueConstraint(fields=('email_key', 'phone_key'), name='unique_client_identity'),
+        ),
+        migrations.RunPython(rebuild_search_index,
+                             reverse_code=migrations.RunPython.noop),
+    ]
@@ -1,9 +1,84 @@
+import hashlib
+import json
+import operator
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
 from decimal import Decimal
+from functools import reduce
 from django.db import models
-from django.db.models import Case, When, Value, BooleanField
+from django.db.models import (Case, When, Value, BooleanField, F, Q, Sum,
+                              Count, OuterRef, Subquery)
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from django.db.models.lookups import Exact
+from django.db.models.signals import (post_save, pre_save, pre_delete,
+                                      post_delete)
+from django.dispatch import receiver
 from phonenumber_field.modelfields import PhoneNumberField
 from django.core.validators import MinValueValidator
 from products.models import Product, OptionValue, FinishOption, Component
+from .normalizers import normalize_name, normalize_phone, normalize_email
+from .caches import invalidate_client_search
+from slotted_need.caches import bump_data_version
+from slotted_need.tracking import TrackedFieldsMixin, VersionedMixin
+
+
+class ChartDataVersion(models.Model):
+    """
+    The single row counter of the writes of the chart data, shared by all
+    the worker processes to expire their cached charts, see
+    slotted_need.caches.
+    """
+    version = models.BigIntegerField(default=0)
+
+
+# The identity keys of the client fields, with their normalizers
+CLIENT_IDENTITY_KEYS = {'client_name': ('name_key', normalize_name),
+                        'client_phone': ('phone_key', normalize_phone),
+                        'client_email': ('email_key', normalize_email)}
+
+
+class ClientQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # Bulk inserts bypass Client.save, so set the identity keys here
+        objs = list(objs)
+        for obj in objs:
+            obj.set_identity_keys()
+        created = super().bulk_create(objs, *args, **kwargs)
+        invalidate_client_search()
+        bump_data_version()
+        return created
+
+    def update(self, **kwargs):
+        # Queryset updates bypass Client.save, so update the identity keys
+        # of the changed client fields in the same UPDATE, or recompute
+        # them from the updated rows for the fields set to expressions
+        recompute = False
+        for field in CLIENT_IDENTITY_KEYS.keys() & set(kwargs):
+            key_field, normalize = CLIENT_IDENTITY_KEYS[field]
+            if hasattr(kwargs[field], 'resolve_expression'):
+                recompute = True
+            else:
+                kwargs[key_field] = normalize(kwargs[field])
+        if recompute:
+            client_ids = list(self.values_list('pk', flat=True))
+        rows = super().update(**kwargs)
+        if recompute:
+            clients = list(Client.objects.filter(pk__in=client_ids))
+            for client in clients:
+                client.set_identity_keys()
+            Client.objects.bulk_update(
+                clients, ['name_key', 'phone_key', 'email_key'])
+        invalidate_client_search()
+        bump_data_version()
+        return rows
+
+    def delete(self):
+        deleted = super().delete()
+        invalidate_client_search()
+        bump_data_version()
+        return deleted
 
 
 class Client(models.Model):
@@ -11,12 +86,112 @@ class Client(models.Model):
     client_phone = PhoneNumberField(blank=True)
     client_email = models.EmailField()
     created_on = models.DateField(auto_now_add=True)
+    # Indexed normalized identity keys used to match clients,
+    # maintained on save
+    name_key = models.CharField(max_length=100, blank=True, db_index=True,
+                                editable=False)
+    phone_key = models.CharField(max_length=128, blank=True, db_index=True,
+                                 editable=False)
+    email_key = models.CharField(max_length=254, blank=True, db_index=True,
+                                 editable=False)
+
+    objects = ClientQuerySet.as_manager()
+
+    class Meta:
+        base_manager_name = 'objects'
+        constraints = [
+            # A client is identified by its normalized email and phone
+            models.UniqueConstraint(fields=['email_key', 'phone_key'],
+                                    name='unique_client_identity'),
+        ]
 
     def __str__(self):
         return f"{self.client_name}"
 
+    def set_identity_keys(self):
+        """Set the normalized identity keys from the client details."""
+        self.name_key = normalize_name(self.client_name)
+        self.phone_key = normalize_phone(self.client_phone)
+        self.email_key = normalize_email(self.client_email)
+
+    def save(self, *args, **kwargs):
+        # The identity keys are set by set_client_identity_keys, also on
+        # raw saves, e.g. by loaddata. Include them when saving specific
+        # fields
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'name_key',
+                                       'phone_key', 'email_key'}
+        super().save(*args, **kwargs)
+        invalidate_client_search()
+        bump_data_version()
+
+    def delete(self, *args, **kwargs):
+        deleted = super().delete(*args, **kwargs)
+        invalidate_client_search()
+        bump_data_version()
+        return deleted
+
+
+class DuplicateClientCandidate(models.Model):
+    """
+    A pair of likely duplicate clients found by the find_duplicate_clients
+    command, to be reviewed and merged into the oldest client.
+    """
+    client = models.ForeignKey(Client, related_name='+',
+                               on_delete=models.CASCADE)
+    duplicate = models.ForeignKey(Client, related_name='+',
+                                  on_delete=models.CASCADE)
+    # Similarity of the two clients, from 0 to 1
+    score = models.FloatField()
+    STATUS_CHOICES = {1: 'Pending',
+                      2: 'Dismissed'}
+    status = models.IntegerField(choices=STATUS_CHOICES, default=1)
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-score']
+        constraints = [
+            # A pair is stored once, with the oldest client first
+            models.UniqueConstraint(fields=['client', 'duplicate'],
+                                    name='unique_duplicate_client_pair'),
+            models.CheckConstraint(
+                condition=models.Q(client__lt=models.F('duplicate')),
+                name='duplicate_client_pair_order'),
+        ]
+
+    def __str__(self):
+        return f"{self.client} / {self.duplicate} ({self.score:.2f})"
+
+
+class OrderQuerySet(models.QuerySet):
+    # Bulk writes bypass Order.save and delete, so expire the cached
+    # charts and reconcile the daily rollups of the orders here
+    def bulk_create(self, objs, *args, **kwargs):
+        created = super().bulk_create(objs, *args, **kwargs)
+        bump_data_version()
+        return created
+
+    def update(self, **kwargs):
+        if not {'paid', 'created_on'} & set(kwargs):
+            rows = super().update(**kwargs)
+        else:
+            order_ids = list(self.values_list('pk', flat=True))
+            dates = rollup_dates(order_ids)
+            rows = super().update(**kwargs)
+            reconcile_daily_rollups(dates | rollup_dates(order_ids))
+        bump_data_version()
+        return rows
 
-class Order(models.Model):
+    def delete(self):
+        dates = rollup_dates(self.values('pk'))
+        deleted = super().delete()
+        reconcile_daily_rollups(dates)
+        bump_data_version()
+        return deleted
+
+
+class Order(TrackedFieldsMixin, models.Model):
     client = models.ForeignKey(Client, related_name='orders',
                                on_delete=models.SET_NULL,
                                blank=True, null=True)
@@ -38,6 +213,18 @@ class Order(models.Model):
         default=1,
         editable=False,  # Prevents editing in forms and admin
     )
+    # Number of items in each status, maintained on every item change
+    # to derive the order status without fetching the items
+    items_not_started = models.PositiveIntegerField(default=0,
+                                                    editable=False)
+    items_in_progress = models.PositiveIntegerField(default=0,
+                                                    editable=False)
+    items_made = models.PositiveIntegerField(default=0, editable=False)
+    items_delivered = models.PositiveIntegerField(default=0, editable=False)
+    STATUS_COUNT_FIELDS = {1: 'items_not_started',
+                           2: 'items_in_progress',
+                           3: 'items_made',
+                           4: 'items_delivered'}
     # create a PAID status mapping to use as choices for order_status
     PAID_CHOICES = {1: 'Not Paid',
                     2: 'Fully Paid'}
@@ -48,69 +235,125 @@ class Order(models.Model):
     created_on = models.DateTimeField(auto_now_add=True)
     updated_on = models.DateTimeField(auto_now=True)
     archived = models.BooleanField(default=False)
+    # Key of the imported order, used to avoid importing the same order twice
+    idempotency_key = models.CharField(max_length=100, unique=True,
+                                       blank=True, null=True, editable=False)
+
+    @staticmethod
+    def items_totals():
+        """
+        Return the SQL aggregates of the order value and discount of the
+        items of the outer order, for annotations and updates.
+        """
+        items = OrderItem.objects.filter(
+            order=OuterRef('pk')).order_by().values('order')
+        zero = Value(Decimal('0.00'))
+        return {
+            'order_value': Coalesce(Subquery(
+                items.annotate(total=Sum('item_value')).values('total')),
+                zero),
+            'discount': Coalesce(Subquery(
+                items.annotate(total=Sum('discount')).values('total')),
+                zero),
+        }
 
-    def calculate_totals(self):
-        """Calculate the total discount and order value based
-        on order items."""
-        # Ensure there are items before trying to calculate totals
-        items = self.items.all()
-        if items.exists():  # Only calculate if there are items
-            self.discount = sum(item.discount for item in items
-                                if item.discount)
-            self.order_value = sum(item.item_value for item in items
-                                   if item.item_value)
-
-    def update_order_status(self):
-        """Automatically derive the order status based on conditions
-        set on the child items' item_status fields."""
-        # Get all item statuses
-        item_statuses = self.items.values_list('item_status', flat=True)
-
-        # If no items exist set to not started
-        if not item_statuses:
-            new_status = 1
-        # Check for 'Not Started'
-        elif all(status == 1 for status in item_statuses):
-            new_status = 1
-        # Check for 'Delivered'
-        elif all(status == 4 for status in item_statuses):
-            new_status = 4
-        # Check for 'Made'
-        elif all(status == 3 for status in item_statuses):
-            new_status = 3
-        # Check for 'In Progress'
-        elif any(status == 2 for status in item_statuses):
-            new_status = 2
+    @staticmethod
+    def items_status_counts():
+        """
+        Return the SQL counts of the items of the outer order in each
+        status, by count field, for annotations and updates.
+        """
+        items = OrderItem.objects.filter(
+            order=OuterRef('pk')).order_by().values('order')
+        return {
+            field: Coalesce(Subquery(
+                items.filter(item_status=status).annotate(
+                    total=Count('pk')).values('total')),
+                0)
+            for status, field in Order.STATUS_COUNT_FIELDS.items()
+        }
+
+    @staticmethod
+    def status_from_counts(counts):
+        """
+        Derive the order status from the number of its items in each
+        status, in constant time.
+        """
+        total = sum(counts.values())
+        # Not started, also if no items exist
+        if counts.get(1, 0) == total:
+            return 1
+        # Delivered
+        elif counts.get(4, 0) == total:
+            return 4
+        # Made
+        elif counts.get(3, 0) == total:
+            return 3
         else:
             # Default to 'In Progress' if any other combination
-            new_status = 2
+            return 2
+
+    @staticmethod
+    def status_expression(counts):
+        """
+        Return the SQL expression of status_from_counts for the given
+        count expressions by status, to update the status together with
+        the counts.
+        """
+        def others_empty(status):
+            return Exact(reduce(operator.add, [
+                count for other, count in counts.items()
+                if other != status]), 0)
+
+        return Case(
+            When(others_empty(1), then=Value(1)),
+            When(others_empty(4), then=Value(4)),
+            When(others_empty(3), then=Value(3)),
+            default=Value(2),
+            output_field=models.IntegerField(),
+        )
 
-        # Update the order_status if it has changed
-        if self.order_status != new_status:
-            self.order_status = new_status
-            # Save the order without triggering update_order_status again
-            super(Order, self).save(update_fields=['order_status'])
+    @staticmethod
+    def derive_order_status(item_statuses):
+        """Derive the order status from the statuses of its items."""
+        return Order.status_from_counts(Counter(item_statuses))
+
+    def status_counts(self):
+        """Return the number of items of the order in each status."""
+        return {status: getattr(self, field)
+                for status, field in self.STATUS_COUNT_FIELDS.items()}
+
+    def refresh_derived_fields(self):
+        """
+        Reload the fields derived from the items, which item changes
+        update in the database only.
+        """
+        self.refresh_from_db(fields=['order_value', 'discount',
+                                     'order_status',
+                                     *self.STATUS_COUNT_FIELDS.values()])
+
+    objects = OrderQuerySet.as_manager()
 
     class Meta:
+        base_manager_name = 'objects'
         ordering = ["-created_on"]
 
     def save(self, *args, **kwargs):
-        # Only execute custom methods after the object has been saved
-        # and has a primary key
-        if self.pk:
-            # calculate order totals
-            self.calculate_totals()
-            # Check if 'paid' status has changed
-            old_paid = Order.objects.get(pk=self.pk).paid
-        else:
-            old_paid = None
+        # Check if 'paid' status has changed, using the values tracked
+        # since the order was loaded, and assume it did if not loaded
+        changed_fields = self.changed_fields()
+        paid_changed = (not self._state.adding
+                        and (changed_fields is None
+                             or 'paid' in changed_fields))
 
-        # save Order object
+        saved_paid = self.__dict__.get('_field_snapshot', {}).get('paid')
+
+        # save the changed fields of the Order object
         super().save(*args, **kwargs)
 
         # If 'paid' status has changed, update related OrderItems
         # by evaluating if it meets the conditions to update 'completed' field
-        if old_paid != self.paid:
+        if paid_changed:
             self.items.all().update(
                 completed=Case(
                     When(item_status=4, then=Value(self.paid == 2)),
@@ -118,13 +361,597 @@ class Order(models.Model):
                     output_field=BooleanField(),
                 )
             )
+            # Move the items to the daily rollups of the new paid status
+            if changed_fields is None:
+                reconcile_daily_rollups(rollup_dates([self.pk]))
+            else:
+                apply_rollup_deltas(order_rollup_deltas(
+                    [self.pk], 1, moved_from_paid=saved_paid))
+        bump_data_version()
+
+    def delete(self, *args, **kwargs):
+        # Subtract the items, deleted with the order, from the rollups
+        deltas = order_rollup_deltas([self.pk], -1)
+        deleted = super().delete(*args, **kwargs)
+        apply_rollup_deltas(deltas)
+        bump_data_version()
+        return deleted
 
     def __str__(self):
         return (f"Order #{self.id} by {self.client.client_name} "
                 f"- Order value: €{self.order_value}")
 
 
-class OrderItem(models.Model):
+# Thread-local state of the active batch of deferred order updates
+_deferred_orders = threading.local()
+
+
+@contextmanager
+def defer_order_updates():
+    """
+    Defers the updates of the parent order's totals, item status counts
+    and status, and of the daily rollups, that run on every OrderItem save
+    and delete. The touched orders and rollups and their deltas are
+    collected and, on exit, applied once per order and rollup. Nested
+    batches are merged into the outermost one, and nothing is applied if
+    the batch exits with an error, e.g.:
+
+        with transaction.atomic(), defer_order_updates():
+            for item in items:
+                item.save()
+    """
+    # Merge a nested batch into the active one
+    if getattr(_deferred_orders, 'orders', None) is not None:
+        yield
+        return
+
+    _deferred_orders.orders = {}
+    _deferred_orders.rollups = {}
+    try:
+        yield
+        deferred = _deferred_orders.orders
+        deferred_rollups = _deferred_orders.rollups
+    finally:
+        _deferred_orders.orders = None
+        _deferred_orders.rollups = None
+
+    # Apply the derived fields once for each touched order
+    recalculate_order_ids = []
+    for order_id, (value_delta, discount_delta, status_deltas,
+                   recalculate) in deferred.items():
+        if recalculate:
+            recalculate_order_ids.append(order_id)
+        else:
+            apply_order_delta(order_id, value_delta, discount_delta,
+                              status_deltas)
+    if recalculate_order_ids:
+        recalculate_order_totals(
+            Order.objects.filter(pk__in=recalculate_order_ids))
+    apply_rollup_deltas(deferred_rollups)
+
+
+def defer_order_update(order_id, value_delta=0, discount_delta=0,
+                       status_deltas=None, recalculate=False):
+    """
+    Records the order as touched, adding the deltas to its totals and
+    item status counts or marking them for recalculation, if a batch of
+    deferred order updates is active, returning whether the update was
+    deferred.
+    """
+    deferred = getattr(_deferred_orders, 'orders', None)
+    if deferred is None:
+        return False
+    totals = deferred.setdefault(order_id, [0, 0, Counter(), False])
+    totals[0] += value_delta
+    totals[1] += discount_delta
+    totals[2].update(status_deltas or {})
+    totals[3] = totals[3] or recalculate
+    return True
+
+
+def apply_order_delta(order_id, value_delta=0, discount_delta=0,
+                      status_deltas=None):
+    """
+    Adds the deltas to the order value, discount and item status counts
+    of the order, deriving its status from the new counts, in a single
+    atomic UPDATE, or to the active batch of deferred updates. Recalculates
+    the order from its items instead if its counts drifted below the
+    deltas.
+    """
+    status_deltas = {status: delta
+                     for status, delta in (status_deltas or {}).items()
+                     if delta}
+    if not (value_delta or discount_delta or status_deltas):
+        return
+    if defer_order_update(order_id, value_delta, discount_delta,
+                          status_deltas):
+        return
+
+    updates = {}
+    if value_delta:
+        updates['order_value'] = F('order_value') + value_delta
+    if discount_delta:
+        updates['discount'] = (Coalesce(F('discount'),
+                                        Value(Decimal('0.00')))
+                               + discount_delta)
+    if status_deltas:
+        # The status is derived from the incremented counts in the same
+        # UPDATE, so concurrent item changes can't leave it stale
+        counts = {status: F(field) + status_deltas.get(status, 0)
+                  for status, field in Order.STATUS_COUNT_FIELDS.items()}
+        for status in status_deltas:
+            updates[Order.STATUS_COUNT_FIELDS[status]] = counts[status]
+        updates['order_status'] = Order.status_expression(counts)
+    # Only update the order if no count would become negative, which the
+    # counts drifted from the items, e.g. loaded by a fixture, can
+    if not Order.objects.filter(pk=order_id, **{
+            f'{Order.STATUS_COUNT_FIELDS[status]}__gte': -delta
+            for status, delta in status_deltas.items() if delta < 0
+    }).update(**updates):
+        recalculate_order_totals(Order.objects.filter(pk=order_id))
+
+
+def recalculate_order_ids(order_ids):
+    """
+    Recalculate the totals, item status counts and status of the orders
+    with the given ids, or mark them for recalculation in the active batch
+    of deferred updates.
+    """
+    order_ids = [order_id for order_id in order_ids
+                 if not defer_order_update(order_id, recalculate=True)]
+    if order_ids:
+        recalculate_order_totals(Order.objects.filter(pk__in=order_ids))
+
+
+def recalculate_order_totals(orders):
+    """
+    Recalculate the totals, item status counts and status of the given
+    orders queryset from their items with SQL aggregates.
+    """
+    updated = orders.update(**Order.items_totals(),
+                            **Order.items_status_counts())
+    orders.update(order_status=Order.status_expression({
+        status: F(field)
+        for status, field in Order.STATUS_COUNT_FIELDS.items()}))
+    return updated
+
+
+class ProductDailyRollup(models.Model):
+    """
+    Number and value of the order items by the creation date of their
+    order, product, item status and paid status of their order, maintained
+    incrementally on the order and order item writes, for the date range
+    queries of the charts.
+    """
+    date = models.DateField()
+    product = models.ForeignKey(Product, related_name='daily_rollups',
+                                on_delete=models.CASCADE)
+    item_status = models.IntegerField()
+    paid = models.IntegerField()
+    item_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2,
+                                  default=Decimal('0.00'))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'product', 'item_status', 'paid'],
+                name='unique_product_daily_rollup'),
+        ]
+
+    def __str__(self):
+        return (f"{self.date} {self.product_id} status {self.item_status} "
+                f"paid {self.paid}: {self.item_count}")
+
+
+def rollup_key(created_on, product_id, item_status, paid):
+    """Return the daily rollup key of an item of an order."""
+    return (timezone.localdate(created_on), product_id, item_status, paid)
+
+
+def add_rollup_deltas(deltas, other):
+    """Add the other rollup deltas to the deltas, by rollup key."""
+    for key, (count, revenue) in other.items():
+        totals = deltas.get(key, (0, 0))
+        deltas[key] = (totals[0] + count, totals[1] + revenue)
+    return deltas
+
+
+def order_rollup_deltas(order_ids, sign, moved_from_paid=None):
+    """
+    Return the rollup deltas adding (or subtracting, for a negative sign)
+    the items of the given orders, and subtracting them from the rollups
+    of the given previous paid status of the orders, if any.
+    """
+    deltas = {}
+    for row in OrderItem.objects.filter(order__in=order_ids).values(
+            'order__created_on', 'order__paid', 'product_id',
+            'item_status').annotate(
+            count=Count('id'), revenue=Sum('item_value')).order_by():
+        add_rollup_deltas(deltas, {rollup_key(
+            row['order__created_on'], row['product_id'], row['item_status'],
+            row['order__paid']): (sign * row['count'],
+                                  sign * row['revenue'])})
+        if moved_from_paid is not None:
+            add_rollup_deltas(deltas, {rollup_key(
+                row['order__created_on'], row['product_id'],
+                row['item_status'], moved_from_paid): (
+                -sign * row['count'], -sign * row['revenue'])})
+    return deltas
+
+
+# The most rollups updated by one query, bounding the depth of its WHERE
+# clause, which SQLite limits to 1000
+ROLLUP_BATCH_SIZE = 200
+
+
+def apply_rollup_deltas(deltas):
+    """
+    Adds the deltas of the item count and revenue to the daily rollups,
+    by rollup key, creating the missing rollups, with two queries per
+    batch of ROLLUP_BATCH_SIZE rollups, or to the active batch of deferred
+    updates.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    deferred = getattr(_deferred_orders, 'rollups', None)
+    if deferred is not None:
+        add_rollup_deltas(deferred, deltas)
+        return
+    if not deltas:
+        return
+
+    def rollup(key):
+        date, product_id, item_status, paid = key
+        return Q(date=date, product_id=product_id, item_status=item_status,
+                 paid=paid)
+
+    # Create the missing rollups empty, ignoring the existing ones, and
+    # add the deltas to all of them with an UPDATE per batch, so
+    # concurrent writes of the same rollups can't lose any delta
+    ProductDailyRollup.objects.bulk_create([
+        ProductDailyRollup(date=date, product_id=product_id,
+                           item_status=item_status, paid=paid)
+        for date, product_id, item_status, paid in deltas
+    ], ignore_conflicts=True)
+    keys = list(deltas)
+    for start in range(0, len(keys), ROLLUP_BATCH_SIZE):
+        batch = {key: deltas[key]
+                 for key in keys[start:start + ROLLUP_BATCH_SIZE]}
+        ProductDailyRollup.objects.filter(
+            reduce(operator.or_, map(rollup, batch))).update(
+            item_count=F('item_count') + Case(
+                *[When(rollup(key), then=Value(count))
+                  for key, (count, _) in batch.items()],
+                default=Value(0)),
+            revenue=F('revenue') + Case(
+                *[When(rollup(key), then=Value(Decimal(revenue)))
+                  for key, (_, revenue) in batch.items()],
+                default=Value(Decimal('0.00')),
+                output_field=models.DecimalField(max_digits=12,
+                                                 decimal_places=2)))
+
+
+def rollup_dates(order_ids):
+    """Return the rollup dates of the given orders."""
+    return set(Order.objects.filter(pk__in=order_ids).annotate(
+        date=TruncDate('created_on')).values_list('date', flat=True))
+
+
+def reconcile_daily_rollups(dates=None):
+    """
+    Recalculate the daily rollups of the given dates, or all of them,
+    from the order items with SQL aggregates, and correct the drifted
+    ones with bulk queries. Returns the number of corrected rollups.
+    """
+    items = OrderItem.objects.all()
+    rollups = ProductDailyRollup.objects.all()
+    if dates is not None:
+        if not dates:
+            return 0
+        items = items.filter(order__created_on__date__in=dates)
+        rollups = rollups.filter(date__in=dates)
+
+    expected = {
+        (row['date'], row['product_id'], row['item_status'], row['paid']):
+            (row['count'], row['revenue'].quantize(Decimal('0.01')))
+        for row in items.values(
+            'product_id', 'item_status', date=TruncDate('order__created_on'),
+            paid=F('order__paid')).annotate(
+            count=Count('id'), revenue=Sum('item_value')).order_by()
+    }
+    drifted = []
+    missing = dict(expected)
+    empty = []
+    for rollup in rollups:
+        key = (rollup.date, rollup.product_id, rollup.item_status,
+               rollup.paid)
+        count, revenue = missing.pop(key, (0, Decimal('0.00')))
+        if not count:
+            # Remove the rollups left without items
+            empty.append(rollup.pk)
+            if rollup.item_count or rollup.revenue:
+                drifted.append(rollup)
+        elif (rollup.item_count, rollup.revenue) != (count, revenue):
+            rollup.item_count, rollup.revenue = count, revenue
+            drifted.append(rollup)
+
+    ProductDailyRollup.objects.filter(pk__in=empty).delete()
+    ProductDailyRollup.objects.bulk_update(
+        [rollup for rollup in drifted if rollup.pk not in empty],
+        ['item_count', 'revenue'])
+    ProductDailyRollup.objects.bulk_create([
+        ProductDailyRollup(date=date, product_id=product_id,
+                           item_status=item_status, paid=paid,
+                           item_count=count, revenue=revenue)
+        for (date, product_id, item_status, paid), (count, revenue)
+        in missing.items()])
+    return len(drifted) + len(missing)
+
+
+class ConfigurationQuerySet(models.QuerySet):
+    def intern(self, specs):
+        """
+        Get or create the configurations of the given (product_id,
+        option_value_ids, product_finish_id, component_finishes) specs, where
+        component_finishes are (component_id, finish_option_id) pairs, with
+        bulk queries. Returns the configuration ids, in the order of the
+        specs.
+        """
+        keys = [Configuration.canonical_key(*spec) for spec in specs]
+        ids = dict(self.filter(key__in=set(keys)).values_list('key', 'id'))
+        missing = {key: spec for key, spec in zip(keys, specs)
+                   if key not in ids}
+        if missing:
+            labels = Configuration.build_labels(list(missing.values()))
+            # Ignore the configurations created concurrently
+            self.bulk_create([
+                Configuration(key=key, product_id=spec[0], label=label,
+                              spec=Configuration.canonical_spec(*spec))
+                for (key, spec), label in zip(missing.items(), labels)
+            ], ignore_conflicts=True)
+            ids.update(self.filter(key__in=missing).values_list('key', 'id'))
+        return [ids[key] for key in keys]
+
+    def with_finish_option(self, finish_option_id):
+        """
+        Filter the configurations with the given product or component
+        finish option, matching their specs in memory.
+        """
+        return self.filter(pk__in=[
+            pk for pk, (_, _, product_finish_id, finishes)
+            in self.values_list('pk', 'spec')
+            if finish_option_id == product_finish_id
+            or any(finish_option_id == finish_option
+                   for _, finish_option in finishes)])
+
+    def refresh_labels(self):
+        """
+        Rebuild the labels of the configurations from their specs, e.g.
+        after a rename of their product, option values or finishes, and
+        update the changed labels with a single UPDATE. Returns the number
+        of updated configurations.
+        """
+        configurations = list(self.values_list('pk', 'spec', 'label'))
+        labels = Configuration.build_labels(
+            [spec for _, spec, _ in configurations])
+        changed = {pk: label
+                   for (pk, _, saved_label), label in zip(configurations,
+                                                          labels)
+                   if label != saved_label}
+        if changed:
+            Configuration.objects.filter(pk__in=changed).update(label=Case(
+                *[When(pk=pk, then=Value(label))
+                  for pk, label in changed.items()]))
+            # Expire the cached charts showing the labels
+            bump_data_version()
+        return len(changed)
+
+
+class Configuration(models.Model):
+    """
+    A distinct configuration of a product, its option values, product finish
+    and component finishes, shared by all the order items configured the
+    same way and identified by a canonical hash of the configuration.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    product = models.ForeignKey(Product, related_name='configurations',
+                                on_delete=models.CASCADE)
+    # The label of the configuration, rebuilt on renames of its product,
+    # option values and finishes
+    label = models.TextField()
+    # The canonical (product_id, option_value_ids, product_finish_id,
+    # component_finishes) spec of the configuration, to rebuild its label
+    spec = models.JSONField(default=list, editable=False)
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    objects = ConfigurationQuerySet.as_manager()
+
+    def __str__(self):
+        return self.label
+
+    @staticmethod
+    def canonical_key(product_id, option_value_ids, product_finish_id,
+                      component_finishes):
+        """
+        Return the hash of the configuration, the same for any order of the
+        option values and component finishes.
+        """
+        canonical = json.dumps(Configuration.canonical_spec(
+            product_id, option_value_ids, product_finish_id,
+            component_finishes))
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    @staticmethod
+    def canonical_spec(product_id, option_value_ids, product_finish_id,
+                       component_finishes):
+        """
+        Return the spec of the configuration with the option values and
+        component finishes sorted and without repeats.
+        """
+        return [product_id, sorted(set(option_value_ids)), product_finish_id,
+                [list(finish) for finish in sorted(
+                    set(map(tuple, component_finishes)))]]
+
+    @staticmethod
+    def format_label(product_name, option_values, finishes):
+        """
+        Concatenate the product name, the option values and the finishes
+        of a configuration into its label.
+        """
+        option_values_str = ', '.join(option_values)
+        finishes_str = ', '.join(finishes)
+        return (
+            f"{product_name}" +
+            (f" | {option_values_str}" if option_values_str else "") +
+            (f" | {finishes_str}" if finishes_str else "")
+        )
+
+    @staticmethod
+    def build_labels(specs):
+        """
+        Build the labels of the configurations of the given specs, fetching
+        the names with one query per model. The option values and finishes
+        deleted since are left out.
+        """
+        product_names = dict(Product.objects.filter(
+            id__in={spec[0] for spec in specs}).values_list('id', 'name'))
+        values = dict(OptionValue.objects.filter(
+            id__in={value_id for spec in specs for value_id in spec[1]}
+        ).values_list('id', 'value'))
+        finish_names = dict(FinishOption.objects.filter(
+            id__in={finish_id for spec in specs
+                    for finish_id in [spec[2]] + [finish_option_id for _,
+                                                  finish_option_id
+                                                  in spec[3]]}
+        ).values_list('id', 'name'))
+        labels = []
+        for product_id, option_value_ids, product_finish_id, finishes in (
+                specs):
+            # The product finish, if any, first and the sorted component
+            # finishes
+            finish_labels = sorted(finish_names[finish_option_id]
+                                   for _, finish_option_id in set(
+                                       map(tuple, finishes))
+                                   if finish_option_id in finish_names)
+            if product_finish_id in finish_names:
+                finish_labels.insert(0, finish_names[product_finish_id])
+            labels.append(Configuration.format_label(
+                product_names[product_id],
+                sorted(values[value_id]
+                       for value_id in set(option_value_ids)
+                       if value_id in values),
+                finish_labels))
+        return labels
+
+
+# The item fields the daily rollups depend on
+ROLLUP_ITEM_FIELDS = {'order', 'order_id', 'product', 'product_id',
+                      'item_status', 'item_value'}
+
+# The item fields the order totals, item status counts and status depend on
+ORDER_ITEM_FIELDS = {'order', 'order_id', 'item_status', 'item_value',
+                     'discount'}
+
+
+class OrderItemQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # Bulk inserts bypass OrderItem.save, so intern the configurations
+        # of the items without one here, from their product and finish
+        objs = list(objs)
+        unset = [obj for obj in objs if obj.configuration_id is None]
+        if unset:
+            for obj, configuration_id in zip(
+                    unset, Configuration.objects.intern([
+                        (obj.product_id, (), obj.product_finish_id, ())
+                        for obj in unset])):
+                obj.configuration_id = configuration_id
+        created = super().bulk_create(objs, *args, **kwargs)
+        # Add the items to the daily rollups of their orders, fetching the
+        # orders not set on the items with one query
+        orders = Order.objects.in_bulk({
+            obj.order_id for obj in objs
+            if not OrderItem.order.is_cached(obj)})
+        deltas = {}
+        for obj in objs:
+            if obj.order_id in orders:
+                obj.order = orders[obj.order_id]
+            add_rollup_deltas(deltas, obj.rollup_delta(obj.order_id, 1))
+        apply_rollup_deltas(deltas)
+        bump_data_version()
+        return created
+
+    def update(self, **kwargs):
+        if not (ROLLUP_ITEM_FIELDS | ORDER_ITEM_FIELDS) & set(kwargs):
+            rows = super().update(**kwargs)
+        else:
+            items = dict(self.values_list('pk', 'order_id'))
+            rows = super().update(**kwargs)
+            order_ids = set(items.values())
+            if {'order', 'order_id'} & set(kwargs):
+                order_ids |= set(OrderItem.objects.filter(
+                    pk__in=items).values_list('order_id', flat=True))
+            # Recalculate the totals, item status counts and status of
+            # the updated items' orders, and reconcile their daily rollups
+            if ORDER_ITEM_FIELDS & set(kwargs):
+                recalculate_order_ids(order_ids)
+            if ROLLUP_ITEM_FIELDS & set(kwargs):
+                reconcile_daily_rollups(rollup_dates(order_ids))
+        bump_data_version()
+        return rows
+
+    def delete(self):
+        order_ids = set(self.values_list('order_id', flat=True))
+        dates = rollup_dates(order_ids)
+        deleted = super().delete()
+        # Recalculate the orders of the deleted items, which bypass
+        # OrderItem.delete, and their daily rollups
+        recalculate_order_ids(order_ids)
+        reconcile_daily_rollups(dates)
+        bump_data_version()
+        return deleted
+
+    def update_configurations(self):
+        """
+        Intern the configurations of the items from their saved option
+        values and component finishes, with bulk queries, and set them on
+        the items that changed configuration with a single UPDATE. Returns
+        the configuration ids by item id.
+        """
+        items = list(self.values_list('id', 'product_id',
+                                      'product_finish_id',
+                                      'configuration_id'))
+        if not items:
+            return {}
+        item_ids = [item[0] for item in items]
+        option_value_ids = defaultdict(list)
+        for item_id, option_value_id in (
+                OrderItem.option_values.through.objects.filter(
+                    orderitem_id__in=item_ids).values_list(
+                    'orderitem_id', 'optionvalue_id')):
+            option_value_ids[item_id].append(option_value_id)
+        finishes = defaultdict(list)
+        for item_id, component_id, finish_option_id in (
+                ComponentFinish.objects.filter(
+                    order_item_id__in=item_ids).values_list(
+                    'order_item_id', 'component_id', 'finish_option_id')):
+            finishes[item_id].append((component_id, finish_option_id))
+
+        configuration_ids = dict(zip(item_ids, Configuration.objects.intern([
+            (product_id, option_value_ids[item_id], product_finish_id,
+             finishes[item_id])
+            for item_id, product_id, product_finish_id, _ in items])))
+        changed = {item_id: configuration_ids[item_id]
+                   for item_id, _, _, configuration_id in items
+                   if configuration_ids[item_id] != configuration_id}
+        if changed:
+            OrderItem.objects.filter(pk__in=changed).update(
+                configuration_id=Case(
+                    *[When(pk=item_id, then=Value(configuration_id))
+                      for item_id, configuration_id in changed.items()]))
+        return configuration_ids
+
+
+class OrderItem(VersionedMixin, models.Model):
     order = models.ForeignKey(Order, related_name='items',
                               on_delete=models.CASCADE)
     product = models.ForeignKey(Product, related_name='order_items',
@@ -161,6 +988,19 @@ class OrderItem(models.Model):
         default=1
     )
     completed = models.BooleanField(default=False)
+    # Incremented on every save, so concurrent edits of an item, e.g. of
+    # its status from the trackers, are rejected instead of overwritten
+    version = models.PositiveIntegerField(default=0, editable=False)
+    # The interned configuration of the item, maintained on writes
+    configuration = models.ForeignKey(Configuration,
+                                      related_name='order_items',
+                                      on_delete=models.SET_NULL,
+                                      blank=True, null=True, editable=False)
+
+    objects = OrderItemQuerySet.as_manager()
+
+    class Meta:
+        base_manager_name = 'objects'
 
     def calculate_item_value(self):
         # Ensure base_price and discount are converted from None
@@ -191,19 +1031,113 @@ class OrderItem(models.Model):
         # call custom methods before saving
         self.calculate_item_value()
         self.update_completed()
-        self.order.update_order_status()
+        changed_fields = self.changed_fields()
+        adding = self._state.adding
+        # The saved values of the item, before this save
+        saved = dict(self.__dict__.get('_field_snapshot', {}))
+        saved_order_id = saved.get('order')
+        # New items start with the configuration of their product and
+        # finish, completed by update_configuration once their option values
+        # and component finishes are saved
+        if self.configuration_id is None:
+            self.configuration_id = Configuration.objects.intern([
+                (self.product_id, (), self.product_finish_id, ())])[0]
 
+        # save the changed fields of the OrderItem object
         super().save(*args, **kwargs)
 
+        # A changed product or finish changes the configuration
+        if not adding and changed_fields and {
+                'product', 'product_finish'} & changed_fields:
+            self.update_configuration()
+
+        # Apply the changes of the item value, discount and status to the
+        # totals, item status counts and status of the order
+        if adding:
+            self.apply_order_delta(self.order_id, 1)
+        elif changed_fields is None:
+            # The saved values are unknown, so recalculate the order and
+            # its daily rollups
+            if not defer_order_update(self.order_id, recalculate=True):
+                recalculate_order_totals(
+                    Order.objects.filter(pk=self.order_id))
+            reconcile_daily_rollups(rollup_dates([self.order_id]))
+        elif saved_order_id != self.order_id:
+            # Move the item from its previous order
+            self.apply_order_delta(saved_order_id, -1, saved)
+            self.apply_order_delta(self.order_id, 1)
+        else:
+            status_deltas = Counter({self.item_status: 1})
+            status_deltas.subtract(
+                {saved.get('item_status', self.item_status): 1})
+            apply_order_delta(
+                self.order_id,
+                (self.item_value or 0) - (saved.get('item_value') or 0),
+                (self.discount or 0) - (saved.get('discount') or 0),
+                status_deltas)
+            # Move the item between the daily rollups
+            apply_rollup_deltas(add_rollup_deltas(
+                self.rollup_delta(self.order_id, -1, saved),
+                self.rollup_delta(self.order_id, 1)))
+        # Expire the cached charts
+        bump_data_version()
+
+    def apply_order_delta(self, order_id, sign, values=None):
+        """
+        Add or subtract (for a negative sign) the item value, discount
+        and status, from the given values or the item, to the totals and
+        item status counts of the order.
+        """
+        values = values if values is not None else {
+            'item_value': self.item_value, 'discount': self.discount,
+            'item_status': self.item_status}
+        status = values.get('item_status', self.item_status)
+        apply_order_delta(order_id,
+                          sign * (values.get('item_value') or 0),
+                          sign * (values.get('discount') or 0),
+                          {status: sign})
+        apply_rollup_deltas(self.rollup_delta(order_id, sign, values))
+
+    def rollup_delta(self, order_id, sign, values=None):
+        """
+        Return the rollup delta adding (or subtracting, for a negative
+        sign) the item, with the product, status and value from the given
+        values or the item, to the daily rollups of the given order.
+        """
+        values = values if values is not None else {}
+        if order_id == self.order_id:
+            created_on, paid = self.order.created_on, self.order.paid
+        else:
+            created_on, paid = Order.objects.values_list(
+                'created_on', 'paid').get(pk=order_id)
+        key = rollup_key(created_on,
+                         values.get('product', self.product_id),
+                         values.get('item_status', self.item_status), paid)
+        return {key: (sign,
+                      sign * (values.get('item_value', self.item_value)
+                              or 0))}
+
+    def update_configuration(self):
+        """
+        Intern the configuration of the item from its saved option values
+        and component finishes, and set it on the item.
+        """
+        self.configuration_id = OrderItem.objects.filter(
+            pk=self.pk).update_configurations()[self.pk]
+        self.snapshot_fields(['configuration'])
+
     def __str__(self):
         return (f"Order Item #{self.id} - {self.product.name}: "
                 f"€{self.item_value}")
 
     def delete(self, *args, **kwargs):
-        order = self.order  # Keep a reference to the order
+        order_id = self.order_id
+        # The saved values of the item, if tracked
+        saved = self.__dict__.get('_field_snapshot')
         super().delete(*args, **kwargs)
-        # Update the order's status after deleting the item
-        order.update_order_status()
+        # Subtract the item from the order's totals and status counts
+        self.apply_order_delta(order_id, -1, saved)
+        bump_data_version()
 
     # define a property method that generates unique configuration string
     @property
@@ -211,37 +1145,36 @@ class OrderItem(models.Model):
         """
         Generates a unique concatenated string representing the combination of
         Product name, Option Values, Product Finish, and Component Finishes.
+        Prefetch the option values and the component finishes with their
+        finish options to render many items.
         """
-        product_name = self.product.name
-        product_finish = self.product_finish
+        # Read the prefetched option values and component finishes, if
+        # any, rather than querying them again
+        prefetched = getattr(self, '_prefetched_objects_cache', {})
 
         # Retrieve and sort option values
-        option_values = sorted(
-            self.option_values.values_list('value', flat=True)
-        )
-        option_values_str = (', '.join(option_values)
-                             if option_values else None)
+        if 'option_values' in prefetched:
+            option_values = sorted(option_value.value for option_value
+                                   in self.option_values.all())
+        else:
+            option_values = sorted(
+                self.option_values.values_list('value', flat=True))
 
         # Retrieve and sort component finishes
-        finishes = sorted(
-            self.item_component_finishes.values_list('finish_option__name',
-                                                     flat=True)
-        )
-        # add product finish to start of list if not None
-        if product_finish:
-            finishes.insert(0, product_finish)
-        # create finishes string
-        finishes_str = ', '.join(finishes) if finishes else None
+        if 'item_component_finishes' in prefetched:
+            finishes = sorted(component_finish.finish_option.name
+                              for component_finish
+                              in self.item_component_finishes.all())
+        else:
+            finishes = sorted(self.item_component_finishes.values_list(
+                'finish_option__name', flat=True))
+        # add product finish name to start of list if not None
+        if self.product_finish:
+            finishes.insert(0, self.product_finish.name)
 
         # Concatenate all parts into a single string
-        unique_config = (
-            f"{product_name}" +
-            (f" | {option_values_str}"
-             if option_values_str else "") +
-            (f" | {finishes_str}"
-             if finishes_str else "")
-        )
-        return unique_config
+        return Configuration.format_label(self.product.name, option_values,
+                                          finishes)
 
 
 class ComponentFinish(models.Model):
@@ -258,3 +1191,55 @@ class ComponentFinish(models.Model):
     def __str__(self):
         return (f"{self.component.name} - "
                 f"{self.finish_option.name}")
+
+
+@receiver(pre_save, sender=Client)
+def set_client_identity_keys(sender, instance, **kwargs):
+    """
+    Set the identity keys of a saved client, including the raw saves of
+    fixtures, which bypass Client.save.
+    """
+    instance.set_identity_keys()
+
+
+@receiver(pre_delete, sender=Product)
+def collect_product_orders(sender, instance, **kwargs):
+    """
+    Keep the ids of the orders of a deleted product's items, which are
+    deleted with the product without OrderItem.delete.
+    """
+    instance._deleted_order_ids = set(
+        instance.order_items.values_list('order_id', flat=True))
+
+
+@receiver(post_delete, sender=Product)
+def recalculate_product_orders(sender, instance, **kwargs):
+    """
+    Recalculate the orders of the items deleted with a product.
+    """
+    recalculate_order_ids(instance.__dict__.pop('_deleted_order_ids', ()))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=OptionValue)
+@receiver(post_save, sender=FinishOption)
+def refresh_configuration_labels(sender, instance, created, update_fields,
+                                 **kwargs):
+    """
+    Rebuild the labels of the configurations of a renamed product, option
+    value or finish option.
+    """
+    name_field = 'value' if sender is OptionValue else 'name'
+    if created or (update_fields is not None
+                   and name_field not in update_fields):
+        return
+    if sender is Product:
+        configurations = Configuration.objects.filter(product=instance)
+    elif sender is OptionValue:
+        # The configurations of the product of the option value
+        configurations = Configuration.objects.filter(
+            product__options=instance.option_id)
+    else:
+        configurations = Configuration.objects.with_finish_option(
+            instance.pk)
+    configurations.refresh_labels()
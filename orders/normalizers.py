@@ -0,0 +1,27 @@
+from phonenumber_field.phonenumber import to_python
+
+
+# Functions normalizing the client identity fields into the keys used to
+# match clients, also used by the migrations to backfill the keys
+
+def normalize_name(name):
+    """Case-fold the name and collapse its whitespace."""
+    return ' '.join(str(name or '').split()).casefold()
+
+
+def normalize_email(email):
+    """Case-fold the email and strip its whitespace."""
+    return str(email or '').strip().casefold()
+
+
+def normalize_phone(phone):
+    """
+    Format the phone number as E.164, falling back to the stripped raw
+    input for invalid numbers.
+    """
+    phone_number = to_python(phone)
+    if not phone_number:
+        return ''
+    if phone_number.is_valid():
+        return phone_number.as_e164
+    return str(phone_number).strip()
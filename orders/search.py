@@ -0,0 +1,204 @@
+import re
+import unicodedata
+import phonenumbers
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, When, Value, IntegerField, Q
+from .models import Client
+from .caches import client_search_cache
+from .normalizers import normalize_name
+
+
+# Name of the SQLite FTS5 index of the client identity keys, kept in sync
+# with the clients table by triggers (see migration 0006)
+CLIENT_FTS_TABLE = 'orders_client_fts'
+
+# Weights of the name, email and phone columns in the FTS5 ranking
+FTS_COLUMN_WEIGHTS = (10.0, 2.0, 2.0)
+
+# Maximum number of the most recent matches of a query that are ranked
+RANKED_MATCHES = 1000
+
+# Number of results of a query cached to answer the longer queries
+CACHED_MATCHES = 100
+
+# Words of a search query
+QUERY_WORD_PATTERN = re.compile(r'\w+')
+
+# Words of a text as split by the FTS5 unicode61 tokenizer, which treats
+# all the non-alphanumerics, including '_', as separators
+FTS_WORD_PATTERN = re.compile(r'[^\W_]+')
+
+
+def fts_words(text):
+    """
+    Split the text into words like the FTS5 unicode61 tokenizer:
+    case-folded, without diacritics and split on the non-alphanumerics.
+    """
+    text = unicodedata.normalize('NFKD', str(text).casefold())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return FTS_WORD_PATTERN.findall(text)
+
+
+def query_words(query):
+    """Return the words of the typeahead query, as the index splits them."""
+    if connection.vendor == 'sqlite':
+        return fts_words(query)
+    return QUERY_WORD_PATTERN.findall(normalize_name(query))
+
+
+def find_clients(query, limit=10):
+    """
+    Return the clients matching the typeahead query on the prefixes of the
+    words of their name, email or phone number, best matches first.
+    The results are cached, and the complete results of a query are
+    filtered in memory to answer the longer queries starting with it.
+    """
+    words = query_words(query)
+    if not words:
+        return []
+    key = ' '.join(words)
+
+    cached = client_search_cache.get(key)
+    if cached is not None:
+        prefix, clients, complete = cached
+        if prefix != key:
+            # The matches of the query are among the matches of its prefix,
+            # which are ranked for the query
+            clients = rank_clients([client for client in clients
+                                    if client_matches(client, words)], words)
+            client_search_cache.set(key, clients, complete)
+        if complete or len(clients) >= limit:
+            return clients[:limit]
+
+    # Fetch more results than needed, so that most short queries have
+    # complete results that can be reused while typing
+    fetch_limit = max(limit, CACHED_MATCHES)
+    if connection.vendor == 'sqlite':
+        clients = find_clients_fts(words, fetch_limit)
+    else:
+        clients = find_clients_trigram(words, fetch_limit)
+    # Rank the fetched matches in memory as the filtered cached matches, so
+    # the order of the results does not depend on the cached queries
+    clients = rank_clients(clients, words)
+    client_search_cache.set(key, clients, len(clients) < fetch_limit)
+    return clients[:limit]
+
+
+def column_matches(text, word, phone=False):
+    """
+    Return whether the word of the query matches the text of a column,
+    like the search index of the database.
+    """
+    if connection.vendor == 'sqlite':
+        return any(
+            token.startswith(word)
+            or (word.isdigit()
+                and token.startswith(local_phone_prefix(word)))
+            for token in fts_words(text))
+    return word in text and (word.isdigit() or not phone)
+
+
+def client_columns(client):
+    # The name, email and phone keys, in the order of FTS_COLUMN_WEIGHTS
+    return ((client.name_key, False), (client.email_key, False),
+            (client.phone_key, True))
+
+
+def client_matches(client, words):
+    """
+    Return whether the client matches all the words of the query,
+    like the search index of the database.
+    """
+    return all(any(column_matches(text, word, phone)
+                   for text, phone in client_columns(client))
+               for word in words)
+
+
+def rank_clients(clients, words):
+    """
+    Sort the matching clients for the query: the clients whose name starts
+    with the query first, then by the weighted matches of the words in
+    their name, email and phone, then by name. The order only depends on
+    the query and the clients, unlike the database ranking, which differs
+    between a query and its prefixes.
+    """
+    query = ' '.join(words)
+
+    def rank(client):
+        score = sum(weight for word in words
+                    for weight, (text, phone) in zip(FTS_COLUMN_WEIGHTS,
+                                                     client_columns(client))
+                    if column_matches(text, word, phone))
+        name_prefix = ' '.join(query_words(client.name_key)).startswith(
+            query)
+        return (not name_prefix, -score,
+                client.name_key, client.pk)
+
+    return sorted(clients, key=rank)
+
+
+def local_phone_prefix(word):
+    """
+    Return the E.164 digits prefix of a local phone number prefix,
+    e.g. '35799' for '99' with the Cyprus default region.
+    """
+    country_code = phonenumbers.country_code_for_region(
+        settings.PHONENUMBER_DEFAULT_REGION)
+    return f'{country_code}{word.lstrip("0")}' if country_code else word
+
+
+def fts_match_expression(words):
+    """
+    Build the FTS5 query matching all the words as prefixes, matching
+    digits as international or local phone number prefixes.
+    """
+    terms = []
+    for word in words:
+        # Quote the words so FTS5 operators in the input are ignored
+        term = f'"{word}"*'
+        if word.isdigit():
+            term = f'({term} OR "{local_phone_prefix(word)}"*)'
+        terms.append(term)
+    return ' AND '.join(terms)
+
+
+def find_clients_fts(words, limit):
+    # Rank the matches with BM25, weighing name matches the highest.
+    # Only the most recent matches are ranked, which bounds the time of
+    # short queries matching most of the clients.
+    weights = ', '.join(str(weight) for weight in FTS_COLUMN_WEIGHTS)
+    return list(Client.objects.raw(
+        f'SELECT orders_client.* FROM ('
+        f'SELECT rowid, bm25({CLIENT_FTS_TABLE}, {weights}) AS score '
+        f'FROM {CLIENT_FTS_TABLE} WHERE {CLIENT_FTS_TABLE} MATCH %s '
+        f'ORDER BY rowid DESC LIMIT %s'
+        f') AS matches '
+        f'JOIN orders_client ON orders_client.id = matches.rowid '
+        f'ORDER BY matches.score, orders_client.id '
+        f'LIMIT %s',
+        [fts_match_expression(words), RANKED_MATCHES, limit]))
+
+
+def find_clients_trigram(words, limit):
+    # Match each word anywhere in the keys, which uses the pg_trgm GIN
+    # indexes on Postgres, and rank the name prefix matches first
+    query = ' '.join(words)
+    clients = Client.objects.all()
+    for word in words:
+        word_filter = (Q(name_key__contains=word)
+                       | Q(email_key__contains=word))
+        if word.isdigit():
+            word_filter |= Q(phone_key__contains=word)
+        clients = clients.filter(word_filter)
+    clients = clients.annotate(name_prefix=Case(
+        When(name_key__startswith=query, then=Value(1)),
+        default=Value(0),
+        output_field=IntegerField()))
+    ordering = ['-name_prefix']
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramWordSimilarity
+        clients = clients.annotate(
+            similarity=TrigramWordSimilarity(query, 'name_key'))
+        ordering.append('-similarity')
+    return list(clients.order_by(*ordering, 'client_name', 'id')[:limit])
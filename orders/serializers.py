@@ -1,11 +1,25 @@
+from decimal import Decimal
+from django.db import transaction
 from rest_framework.serializers import (ModelSerializer,
+                                        Serializer,
                                         PrimaryKeyRelatedField,
                                         StringRelatedField,
                                         SerializerMethodField,
                                         DateTimeField,
+                                        IntegerField,
+                                        ReadOnlyField,
+                                        DecimalField,
+                                        CharField,
+                                        EmailField,
+                                        ChoiceField,
+                                        ListField,
+                                        BooleanField,
+                                        ValidationError,
                                         )
 from phonenumber_field.serializerfields import PhoneNumberField
 from .models import OrderItem, Order, Product, Client, ComponentFinish
+from .utils import (OrderCatalog, build_order_items,
+                    bulk_create_order_items, get_update_create_client)
 from products.models import OptionValue, FinishOption
 
 
@@ -51,7 +65,9 @@ class SummaryOrderSerializer(ModelSerializer):
 
     class Meta:
         model = Order
-        fields = ['id', 'client', 'order_status', 'paid', 'created_on']
+        fields = ['id', 'client', 'order_status', 'items_not_started',
+                  'items_in_progress', 'items_made', 'items_delivered',
+                  'paid', 'created_on']
 
 
 class ProductSerializer(ModelSerializer):
@@ -82,6 +98,12 @@ class OrderItemSerializer(ModelSerializer):
         source='option_values',
         write_only=True
     )
+    # The label of the interned configuration, rebuilt on renames, so no
+    # query per item renders it
+    unique_configuration = ReadOnlyField(source='configuration.label')
+    # The version of the item the edit is based on, to reject the edits
+    # of items changed since they were fetched
+    version = IntegerField(required=False, min_value=0)
 
     class Meta:
         model = OrderItem
@@ -98,7 +120,9 @@ class OrderItemSerializer(ModelSerializer):
             'item_value',
             'item_status',
             'priority_level',
-            'completed'
+            'completed',
+            'unique_configuration',
+            'version'
         ]
         read_only_fields = ['id', 'order', 'product', 'order_id', 'product_id',
                             'option_values', 'product_finish',
@@ -106,19 +130,6 @@ class OrderItemSerializer(ModelSerializer):
                             'item_component_finishes', 'completed',
                             'order__created_on']
 
-    # customise update to ensure the related order status is also updated
-    def update(self, instance, validated_data):
-        # Update the OrderItem instance
-        instance = super().update(instance, validated_data)
-
-        # After updating the OrderItem,
-        # call update_order_status on the associated Order
-        order = instance.order
-        order.update_order_status()
-        # Since update_order_status saves the order, no need to save again
-
-        return instance
-
 
 class OrderSerializer(ModelSerializer):
     client = ClientSerializer(read_only=True)
@@ -127,5 +138,116 @@ class OrderSerializer(ModelSerializer):
     class Meta:
         model = Order
         fields = ['id', 'client', 'discount', 'deposit', 'order_value',
-                  'order_status', 'paid', 'created_on', 'updated_on',
-                  'items', 'archived']
+                  'order_status', 'items_not_started', 'items_in_progress',
+                  'items_made', 'items_delivered', 'paid', 'created_on',
+                  'updated_on', 'items', 'archived']
+        # The totals and item status counts are maintained from the items
+        read_only_fields = ['order_value', 'discount', 'items_not_started',
+                            'items_in_progress', 'items_made',
+                            'items_delivered']
+
+
+# *** ORDER CREATION API SERIALIZERS ***
+class ClientInputSerializer(Serializer):
+    # an existing client is used when its id is provided
+    id = IntegerField(required=False)
+    client_name = CharField(max_length=100)
+    client_phone = PhoneNumberField()
+    client_email = EmailField()
+
+
+class ComponentFinishInputSerializer(Serializer):
+    component = IntegerField()
+    finish_option = IntegerField()
+
+
+class OrderItemInputSerializer(Serializer):
+    product = IntegerField()
+    quantity = IntegerField(min_value=1, default=1)
+    # defaults to the product's base price when not provided
+    base_price = DecimalField(max_digits=10, decimal_places=2,
+                              min_value=Decimal('0.00'), required=False)
+    discount = DecimalField(max_digits=10, decimal_places=2,
+                            min_value=Decimal('0.00'), required=False,
+                            allow_null=True)
+    priority_level = ChoiceField(choices=list(
+        OrderItem.PRIORITY_CHOICES.items()), default=1)
+    option_values = ListField(child=IntegerField(), default=list)
+    component_finishes = ComponentFinishInputSerializer(many=True,
+                                                        default=list)
+
+
+class OrderCreateSerializer(Serializer):
+    """
+    Writable nested serializer that creates an order with its client and
+    configured items from a single JSON payload, validating the items
+    against the catalog in bulk and saving them with bulk inserts.
+    """
+    client = ClientInputSerializer()
+    deposit = DecimalField(max_digits=10, decimal_places=2,
+                           min_value=Decimal('0.00'), default=0)
+    paid = ChoiceField(choices=list(Order.PAID_CHOICES.items()), default=1)
+    items = OrderItemInputSerializer(many=True, allow_empty=False)
+
+    def validate_client(self, value):
+        # Check that the existing client exists
+        if value.get('id') and not Client.objects.filter(
+                id=value['id']).exists():
+            raise ValidationError(f"Invalid client: {value['id']}")
+        return value
+
+    def validate_items(self, value):
+        # Resolve all the catalog objects referenced by the items with
+        # one query per model and validate the items in memory
+        errors = OrderCatalog.from_items(value).resolve_items(value)
+        if any(errors):
+            raise ValidationError(errors)
+        return value
+
+    def create(self, validated_data):
+        client_data = validated_data['client']
+        items_data = validated_data['items']
+
+        with transaction.atomic():
+            # Use the existing client if provided, or create a new one
+            client_id = client_data.get('id')
+            client = get_update_create_client(
+                'use_existing' if client_id else None, client_id,
+                client_data)
+
+            order = Order(client=client,
+                          deposit=validated_data['deposit'],
+                          paid=validated_data['paid'])
+
+            # Build all the order items and their copies in memory, setting
+            # the order totals and status from them before saving
+            items = build_order_items(order, items_data)
+            order.save()
+
+            # Insert the items with bulk queries
+            bulk_create_order_items(items)
+
+        return order
+
+
+class OrderItemImportSerializer(OrderItemInputSerializer):
+    item_status = ChoiceField(choices=list(OrderItem.STATUS_CHOICES.items()),
+                              default=1)
+
+
+class OrderImportSerializer(OrderCreateSerializer):
+    """
+    Validates the fields of a single order of an order import. The client
+    and the catalog objects are validated in bulk for each chunk of orders
+    by the OrderImporter.
+    """
+    idempotency_key = CharField(max_length=100)
+    created_on = DateTimeField(required=False)
+    archived = BooleanField(default=False)
+    items = OrderItemImportSerializer(many=True, allow_empty=False)
+
+    def validate_client(self, value):
+        return value
+
+    def validate_items(self, value):
+        return value
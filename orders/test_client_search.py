@@ -0,0 +1,255 @@
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.contrib.auth.models import User
+from model_bakery import baker
+from orders.models import Client as ClientModel
+from orders.caches import PrefixCache, client_search_cache
+from orders.search import find_clients, fts_match_expression
+
+
+class TestClientSearch(TestCase):
+    """
+    Test case for the ranked client typeahead search
+    """
+
+    def setUp(self):
+        # Create a superuser / admin
+        self.user = baker.make(User, is_staff=True, is_superuser=True)
+        self.user.set_password('testpass')
+        self.user.save()
+        self.client = Client()
+        self.client.login(username=self.user.username, password='testpass')
+
+        self.jane = ClientModel.objects.create(
+            client_name='Jane Doe', client_phone='+35799123456',
+            client_email='jane@example.com')
+        self.janet = ClientModel.objects.create(
+            client_name='Janet Smith', client_phone='+35799654321',
+            client_email='smith@example.com')
+        self.john = ClientModel.objects.create(
+            client_name='John Janeway', client_phone='+35722000000',
+            client_email='john@example.com')
+
+        self.search_url = reverse('search_clients')
+        client_search_cache.clear()
+
+    def search(self, query):
+        return [client.client_name for client in find_clients(query)]
+
+    def test_prefix_search_is_ranked(self):
+        """
+        Test that the clients matching the prefix of a word of their name
+        are returned, the name matches first
+        """
+        self.assertListEqual(self.search('jan'),
+                             ['Jane Doe', 'Janet Smith', 'John Janeway'])
+        self.assertListEqual(self.search('JANE d'), ['Jane Doe'])
+        # Email prefixes match and rank below name matches
+        self.assertListEqual(self.search('smith'), ['Janet Smith'])
+        self.assertListEqual(self.search('nobody'), [])
+
+    def test_phone_search(self):
+        """
+        Test that international and local phone number prefixes match
+        """
+        self.assertListEqual(self.search('3579965'), ['Janet Smith'])
+        self.assertListEqual(self.search('22 00'), ['John Janeway'])
+
+    def test_index_follows_client_changes(self):
+        """
+        Test that the search index is updated on client saves and deletes
+        """
+        self.jane.client_name = 'Mary Doe'
+        self.jane.client_email = 'mary@example.com'
+        self.jane.save()
+        self.assertListEqual(self.search('mary'), ['Mary Doe'])
+        self.assertNotIn('Mary Doe', self.search('jane'))
+
+        self.jane.delete()
+        self.assertListEqual(self.search('mary'), [])
+
+    def test_query_operators_are_escaped(self):
+        """
+        Test that search operators and quotes in the query are ignored
+        """
+        self.assertEqual(fts_match_expression(['jane', 'or']),
+                         '"jane"* AND "or"*')
+        self.assertListEqual(self.search('"jane" -(doe*'), ['Jane Doe'])
+        self.assertListEqual(self.search('*'), [])
+
+    def test_search_clients_api(self):
+        """
+        Test that the API returns the details of the best matches
+        """
+        response = self.client.get(self.search_url, {'q': 'jane d'})
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual(response.json()['clients'], [
+            {'name': 'Jane Doe', 'phone': '+35799123456',
+             'email': 'jane@example.com'}])
+
+    def test_non_user_cannot_access(self):
+        """
+        Test a request without logged-in user to ensure
+        that it gets rejected
+        """
+        # Create a client with no logged in user
+        self.client_loggedout = Client()
+
+        response = self.client_loggedout.get(self.search_url, {'q': 'jane'})
+
+        # check for non 2xx status code
+        self.assertNotEqual(response.status_code, 200,
+                            msg='Anauthorised access allowed')
+
+
+class TestClientSearchCache(TestCase):
+    """
+    Test case for the cache of the client typeahead search
+    """
+
+    def setUp(self):
+        # Create a superuser / admin
+        self.user = baker.make(User, is_staff=True, is_superuser=True)
+        self.user.set_password('testpass')
+        self.user.save()
+        self.client = Client()
+        self.client.login(username=self.user.username, password='testpass')
+
+        self.jane = ClientModel.objects.create(
+            client_name='Jane Doe', client_phone='+35799123456',
+            client_email='jane@example.com')
+        ClientModel.objects.create(
+            client_name='Janet Smith', client_phone='+35799654321',
+            client_email='smith@example.com')
+        client_search_cache.clear()
+        self.initial_stats = client_search_cache.stats()
+
+    def search(self, query):
+        return [client.client_name for client in find_clients(query)]
+
+    def stat(self, name):
+        # Counters of the cache since the start of the test
+        return client_search_cache.stats()[name] - self.initial_stats[name]
+
+    def test_repeated_queries_are_cached(self):
+        """
+        Test that a repeated query is answered without queries
+        """
+        self.assertListEqual(self.search('jan'), ['Jane Doe', 'Janet Smith'])
+        with self.assertNumQueries(0):
+            self.assertListEqual(self.search(' JAN '),
+                                 ['Jane Doe', 'Janet Smith'])
+
+        self.assertEqual(self.stat('hits'), 1)
+        self.assertEqual(self.stat('misses'), 1)
+
+    def test_longer_queries_filter_cached_prefix(self):
+        """
+        Test that longer queries are answered by filtering the cached
+        results of their prefix in memory
+        """
+        self.search('ja')
+        with self.assertNumQueries(0):
+            self.assertListEqual(self.search('janet'), ['Janet Smith'])
+            self.assertListEqual(self.search('jane d'), ['Jane Doe'])
+            self.assertListEqual(self.search('ja 9965'), ['Janet Smith'])
+            self.assertListEqual(self.search('jax'), [])
+        self.assertEqual(self.stat('prefix_hits'), 4)
+
+    def test_filtered_results_are_ranked_for_query(self):
+        """
+        Test that a longer query answered from the cached results of its
+        prefix is ranked as when answered by the database
+        """
+        ClientModel.objects.create(
+            client_name='Bob Jones', client_phone='+35799111111',
+            client_email='janet.bob@example.com')
+
+        fresh = self.search('janet')
+        client_search_cache.clear()
+        self.search('j')
+        with self.assertNumQueries(0):
+            self.assertListEqual(self.search('janet'), fresh)
+        # The name matches rank above the email matches
+        self.assertListEqual(fresh, ['Janet Smith', 'Bob Jones'])
+
+    def test_filtered_results_match_fresh_results(self):
+        """
+        Test that the cached results of a prefix are filtered with the
+        tokenizer of the search index, which folds the diacritics and
+        splits the words on underscores
+        """
+        ClientModel.objects.create(
+            client_name='José Núñez', client_phone='+35799222222',
+            client_email='john_doe@example.com')
+
+        for prefix, query in [('jo', 'jose'), ('jo', 'josé'),
+                              ('j', 'jose nun'), ('d', 'doe')]:
+            client_search_cache.clear()
+            fresh = self.search(query)
+            client_search_cache.clear()
+            self.search(prefix)
+            with self.subTest(query=query):
+                with self.assertNumQueries(0):
+                    self.assertListEqual(self.search(query), fresh)
+                self.assertIn('José Núñez', fresh)
+
+    def test_incomplete_results_are_not_filtered(self):
+        """
+        Test that the results of a prefix with more matches than cached
+        are not reused for longer queries
+        """
+        ClientModel.objects.bulk_create(
+            ClientModel(client_name=f'Jack {index}',
+                        client_email=f'jack{index}@example.com')
+            for index in range(100))
+        self.search('ja')
+        self.assertListEqual(self.search('jane'),
+                             ['Jane Doe', 'Janet Smith'])
+        self.assertEqual(self.stat('prefix_hits'), 0)
+
+    def test_client_writes_invalidate_cache(self):
+        """
+        Test that client saves, deletes and bulk inserts clear the cache
+        """
+        self.search('jan')
+        self.jane.client_name = 'Mary Doe'
+        self.jane.client_email = 'mary@example.com'
+        self.jane.save()
+        self.assertListEqual(self.search('jan'), ['Janet Smith'])
+
+        ClientModel.objects.bulk_create([ClientModel(
+            client_name='Janice Brown', client_email='janice@example.com')])
+        self.assertListEqual(self.search('jani'), ['Janice Brown'])
+
+        ClientModel.objects.filter(client_name='Janice Brown').delete()
+        self.assertListEqual(self.search('jani'), [])
+        self.assertEqual(self.stat('invalidations'), 3)
+
+    def test_cache_size_and_ttl(self):
+        """
+        Test that the least recently used entries are evicted and that
+        the entries expire
+        """
+        cache = PrefixCache(max_size=2)
+        cache.set('a', ['a'], True)
+        cache.set('b', ['b'], True)
+        cache.get('a')
+        cache.set('c', ['c'], True)
+        self.assertListEqual(list(cache.entries), ['a', 'c'])
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['hit_rate'], 0.5)
+
+        cache = PrefixCache(ttl=0)
+        cache.set('a', ['a'], True)
+        self.assertIsNone(cache.get('a'))
+
+    def test_cache_stats_api(self):
+        """
+        Test that the API returns the counters of the cache
+        """
+        self.search('jan')
+        response = self.client.get(reverse('search_clients_cache_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), client_search_cache.stats())
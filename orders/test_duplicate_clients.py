@@ -0,0 +1,143 @@
+from io import StringIO
+from unittest import mock
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from model_bakery import baker
+from orders.models import (Order, Client as ClientModel,
+                           DuplicateClientCandidate)
+from orders.duplicates import (find_duplicate_clients,
+                               merge_duplicate_clients)
+
+
+class TestDuplicateClients(TestCase):
+    """
+    Test case for the detection and merge of duplicate clients
+    """
+
+    def setUp(self):
+        # Create a superuser / admin
+        self.user = baker.make(User, is_staff=True, is_superuser=True)
+        self.user.set_password('testpass')
+        self.user.save()
+        self.client = Client()
+        self.client.login(username=self.user.username, password='testpass')
+
+        self.jane = ClientModel.objects.create(
+            client_name='Jane Doe', client_phone='+35799123456',
+            client_email='jane@example.com')
+        # Same phone and a typo in the name
+        self.jane_typo = ClientModel.objects.create(
+            client_name='Jane Doee', client_phone='+35799123456',
+            client_email='jane.doe@example.com')
+        # Same email user and reordered name
+        self.doe_jane = ClientModel.objects.create(
+            client_name='Doe Jane', client_phone='+35799000000',
+            client_email='jane@example.org')
+        # Same phone, different person
+        self.john = ClientModel.objects.create(
+            client_name='John Smith', client_phone='+35799123456',
+            client_email='smith@example.com')
+
+    def duplicate_pairs(self):
+        return set(DuplicateClientCandidate.objects.values_list(
+            'client_id', 'duplicate_id'))
+
+    def test_find_duplicates(self):
+        """
+        Test that the likely duplicates sharing a block are stored,
+        the oldest client first
+        """
+        compared, found = find_duplicate_clients(workers=1)
+
+        self.assertEqual(compared, 4)
+        self.assertEqual(found, 2)
+        self.assertSetEqual(self.duplicate_pairs(), {
+            (self.jane.id, self.jane_typo.id),
+            (self.jane.id, self.doe_jane.id)})
+
+    def test_find_duplicates_in_parallel(self):
+        """
+        Test that comparing the pairs across processes finds the same
+        duplicates
+        """
+        with mock.patch('orders.duplicates.PAIRS_PER_TASK', 1):
+            compared, found = find_duplicate_clients(workers=2)
+
+        self.assertEqual(found, 2)
+        self.assertSetEqual(self.duplicate_pairs(), {
+            (self.jane.id, self.jane_typo.id),
+            (self.jane.id, self.doe_jane.id)})
+
+    def test_dismissed_duplicates_stay_dismissed(self):
+        """
+        Test that finding the duplicates again keeps their review status
+        """
+        find_duplicate_clients(workers=1)
+        DuplicateClientCandidate.objects.update(status=2)
+        find_duplicate_clients(workers=1)
+
+        self.assertEqual(DuplicateClientCandidate.objects.count(), 2)
+        self.assertFalse(DuplicateClientCandidate.objects.filter(
+            status=1).exists())
+
+    def test_merge_duplicates(self):
+        """
+        Test that the orders of chained duplicates are moved to the oldest
+        client with a single update, and the duplicates deleted
+        """
+        orders = [baker.make(Order, client=client)
+                  for client in (self.jane, self.jane_typo, self.doe_jane,
+                                 self.john)]
+        candidates = [
+            DuplicateClientCandidate.objects.create(
+                client=self.jane_typo, duplicate=self.doe_jane, score=0.9),
+            DuplicateClientCandidate.objects.create(
+                client=self.jane, duplicate=self.jane_typo, score=0.9),
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(merge_duplicate_clients(candidates), 2)
+        # The orders are moved by one UPDATE, the other only sets the
+        # client of the orders of the deleted duplicates, none, to NULL
+        order_updates = [query['sql'] for query in queries
+                         if query['sql'].startswith('UPDATE "orders_order"')
+                         and 'CASE' in query['sql']]
+        self.assertEqual(len(order_updates), 1)
+
+        self.assertListEqual(
+            [Order.objects.get(pk=order.pk).client_id for order in orders],
+            [self.jane.id] * 3 + [self.john.id])
+        self.assertSetEqual(set(ClientModel.objects.all()),
+                            {self.jane, self.john})
+        self.assertFalse(DuplicateClientCandidate.objects.exists())
+
+    def test_merge_admin_action(self):
+        """
+        Test that the admin action merges the selected duplicates
+        """
+        find_duplicate_clients(workers=1)
+        candidate = DuplicateClientCandidate.objects.get(
+            duplicate=self.jane_typo)
+
+        response = self.client.post(
+            reverse('admin:orders_duplicateclientcandidate_changelist'),
+            {'action': 'merge_duplicates',
+             '_selected_action': [candidate.pk]})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(ClientModel.objects.filter(
+            pk=self.jane_typo.pk).exists())
+
+    def test_find_duplicate_clients_command(self):
+        """
+        Test that the management command reports the duplicates found
+        """
+        out = StringIO()
+        call_command('find_duplicate_clients', workers=1, stdout=out)
+
+        self.assertIn('Found 2 likely duplicate clients in 4 compared pairs',
+                      out.getvalue())
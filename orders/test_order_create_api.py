@@ -0,0 +1,145 @@
+from decimal import Decimal
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from django.contrib.auth.models import User
+from model_bakery import baker
+from products.models import Product, OptionValue, Component, FinishOption
+from orders.models import Order, OrderItem, Client as ClientModel
+
+
+class TestOrderCreateAPI(TestCase):
+    """
+    Test case for the JSON order creation API
+    """
+
+    def setUp(self):
+        # Create a superuser / admin
+        self.user = baker.make(User, is_staff=True, is_superuser=True)
+        self.user.set_password('testpass')
+        self.user.save()
+        self.client = Client()
+        self.client.login(username=self.user.username, password='testpass')
+
+        # Create test catalog
+        self.product = baker.make(Product, base_price=Decimal('150.00'))
+        self.option_value = baker.make(OptionValue,
+                                       option__product=self.product)
+        self.component = baker.make(Component)
+        self.finish_option = baker.make(FinishOption)
+
+        self.api_url = reverse('api_create_order')
+
+    def order_payload(self, num_items=1, quantity=1):
+        return {
+            'client': {'client_name': 'API Client',
+                       'client_phone': '+35799999999',
+                       'client_email': 'apiclient@example.com'},
+            'deposit': '50.00',
+            'items': [
+                {'product': self.product.id,
+                 'quantity': quantity,
+                 'discount': '10.00',
+                 'option_values': [self.option_value.id],
+                 'component_finishes': [
+                     {'component': self.component.id,
+                      'finish_option': self.finish_option.id}]}
+                for _ in range(num_items)
+            ]
+        }
+
+    def test_create_order(self):
+        """
+        Test that the order, its client and its configured items are created
+        with the derived fields set
+        """
+        response = self.client.post(self.api_url,
+                                    self.order_payload(quantity=3),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201, msg=response.content)
+
+        order = Order.objects.get(pk=response.json()['id'])
+        self.assertEqual(order.client.client_name, 'API Client')
+        self.assertEqual(order.deposit, Decimal('50.00'))
+        self.assertEqual(order.order_value, Decimal('420.00'))
+        self.assertEqual(order.discount, Decimal('30.00'))
+        self.assertEqual(order.order_status, 1)
+
+        items = OrderItem.objects.filter(order=order)
+        self.assertEqual(items.count(), 3)
+        for item in items:
+            # Check that the base price defaults to the product's
+            self.assertEqual(item.base_price, Decimal('150.00'))
+            self.assertEqual(item.item_value, Decimal('140.00'))
+            self.assertListEqual(
+                list(item.option_values.values_list('id', flat=True)),
+                [self.option_value.id])
+            self.assertListEqual(
+                list(item.item_component_finishes.values_list(
+                    'component_id', 'finish_option_id')),
+                [(self.component.id, self.finish_option.id)])
+
+    def test_create_order_existing_client(self):
+        """
+        Test that an existing client is used when its id is provided
+        """
+        existing_client = baker.make(ClientModel)
+        payload = self.order_payload()
+        payload['client']['id'] = existing_client.id
+
+        response = self.client.post(self.api_url, payload,
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201, msg=response.content)
+        self.assertEqual(Order.objects.get().client, existing_client)
+        self.assertEqual(ClientModel.objects.count(), 1)
+
+    def test_create_order_query_count(self):
+        """
+        Test that the number of queries does not grow with the number
+        of items
+        """
+        def post_order(num_items):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    self.api_url, self.order_payload(num_items, quantity=2),
+                    content_type='application/json')
+            self.assertEqual(response.status_code, 201)
+            return len(queries)
+
+        # Intern the configurations of the items before counting
+        post_order(1)
+        self.assertEqual(post_order(2), post_order(40))
+
+    def test_create_order_invalid_catalog(self):
+        """
+        Test that option values of another product and unknown finishes
+        are rejected without creating the order
+        """
+        payload = self.order_payload(num_items=2)
+        payload['items'][0]['option_values'] = [baker.make(OptionValue).id]
+        payload['items'][1]['component_finishes'][0]['finish_option'] = 0
+
+        response = self.client.post(self.api_url, payload,
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()['items']), 2)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(ClientModel.objects.exists())
+
+    def test_non_user_cannot_access(self):
+        """
+        Test a request without logged-in user to ensure
+        that it gets rejected
+        """
+        # Create a client with no logged in user
+        self.client_loggedout = Client()
+
+        response = self.client_loggedout.post(
+            self.api_url, self.order_payload(),
+            content_type='application/json')
+
+        # check for non 2xx status code
+        self.assertIn(response.status_code, [401, 403],
+                      msg='Anauthorised access allowed')
+        self.assertFalse(Order.objects.exists())
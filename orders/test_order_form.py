@@ -1,11 +1,17 @@
 from django.test import TestCase, Client
+from django.http import QueryDict
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.urls import reverse
+from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
 from model_bakery import baker
-from products.models import Product, OptionValue
-from orders.models import Order, Client as ClientModel
+from products.models import Product, OptionValue, Component, FinishOption
+from orders.models import (Order, OrderItem, Client as ClientModel,
+                           Configuration)
 from orders.forms import OrderForm, OrderItemFormSet
 from orders.views import get_update_create_client
+from orders.utils import OrderCatalog, parse_item_configurations
 
 
 class TestCreateOrderView(TestCase):
@@ -99,6 +105,157 @@ class TestCreateOrderView(TestCase):
                                              ).exists(),
                         msg='Client was not created')
 
+    def test_create_order_quantity_copies(self):
+        """
+        Test that an item with a quantity is replicated with the same
+        configuration and that the order derived fields are recomputed
+        """
+        component = baker.make(Component)
+        finish_option = baker.make(FinishOption)
+        data = {
+            'client_name': 'Test Client',
+            'client_phone': '+35799999999',
+            'client_email': 'testclient@example.com',
+            'order_value': '800.00',
+            'deposit': '0.00',
+            'items-TOTAL_FORMS': '1',
+            'items-INITIAL_FORMS': '0',
+            'items-0-product': self.product.id,
+            'items-0-quantity': '5',
+            'items-0-base_price': '180.00',
+            'items-0-discount': '20.00',
+            'items-0-item_value': '160.00',
+            f'items-0-option_{self.option_value.option_id}':
+                self.option_value.id,
+            f'items-0-component_finish-{component.id}': finish_option.id,
+        }
+        response = self.client.post(self.create_order_url, data)
+        self.assertEqual(response.status_code, 302, msg='Redirect NOT OK')
+
+        order = Order.objects.get(client__client_name='Test Client')
+        items = OrderItem.objects.filter(order=order)
+        # Check that all the copies share the same configuration
+        self.assertEqual(items.count(), 5)
+        for item in items:
+            self.assertListEqual(
+                list(item.option_values.values_list('id', flat=True)),
+                [self.option_value.id])
+            self.assertListEqual(
+                list(item.item_component_finishes.values_list(
+                    'component_id', 'finish_option_id')),
+                [(component.id, finish_option.id)])
+        # Check that the order totals were computed from the items
+        self.assertEqual(float(order.order_value), 800.00)
+        self.assertEqual(float(order.discount), 100.00)
+
+    def test_create_order_option_finishes(self):
+        """
+        Test that the finishes of the components linked to a selected
+        option value are saved and that other components are ignored
+        """
+        component = baker.make(Component)
+        other_component = baker.make(Component)
+        finish_option = baker.make(FinishOption)
+        baker.make('products.ProductComponent', product=self.product,
+                   component=component, option_value=self.option_value)
+        data = {
+            'client_name': 'Test Client',
+            'client_phone': '+35799999999',
+            'client_email': 'testclient@example.com',
+            'order_value': '100.00',
+            'deposit': '0.00',
+            'items-TOTAL_FORMS': '1',
+            'items-INITIAL_FORMS': '0',
+            'items-0-product': self.product.id,
+            'items-0-quantity': '1',
+            'items-0-base_price': '100.00',
+            'items-0-discount': '0.00',
+            'items-0-item_value': '100.00',
+            f'items-0-option_{self.option_value.option_id}':
+                self.option_value.id,
+            f'items-0-option_finish_component-{component.id}':
+                finish_option.id,
+            f'items-0-option_finish_component-{other_component.id}':
+                finish_option.id,
+        }
+        response = self.client.post(self.create_order_url, data)
+        self.assertEqual(response.status_code, 302, msg='Redirect NOT OK')
+
+        item = OrderItem.objects.get(order__client__client_name='Test Client')
+        self.assertListEqual(
+            list(item.item_component_finishes.values_list(
+                'component_id', 'finish_option_id')),
+            [(component.id, finish_option.id)])
+
+    def test_create_order_quantity_query_count(self):
+        """
+        Test that the number of queries to save an order item does not
+        grow with its quantity
+        """
+        def post_order(quantity):
+            data = {
+                'client_name': f'Client {quantity}',
+                'client_phone': '+35799999999',
+                'client_email': f'client{quantity}@example.com',
+                'order_value': f'{100 * quantity}.00',
+                'deposit': '0.00',
+                'items-TOTAL_FORMS': '1',
+                'items-INITIAL_FORMS': '0',
+                'items-0-product': self.product.id,
+                'items-0-quantity': str(quantity),
+                'items-0-base_price': '100.00',
+                'items-0-discount': '0.00',
+                'items-0-item_value': '100.00',
+                f'items-0-option_{self.option_value.option_id}':
+                    self.option_value.id,
+            }
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(self.create_order_url, data)
+            return len(queries)
+
+        # Intern the configuration of the items before counting
+        post_order(1)
+        self.assertEqual(post_order(2), post_order(50))
+        self.assertEqual(
+            OrderItem.objects.filter(
+                order__client__client_name='Client 50').count(), 50)
+
+    def test_create_order_validates_formset_once(self):
+        """
+        Test that the item forms are validated once, looking up the
+        selected product a single time per form
+        """
+        num_items = 5
+        data = {
+            'client_name': 'Test Client',
+            'client_phone': '+35799999999',
+            'client_email': 'testclient@example.com',
+            'order_value': f'{100 * num_items}.00',
+            'deposit': '0.00',
+            'items-TOTAL_FORMS': str(num_items),
+            'items-INITIAL_FORMS': '0',
+        }
+        for index in range(num_items):
+            data.update({
+                f'items-{index}-product': self.product.id,
+                f'items-{index}-quantity': '1',
+                f'items-{index}-base_price': '100.00',
+                f'items-{index}-discount': '0.00',
+                f'items-{index}-item_value': '100.00',
+            })
+
+        # Intern the configuration of the items before counting
+        Configuration.objects.intern([(self.product.id, (), None, ())])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.create_order_url, data)
+        self.assertEqual(response.status_code, 302, msg='Redirect NOT OK')
+
+        product_lookups = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('SELECT "products_product"."id"')
+        ]
+        self.assertEqual(len(product_lookups), num_items)
+
     def test_create_order_with_invalid_data(self):
         """
         Test create order form submission with invalid data
@@ -173,6 +330,35 @@ class TestCreateOrderView(TestCase):
                          existing_client.id,
                          msg='Incorrect client match')
 
+    def test_client_match_is_normalized(self):
+        """
+        Test that the client matching ignores the case and whitespace of
+        the name and email and the format of the phone number
+        """
+        existing_client = baker.make(ClientModel,
+                                     client_name='Existing Client',
+                                     client_phone='+35799999999',
+                                     client_email='existingclient@example.com')
+
+        response = self.client.post(reverse('check_client'), {
+            'client_name': '  existing   CLIENT ',
+            'client_phone': '99 999 999',
+            'client_email': 'ExistingClient@Example.com',
+        })
+        self.assertEqual(response.json()['exact_match']['id'],
+                         existing_client.id,
+                         msg='Incorrect client match')
+
+        # A blank phone number should not match clients without phone
+        baker.make(ClientModel, client_name='No Phone', client_phone='',
+                   client_email='nophone@example.com')
+        response = self.client.post(reverse('check_client'), {
+            'client_name': 'Another Client',
+            'client_phone': '',
+            'client_email': 'another@example.com',
+        })
+        self.assertFalse(response.json()['partial_match'])
+
     def test_client_partial_match_handling(self):
         """
         Test client conflict handling with partial match
@@ -231,3 +417,100 @@ class TestCreateOrderView(TestCase):
         # check for non 200 status code
         self.assertNotEqual(response.status_code, 200,
                             msg='Anauthorised access allowed')
+
+
+class TestOrderCatalog(TestCase):
+    """
+    Test case for the batched catalog validation of the order form
+    """
+
+    def setUp(self):
+        self.product = baker.make(Product)
+        self.option_value = baker.make(OptionValue,
+                                       option__product=self.product)
+        self.component = baker.make(Component)
+        self.finish_option = baker.make(FinishOption)
+        self.product_component = baker.make(
+            'products.ProductComponent', product=self.product,
+            component=self.component, option_value=self.option_value)
+
+    def test_catalog_resolves_with_one_query_per_model(self):
+        """
+        Test that the catalog is built with a constant number of queries
+        and validates the objects in memory
+        """
+        with self.assertNumQueries(4):
+            catalog = OrderCatalog(
+                option_value_ids=[str(self.option_value.id)] * 50,
+                component_ids=[str(self.component.id)] * 50,
+                finish_option_ids=[str(self.finish_option.id)] * 50)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                catalog.get_option_value(str(self.option_value.id),
+                                         str(self.option_value.option_id)),
+                self.option_value)
+            self.assertEqual(catalog.get_component(self.component.id),
+                             self.component)
+            self.assertEqual(catalog.get_finish_option(self.finish_option.id),
+                             self.finish_option)
+            self.assertListEqual(
+                catalog.get_option_components(self.product.id,
+                                              self.option_value.id),
+                [self.component])
+
+    def test_catalog_rejects_invalid_ids(self):
+        """
+        Test that unknown ids, malformed ids and option values of another
+        option are rejected
+        """
+        other_option_value = baker.make(OptionValue)
+        catalog = OrderCatalog(
+            option_value_ids=[self.option_value.id, other_option_value.id,
+                              'abc'],
+            component_ids=['abc'],
+            finish_option_ids=[0])
+
+        with self.assertRaises(ValidationError):
+            catalog.get_option_value(other_option_value.id,
+                                     self.option_value.option_id)
+        with self.assertRaises(ValidationError):
+            catalog.get_option_value('abc', self.option_value.option_id)
+        with self.assertRaises(ValidationError):
+            catalog.get_component('abc')
+        with self.assertRaises(ValidationError):
+            catalog.get_finish_option(0)
+
+
+class TestItemConfigurationRouter(TestCase):
+    """
+    Test case for routing the order items configuration fields
+    """
+
+    def test_fields_are_grouped_per_form(self):
+        """
+        Test that the configuration fields are grouped by form index and
+        field type, and that unrelated fields are ignored
+        """
+        post = QueryDict(mutable=True)
+        post.update({'client_name': 'Test Client',
+                     'items-0-product': '1',
+                     'items-0-option_3': '7',
+                     'items-0-component_finish-4': '9',
+                     'items-1-option_finish_component-5': '10',
+                     'items-10-component_finish-4': ''})
+        post.appendlist('items-0-option_3', '8')
+
+        configurations = parse_item_configurations(post)
+
+        self.assertListEqual(sorted(configurations.keys()),
+                             ['0', '1', '10'])
+        self.assertDictEqual(configurations['0'].option_values,
+                             {'3': ['7', '8']})
+        self.assertDictEqual(configurations['0'].component_finishes,
+                             {'4': '9'})
+        self.assertDictEqual(configurations['0'].option_finishes, {})
+        self.assertDictEqual(configurations['1'].option_finishes,
+                             {'5': '10'})
+        self.assertDictEqual(configurations['10'].component_finishes,
+                             {'4': ''})
@@ -0,0 +1,207 @@
+import json
+import tempfile
+from datetime import datetime, timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from model_bakery import baker
+from products.models import Product, OptionValue
+from orders.models import Order, OrderItem, Client as ClientModel
+from orders.imports import OrderImporter
+
+
+class TestOrderImport(TestCase):
+    """
+    Test case for the NDJSON order imports
+    """
+
+    def setUp(self):
+        # Create a superuser / admin
+        self.user = baker.make(User, is_staff=True, is_superuser=True)
+        self.user.set_password('testpass')
+        self.user.save()
+        self.client = Client()
+        self.client.login(username=self.user.username, password='testpass')
+
+        # Create test catalog
+        self.product = baker.make(Product, base_price=Decimal('100.00'))
+        self.option_value = baker.make(OptionValue,
+                                       option__product=self.product)
+
+        self.api_url = reverse('api_import_orders')
+
+    def order_line(self, key, paid=2, item_statuses=(4, 4)):
+        return json.dumps({
+            'idempotency_key': key,
+            'created_on': '2023-05-01T10:00:00Z',
+            'paid': paid,
+            'deposit': '20.00',
+            'client': {'client_name': 'Imported Client',
+                       'client_phone': '+35799999999',
+                       'client_email': 'imported@example.com'},
+            'items': [
+                {'product': self.product.id,
+                 'discount': '10.00',
+                 'item_status': item_status,
+                 'option_values': [self.option_value.id]}
+                for item_status in item_statuses
+            ]
+        })
+
+    def test_import_orders(self):
+        """
+        Test that the orders are imported with their historical fields
+        and their derived fields computed
+        """
+        lines = [self.order_line('order-1'),
+                 self.order_line('order-2', paid=1, item_statuses=(1, 3))]
+        summary = OrderImporter().run(lines)
+
+        self.assertEqual(summary['created'], 2)
+        self.assertEqual(summary['items'], 4)
+        self.assertEqual(summary['failed'], 0)
+        self.assertGreater(summary['rows_per_second'], 0)
+
+        order = Order.objects.get(idempotency_key='order-1')
+        self.assertEqual(order.created_on,
+                         datetime(2023, 5, 1, 10, tzinfo=timezone.utc))
+        self.assertEqual(order.order_value, Decimal('180.00'))
+        self.assertEqual(order.discount, Decimal('20.00'))
+        self.assertEqual(order.order_status, 4)
+        # Delivered and fully paid items are completed
+        self.assertTrue(all(order.items.values_list('completed', flat=True)))
+
+        order = Order.objects.get(idempotency_key='order-2')
+        self.assertEqual(order.order_status, 2)
+        self.assertFalse(any(order.items.values_list('completed', flat=True)))
+        self.assertListEqual(
+            list(OrderItem.objects.filter(order=order).values_list(
+                'option_values', flat=True)),
+            [self.option_value.id] * 2)
+
+        # Check that the client repeated in the chunk was created once
+        self.assertEqual(ClientModel.objects.count(), 1)
+
+    def test_import_is_idempotent(self):
+        """
+        Test that orders already imported or repeated are skipped
+        """
+        OrderImporter().run([self.order_line('order-1')])
+        summary = OrderImporter().run([self.order_line('order-1'),
+                                       self.order_line('order-2'),
+                                       self.order_line('order-2')])
+
+        self.assertEqual(summary['created'], 1)
+        self.assertEqual(summary['skipped'], 2)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_import_invalid_orders(self):
+        """
+        Test that invalid lines are reported without failing the chunk
+        """
+        invalid_item = json.loads(self.order_line('order-2'))
+        invalid_item['items'][0]['product'] = 0
+        summary = OrderImporter().run([self.order_line('order-1'),
+                                       '{not json',
+                                       json.dumps(invalid_item),
+                                       json.dumps({'client': {}})])
+
+        self.assertEqual(summary['created'], 1)
+        self.assertListEqual(
+            sorted(error['line'] for error in summary['errors']), [2, 3, 4])
+
+    def test_invalid_order_does_not_reserve_key(self):
+        """
+        Test that a valid line is imported after an invalid line with the
+        same idempotency key
+        """
+        invalid_item = json.loads(self.order_line('order-1'))
+        invalid_item['items'][0]['product'] = 0
+        summary = OrderImporter().run([json.dumps(invalid_item),
+                                       self.order_line('order-1')])
+
+        self.assertEqual(summary['created'], 1)
+        self.assertEqual(summary['skipped'], 0)
+        self.assertEqual(summary['failed'], 1)
+
+    def test_concurrent_import_conflict(self):
+        """
+        Test that the orders committed by a concurrent import after the
+        check of the keys are skipped, and the rest of the chunk saved
+        """
+        OrderImporter().run([self.order_line('order-1')])
+        # The concurrent import commits order-1 after the check
+        with mock.patch.object(OrderImporter, 'imported_keys',
+                               side_effect=[set(), {'order-1'}]):
+            summary = OrderImporter().run([self.order_line('order-1'),
+                                           self.order_line('order-2')])
+
+        self.assertEqual(summary['created'], 1)
+        self.assertEqual(summary['skipped'], 1)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_import_chunk_query_count(self):
+        """
+        Test that the number of queries per chunk does not grow with the
+        number of orders
+        """
+        def import_orders(first, count):
+            lines = [self.order_line(f'order-{i}')
+                     for i in range(first, first + count)]
+            with CaptureQueriesContext(connection) as queries:
+                OrderImporter(chunk_size=count).run(lines)
+            return len(queries)
+
+        # Intern the configurations of the items before counting
+        import_orders(0, 1)
+        self.assertEqual(import_orders(1, 2), import_orders(3, 30))
+
+    def test_import_orders_api(self):
+        """
+        Test that the API imports the streamed NDJSON orders
+        """
+        body = '\n'.join([self.order_line('order-1'),
+                          self.order_line('order-2')])
+        response = self.client.post(f'{self.api_url}?chunk_size=1', body,
+                                    content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, 200, msg=response.content)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_import_orders_command(self):
+        """
+        Test that the management command imports the orders of a file
+        """
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as file:
+            file.write(self.order_line('order-1') + '\n')
+            file.flush()
+            out = StringIO()
+            call_command('import_orders', file.name, stdout=out)
+
+        self.assertIn('Imported 1 of 1 orders', out.getvalue())
+        self.assertTrue(Order.objects.filter(
+            idempotency_key='order-1').exists())
+
+    def test_non_user_cannot_access(self):
+        """
+        Test a request without logged-in user to ensure
+        that it gets rejected
+        """
+        # Create a client with no logged in user
+        self.client_loggedout = Client()
+
+        response = self.client_loggedout.post(
+            self.api_url, self.order_line('order-1'),
+            content_type='application/x-ndjson')
+
+        # check for non 2xx status code
+        self.assertIn(response.status_code, [401, 403],
+                      msg='Anauthorised access allowed')
+        self.assertFalse(Order.objects.exists())
@@ -0,0 +1,1095 @@
+import datetime
+import json
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction, OperationalError
+from django.db.models import F
+from django.db.models.functions import Upper
+from django.db.models.signals import post_save
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+from model_bakery import baker
+from orders.models import (Order, OrderItem, Client as ClientModel,
+                           ComponentFinish, Configuration,
+                           ProductDailyRollup, apply_rollup_deltas,
+                           defer_order_updates, reconcile_daily_rollups)
+from orders.utils import get_update_create_client, bulk_create_order_items
+from orders.views import OrderItemViewSet, copy_order_item
+from products.models import (Component, ComponentPart, Product, Option,
+                             OptionValue, FinishOption)
+from slotted_need.tracking import ConcurrentUpdateError
+
+FIXTURE_PATH = Path(__file__).parent / 'fixtures' / 'orders.json'
+
+
+class TestDeferOrderUpdates(TestCase):
+    """
+    Test case for the batch mode deferring the order updates of item writes
+    """
+
+    def setUp(self):
+        self.order = baker.make(Order)
+
+    def test_order_updated_once_on_exit(self):
+        """
+        Test that the order status and totals are recomputed on exit
+        and not on each item save
+        """
+        with defer_order_updates():
+            for _ in range(3):
+                baker.make(OrderItem, order=self.order, item_status=3,
+                           base_price=Decimal('10.00'),
+                           discount=Decimal('2.00'))
+            # Check that the order has not been updated yet
+            self.order.refresh_from_db()
+            self.assertEqual(self.order.order_status, 1)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_status, 3)
+        self.assertEqual(self.order.order_value, Decimal('24.00'))
+        self.assertEqual(self.order.discount, Decimal('6.00'))
+
+    def test_nested_batches_are_merged(self):
+        """
+        Test that a nested batch defers its updates to the outermost one
+        """
+        with defer_order_updates():
+            with defer_order_updates():
+                baker.make(OrderItem, order=self.order, item_status=4)
+            self.order.refresh_from_db()
+            self.assertEqual(self.order.order_status, 1)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_status, 4)
+
+    def test_item_deletes_are_deferred(self):
+        """
+        Test that the order is updated once after deleting items
+        """
+        items = baker.make(OrderItem, order=self.order, _quantity=2)
+        items[0].item_status = 4
+        items[0].save()
+
+        with defer_order_updates():
+            items[1].delete()
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_status, 4)
+
+    def test_no_updates_on_error(self):
+        """
+        Test that the batch is discarded when exiting with an error and
+        that the item hooks are restored
+        """
+        with self.assertRaises(RuntimeError):
+            with defer_order_updates():
+                baker.make(OrderItem, order=self.order, item_status=4)
+                raise RuntimeError
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_status, 1)
+
+        # Check that item saves update the order again outside a batch
+        item = baker.make(OrderItem, order=self.order, item_status=4)
+        item.save()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_status, 4)
+
+
+class TestTrackedFields(TestCase):
+    """
+    Test case for the saves of the changed fields of orders, order items
+    and components
+    """
+
+    def setUp(self):
+        order = baker.make(Order)
+        baker.make(OrderItem, order=order, item_status=4)
+        self.order = Order.objects.get(pk=order.pk)
+
+    def test_order_save_writes_changed_fields(self):
+        """
+        Test that saving an order writes its changed fields only,
+        without reading the order first
+        """
+        self.order.archived = True
+        with CaptureQueriesContext(connection) as queries:
+            self.order.save()
+
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(queries[0]['sql'].startswith('UPDATE'))
+        self.assertIn('"archived"', queries[0]['sql'])
+        self.assertNotIn('"order_value"', queries[0]['sql'])
+        self.assertTrue(Order.objects.get(pk=self.order.pk).archived)
+
+        # Saving again without changes writes nothing
+        with self.assertNumQueries(0):
+            self.order.save()
+
+    def test_order_paid_change_updates_items(self):
+        """
+        Test that the items are completed when the order is paid, and
+        only then
+        """
+        self.order.deposit = Decimal('10.00')
+        with self.assertNumQueries(1):
+            self.order.save()
+
+        self.order.paid = 2
+        # The order and items updates, and the move of the items to the
+        # daily rollups of the paid status, with an aggregate and two writes
+        with self.assertNumQueries(5):
+            self.order.save()
+        self.assertTrue(self.order.items.get().completed)
+
+    def test_item_save_skips_order_status(self):
+        """
+        Test that the order status is only derived again when the item
+        status changes
+        """
+        item = OrderItem.objects.select_related('order').get()
+        item.priority_level = 3
+        with self.assertNumQueries(1):
+            item.save()
+
+        item.item_status = 1
+        item.save()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_status, 1)
+
+    def test_component_save(self):
+        """
+        Test that components are created with a single insert and that
+        their unit cost is calculated from their parts on save
+        """
+        component = Component.objects.create(name='Leg', slug='leg')
+        baker.make(ComponentPart, component=component,
+                   unit_cost=Decimal('2.50'), quantity=4)
+
+        component.save()
+        component.refresh_from_db()
+        self.assertEqual(component.unit_cost, Decimal('10.00'))
+
+
+class TestOrderTotals(TestCase):
+    """
+    Test case for the incrementally maintained order totals
+    """
+
+    def setUp(self):
+        self.order = baker.make(Order)
+
+    def make_item(self, order=None, base_price='100.00', discount='10.00'):
+        return baker.make(OrderItem, order=order or self.order,
+                          base_price=Decimal(base_price),
+                          discount=Decimal(discount))
+
+    def assertTotals(self, order, order_value, discount):
+        order.refresh_from_db()
+        self.assertEqual(order.order_value, Decimal(order_value))
+        self.assertEqual(order.discount, Decimal(discount))
+
+    def test_item_changes_update_totals(self):
+        """
+        Test that item inserts, updates and deletes apply their deltas
+        to the order totals
+        """
+        item = self.make_item()
+        self.make_item(base_price='50.00', discount='0.00')
+        self.assertTotals(self.order, '140.00', '10.00')
+
+        item = OrderItem.objects.get(pk=item.pk)
+        item.discount = Decimal('30.00')
+        with CaptureQueriesContext(connection) as queries:
+            item.save()
+        # The totals are updated without reading the items
+        self.assertFalse([query for query in queries
+                          if 'SUM' in query['sql']])
+        self.assertTotals(self.order, '120.00', '30.00')
+
+        item.delete()
+        self.assertTotals(self.order, '50.00', '0.00')
+
+    def test_cascade_deletes_update_totals(self):
+        """
+        Test that the items deleted with their product, or by a queryset
+        delete, which bypass OrderItem.delete, are subtracted from the
+        order totals
+        """
+        item = self.make_item()
+        self.make_item(base_price='50.00', discount='0.00')
+        self.make_item(base_price='20.00', discount='5.00')
+        self.assertTotals(self.order, '155.00', '15.00')
+
+        item.product.delete()
+        self.assertTotals(self.order, '65.00', '5.00')
+
+        OrderItem.objects.filter(order=self.order).delete()
+        self.assertTotals(self.order, '0.00', '0.00')
+
+    def test_item_moved_to_another_order(self):
+        """
+        Test that moving an item moves its value between the order totals
+        """
+        other_order = baker.make(Order)
+        item = OrderItem.objects.get(pk=self.make_item().pk)
+        item.order = other_order
+        item.save()
+
+        self.assertTotals(self.order, '0.00', '0.00')
+        self.assertTotals(other_order, '90.00', '10.00')
+
+    def test_queryset_updates_recalculate_totals(self):
+        """
+        Test that queryset updates of the items, which bypass the item
+        hooks, recalculate the order totals
+        """
+        self.make_item()
+        self.make_item()
+        OrderItem.objects.filter(order=self.order).update(
+            item_value=Decimal('50.00'), discount=Decimal('5.00'))
+        self.assertTotals(self.order, '100.00', '10.00')
+
+    def test_deferred_deltas_are_applied_once(self):
+        """
+        Test that the deltas of a batch are applied once per order
+        """
+        with defer_order_updates():
+            for _ in range(3):
+                self.make_item()
+            self.assertTotals(self.order, '0.00', '0.00')
+        self.assertTotals(self.order, '270.00', '30.00')
+
+    def test_verify_order_totals_command(self):
+        """
+        Test that the command reports and fixes the orders with totals
+        not matching their items
+        """
+        self.make_item()
+        drifted_order = baker.make(Order)
+        self.make_item(order=drifted_order)
+        # Order updates bypass the item hooks
+        Order.objects.filter(pk=drifted_order.pk).update(
+            order_value=Decimal('50.00'))
+
+        out = StringIO()
+        call_command('verify_order_totals', stdout=out)
+        self.assertIn(f'1 orders have totals or status counts not matching '
+                      f'their items: {drifted_order.pk}', out.getvalue())
+        self.assertTotals(drifted_order, '50.00', '10.00')
+
+        call_command('verify_order_totals', fix=True, stdout=out)
+        self.assertTotals(drifted_order, '90.00', '10.00')
+        out = StringIO()
+        call_command('verify_order_totals', stdout=out)
+        self.assertIn('All the order totals and status counts match',
+                      out.getvalue())
+
+
+class TestOrderStatusCounts(TestCase):
+    """
+    Test case for the incrementally maintained item status counts and the
+    order status derived from them
+    """
+
+    def setUp(self):
+        self.order = baker.make(Order)
+
+    def assertCounts(self, order, counts, order_status):
+        order.refresh_from_db()
+        self.assertDictEqual(order.status_counts(), counts)
+        self.assertEqual(order.order_status, order_status)
+
+    def test_status_from_counts(self):
+        """
+        Test that the status derived from the counts matches the status
+        derived from the item statuses, in Python and SQL
+        """
+        for statuses in ([], [1], [1, 1], [4, 4], [3], [3, 4], [1, 2],
+                         [1, 4], [2, 3, 4], [1, 2, 3, 4]):
+            counts = {status: statuses.count(status)
+                      for status in Order.STATUS_COUNT_FIELDS}
+            Order.objects.filter(pk=self.order.pk).update(
+                **{field: counts[status] for status, field
+                   in Order.STATUS_COUNT_FIELDS.items()})
+            Order.objects.filter(pk=self.order.pk).update(
+                order_status=Order.status_expression({
+                    status: F(field) for status, field
+                    in Order.STATUS_COUNT_FIELDS.items()}))
+            self.order.refresh_from_db()
+            with self.subTest(statuses=statuses):
+                self.assertEqual(Order.status_from_counts(counts),
+                                 Order.derive_order_status(statuses))
+                self.assertEqual(self.order.order_status,
+                                 Order.derive_order_status(statuses))
+
+    def test_item_changes_update_counts(self):
+        """
+        Test that item inserts, status changes and deletes update the
+        counts and the status with a single order UPDATE
+        """
+        item = baker.make(OrderItem, order=self.order, item_status=4)
+        baker.make(OrderItem, order=self.order, item_status=4)
+        self.assertCounts(self.order, {1: 0, 2: 0, 3: 0, 4: 2}, 4)
+
+        item = OrderItem.objects.select_related('order').get(pk=item.pk)
+        item.item_status = 2
+        # The item and order updates, and the two daily rollup writes
+        with self.assertNumQueries(4):
+            item.save()
+        self.assertCounts(self.order, {1: 0, 2: 1, 3: 0, 4: 1}, 2)
+
+        item.delete()
+        self.assertCounts(self.order, {1: 0, 2: 0, 3: 0, 4: 1}, 4)
+
+    def test_cascade_deletes_update_counts(self):
+        """
+        Test that the items deleted with their product, or by a queryset
+        delete, are subtracted from the counts and the status
+        """
+        item = baker.make(OrderItem, order=self.order, item_status=2)
+        baker.make(OrderItem, order=self.order, item_status=4, _quantity=2)
+        self.assertCounts(self.order, {1: 0, 2: 1, 3: 0, 4: 2}, 2)
+
+        item.product.delete()
+        self.assertCounts(self.order, {1: 0, 2: 0, 3: 0, 4: 2}, 4)
+
+        OrderItem.objects.filter(order=self.order).delete()
+        self.assertCounts(self.order, {1: 0, 2: 0, 3: 0, 4: 0}, 1)
+
+    def test_item_moved_to_another_order(self):
+        """
+        Test that moving an item moves its status count between the orders
+        """
+        other_order = baker.make(Order)
+        item = baker.make(OrderItem, order=self.order, item_status=3)
+        item = OrderItem.objects.get(pk=item.pk)
+        item.order = other_order
+        item.save()
+
+        self.assertCounts(self.order, {1: 0, 2: 0, 3: 0, 4: 0}, 1)
+        self.assertCounts(other_order, {1: 0, 2: 0, 3: 1, 4: 0}, 3)
+
+    def test_deferred_counts_are_applied_once(self):
+        """
+        Test that the status deltas of a batch are applied with one
+        UPDATE per order on exit
+        """
+        with defer_order_updates():
+            items = [baker.make(OrderItem, order=self.order)
+                     for _ in range(3)]
+            for item in items[:2]:
+                item.item_status = 3
+                item.save()
+            with CaptureQueriesContext(connection) as queries:
+                items[2].delete()
+            self.assertFalse([query for query in queries
+                              if 'UPDATE "orders_order"' in query['sql']])
+        self.assertCounts(self.order, {1: 0, 2: 0, 3: 2, 4: 0}, 3)
+
+    def test_queryset_updates_recalculate_counts(self):
+        """
+        Test that queryset updates of the item statuses, which bypass the
+        item hooks, recalculate the counts and the status
+        """
+        baker.make(OrderItem, order=self.order, _quantity=2)
+        OrderItem.objects.filter(order=self.order).update(item_status=4)
+        self.assertCounts(self.order, {1: 0, 2: 0, 3: 0, 4: 2}, 4)
+
+        item = OrderItem.objects.filter(order=self.order).first()
+        item.item_status = 3
+        item.save()
+        self.assertCounts(self.order, {1: 0, 2: 0, 3: 1, 4: 1}, 2)
+
+    def test_drifted_counts_are_recalculated(self):
+        """
+        Test that an item change that would make the drifted counts of
+        its order negative recalculates the order instead of failing
+        """
+        item = baker.make(OrderItem, order=self.order, item_status=2)
+        # Drift the counts, as loading the orders and items of a fixture
+        # does
+        Order.objects.filter(pk=self.order.pk).update(items_in_progress=0)
+
+        item = OrderItem.objects.get(pk=item.pk)
+        item.item_status = 4
+        item.save()
+        self.assertCounts(self.order, {1: 0, 2: 0, 3: 0, 4: 1}, 4)
+
+    def test_verify_command_fixes_counts(self):
+        """
+        Test that the command fixes the counts and status of the orders
+        changed bypassing the item hooks
+        """
+        baker.make(OrderItem, order=self.order, _quantity=2)
+        Order.objects.filter(pk=self.order.pk).update(items_not_started=0,
+                                                      items_delivered=2)
+
+        call_command('verify_order_totals', fix=True, stdout=StringIO())
+        self.assertCounts(self.order, {1: 2, 2: 0, 3: 0, 4: 0}, 1)
+
+
+class TestOrderItemVersions(TestCase):
+    """
+    Test case for the optimistic concurrency control of order items
+    """
+
+    def setUp(self):
+        self.item = baker.make(OrderItem)
+
+    def test_save_increments_version(self):
+        """
+        Test that saves of changes increment the version, and saves
+        without changes don't
+        """
+        item = OrderItem.objects.get(pk=self.item.pk)
+        item.item_status = 2
+        item.save()
+        item.save()
+
+        item.refresh_from_db()
+        self.assertEqual(item.version, 1)
+
+    def test_concurrent_save_conflicts(self):
+        """
+        Test that saving an item changed since it was loaded raises
+        a conflict, with a single conditional UPDATE
+        """
+        first = OrderItem.objects.select_related('order').get(
+            pk=self.item.pk)
+        second = OrderItem.objects.select_related('order').get(
+            pk=self.item.pk)
+        first.item_status = 3
+        first.save()
+
+        second.item_status = 4
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertRaises(ConcurrentUpdateError), \
+                    transaction.atomic():
+                second.save()
+        updates = [query['sql'] for query in queries
+                   if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"version" = 0', updates[0])
+        self.assertEqual(second.version, 0)
+
+        order = Order.objects.get(pk=self.item.order_id)
+        self.assertDictEqual(order.status_counts(),
+                             {1: 0, 2: 0, 3: 1, 4: 0})
+        self.assertEqual(order.order_status, 3)
+
+    def test_outdated_version_conflicts(self):
+        """
+        Test that saving with a version other than the loaded one, e.g.
+        from a request, raises a conflict without querying
+        """
+        item = OrderItem.objects.select_related('order').get(
+            pk=self.item.pk)
+        item.version = 5
+        with self.assertNumQueries(0):
+            with self.assertRaises(ConcurrentUpdateError):
+                item.save()
+
+    def test_deleted_item_save_conflicts(self):
+        """
+        Test that saving an item deleted since it was loaded raises
+        a conflict
+        """
+        item = OrderItem.objects.get(pk=self.item.pk)
+        OrderItem.objects.filter(pk=self.item.pk).delete()
+        item.item_status = 2
+        with self.assertRaises(ConcurrentUpdateError):
+            item.save()
+        self.assertEqual(item.version, 0)
+
+    def test_versioned_save_sends_signals(self):
+        """
+        Test that the versioned saves send the save signals with the
+        saved fields
+        """
+        saved = []
+
+        def receiver(sender, instance, update_fields, **kwargs):
+            saved.append(update_fields)
+
+        post_save.connect(receiver, sender=OrderItem)
+        self.addCleanup(post_save.disconnect, receiver, sender=OrderItem)
+        item = OrderItem.objects.get(pk=self.item.pk)
+        item.item_status = 2
+        item.save()
+        self.assertIn('item_status', saved[0])
+        self.assertIn('version', saved[0])
+
+
+class TestDailyRollups(TestCase):
+    """
+    Test case for the daily rollups maintained on the order and order item
+    writes
+    """
+
+    def setUp(self):
+        self.order = baker.make(Order, paid=1)
+        self.product = baker.make(Product)
+
+    def make_item(self, **kwargs):
+        return baker.make(OrderItem, order=self.order, product=self.product,
+                          base_price=Decimal('10.00'), discount=None,
+                          **kwargs)
+
+    def rollups(self):
+        return set(ProductDailyRollup.objects.filter(
+            item_count__gt=0).values_list('item_status', 'paid',
+                                          'item_count', 'revenue'))
+
+    def assertRollupsMatch(self):
+        # No rollup drifted from the order items
+        self.assertEqual(reconcile_daily_rollups(), 0)
+
+    def test_item_writes_update_rollups(self):
+        """
+        Test that the item inserts, changes and deletes update the rollups
+        of the order date, product, item status and paid status
+        """
+        item = self.make_item()
+        self.make_item(item_status=2)
+        self.assertSetEqual(self.rollups(), {(1, 1, 1, Decimal('10.00')),
+                                             (2, 1, 1, Decimal('10.00'))})
+
+        item.item_status = 2
+        item.base_price = Decimal('15.00')
+        item.save()
+        self.assertSetEqual(self.rollups(), {(2, 1, 2, Decimal('25.00'))})
+
+        item.order = baker.make(Order, paid=2)
+        item.save()
+        self.assertSetEqual(self.rollups(), {(2, 1, 1, Decimal('10.00')),
+                                             (2, 2, 1, Decimal('15.00'))})
+        self.assertRollupsMatch()
+
+        item.delete()
+        self.assertSetEqual(self.rollups(), {(2, 1, 1, Decimal('10.00'))})
+        self.assertRollupsMatch()
+
+    def test_order_writes_update_rollups(self):
+        """
+        Test that the paid changes and deletes of the orders move and
+        remove their items from the rollups
+        """
+        self.make_item()
+        self.make_item(item_status=4)
+
+        self.order.paid = 2
+        self.order.save()
+        self.assertSetEqual(self.rollups(), {(1, 2, 1, Decimal('10.00')),
+                                             (4, 2, 1, Decimal('10.00'))})
+        self.assertRollupsMatch()
+
+        self.order.delete()
+        self.assertSetEqual(self.rollups(), set())
+
+    def test_bulk_writes_update_rollups(self):
+        """
+        Test that the bulk inserts and the queryset updates and deletes
+        update the rollups, the deferred deltas once per rollup
+        """
+        with CaptureQueriesContext(connection) as queries:
+            with defer_order_updates():
+                self.make_item()
+                copy_order_item(self.make_item(), copies=3)
+        rollup_writes = [query for query in queries
+                         if 'orders_productdailyrollup' in query['sql']]
+        self.assertEqual(len(rollup_writes), 2)
+        self.assertSetEqual(self.rollups(), {(1, 1, 5, Decimal('50.00'))})
+
+        OrderItem.objects.filter(pk__in=OrderItem.objects.filter(
+            order=self.order).values('pk')[:2]).update(item_status=3)
+        self.assertRollupsMatch()
+        Order.objects.filter(pk=self.order.pk).update(paid=2)
+        self.assertRollupsMatch()
+        OrderItem.objects.filter(item_status=3).delete()
+        self.assertSetEqual(self.rollups(), {(1, 2, 3, Decimal('30.00'))})
+        self.assertRollupsMatch()
+
+    def test_many_rollup_deltas_are_batched(self):
+        """
+        Test that the deltas of more rollups than the SQLite expression
+        depth limit are applied, in batches
+        """
+        first_day = datetime.date(2020, 1, 1)
+        deltas = {(first_day + datetime.timedelta(days=day), self.product.pk,
+                   1, 1): (1, Decimal('10.00'))
+                  for day in range(1200)}
+        apply_rollup_deltas(deltas)
+        apply_rollup_deltas(deltas)
+
+        self.assertEqual(ProductDailyRollup.objects.filter(
+            item_count=2, revenue=Decimal('20.00')).count(), 1200)
+
+    def test_reconcile_daily_rollups_command(self):
+        """
+        Test that the command corrects the drifted rollups
+        """
+        self.make_item()
+        ProductDailyRollup.objects.all().delete()
+        ProductDailyRollup.objects.create(
+            date='2020-01-01', product=self.product, item_status=1, paid=1,
+            item_count=1, revenue=Decimal('1.00'))
+
+        out = StringIO()
+        call_command('reconcile_daily_rollups', stdout=out)
+        self.assertIn('Corrected 2 drifted daily rollups', out.getvalue())
+        self.assertSetEqual(self.rollups(), {(1, 1, 1, Decimal('10.00'))})
+
+        out = StringIO()
+        call_command('reconcile_daily_rollups', days=1, stdout=out)
+        self.assertIn('All the daily rollups match', out.getvalue())
+
+
+class TestConfigurations(TestCase):
+    """
+    Test case for the configurations interned on the order item writes
+    """
+
+    def setUp(self):
+        self.order = baker.make(Order)
+        self.product = baker.make(Product, name='Table')
+        option = baker.make(Option, product=self.product)
+        self.oak = baker.make(OptionValue, option=option, value='Oak')
+        self.large = baker.make(OptionValue, option=option, value='Large')
+        self.component = baker.make(Component)
+        self.white = baker.make(FinishOption, name='White')
+        self.black = baker.make(FinishOption, name='Black')
+
+    def make_item(self, option_values=(), finishes=()):
+        item = OrderItem.objects.create(
+            order=self.order, product=self.product,
+            base_price=Decimal('10.00'), product_finish=self.white)
+        item.option_values.set(option_values)
+        for finish in finishes:
+            ComponentFinish.objects.create(order_item=item,
+                                           component=self.component,
+                                           finish_option=finish)
+        item.update_configuration()
+        return item
+
+    def test_identical_configurations_are_shared(self):
+        """
+        Test that the items configured the same way, in any order, share
+        one configuration, labelled as the unique configuration
+        """
+        first = self.make_item([self.oak, self.large], [self.black])
+        second = self.make_item([self.large, self.oak], [self.black])
+        other = self.make_item([self.oak])
+
+        self.assertEqual(first.configuration_id, second.configuration_id)
+        self.assertNotEqual(first.configuration_id, other.configuration_id)
+        self.assertEqual(Configuration.objects.count(), 3)
+        self.assertEqual(first.configuration.label,
+                         'Table | Large, Oak | White, Black')
+        self.assertEqual(other.configuration.label, 'Table | Oak | White')
+
+    def test_renames_refresh_labels(self):
+        """
+        Test that renaming the product, an option value or a finish option
+        of a configuration rebuilds its label, and other saves don't
+        """
+        item = self.make_item([self.oak], [self.black])
+        other = baker.make(OrderItem, order=self.order)
+
+        self.product.name = 'Desk'
+        self.product.save()
+        self.oak.value = 'Walnut'
+        self.oak.save()
+        self.black.name = 'Ebony'
+        self.black.save()
+        FinishOption.objects.get(pk=self.white.pk).save()
+        item.configuration.refresh_from_db()
+        self.assertEqual(item.configuration.label,
+                         'Desk | Walnut | White, Ebony')
+        self.assertEqual(item.configuration.label, item.unique_configuration)
+        self.assertEqual(other.configuration.label,
+                         other.unique_configuration)
+
+        with self.assertNumQueries(1):
+            self.product.description = 'A desk'
+            self.product.save()
+
+    def test_new_items_get_a_configuration(self):
+        """
+        Test that the saved and bulk inserted items get the configuration
+        of their product and finish, and the copies that of their item
+        """
+        item = baker.make(OrderItem, order=self.order, product=self.product)
+        bulk_items = baker.make(OrderItem, order=self.order,
+                                product=self.product, _quantity=2,
+                                _bulk_create=True)
+        self.assertEqual(item.configuration.label, 'Table')
+        self.assertListEqual(
+            [bulk_item.configuration_id for bulk_item in bulk_items],
+            [item.configuration_id] * 2)
+
+        configured = self.make_item([self.oak], [self.black])
+        copies = copy_order_item(configured, copies=2)
+        self.assertListEqual([copy.configuration_id for copy in copies],
+                             [configured.configuration_id] * 2)
+
+    def test_bulk_created_items_configurations(self):
+        """
+        Test that the bulk created items get their full configurations
+        with the same number of queries however many they are
+        """
+        def create(count):
+            return bulk_create_order_items([
+                (OrderItem(order=self.order, product=self.product,
+                           base_price=Decimal('10.00')),
+                 [self.oak.id], [(self.component.id, self.black.id)])
+                for _ in range(count)])
+
+        create(1)
+        with CaptureQueriesContext(connection) as queries:
+            items = create(10)
+        # The configuration lookup, three inserts and the savepoint, and
+        # the two daily rollup writes
+        self.assertEqual(len(queries), 8)
+        self.assertEqual(len({item.configuration_id for item in items}), 1)
+        self.assertEqual(items[0].configuration.label,
+                         'Table | Oak | Black')
+
+    def test_product_finish_change_updates_configuration(self):
+        """
+        Test that changing the finish of an item moves it to another
+        configuration
+        """
+        item = self.make_item([self.oak])
+        item.product_finish = self.black
+        item.save()
+
+        item.refresh_from_db()
+        self.assertEqual(item.configuration.label, 'Table | Oak | Black')
+
+    def test_update_configurations_is_bulk(self):
+        """
+        Test that the configurations of many items are updated with the
+        same number of queries
+        """
+        items = baker.make(OrderItem, order=self.order, product=self.product,
+                           _quantity=10)
+        for item in items:
+            item.option_values.set([self.large])
+
+        with CaptureQueriesContext(connection) as queries:
+            OrderItem.objects.filter(
+                order=self.order).update_configurations()
+        self.assertLessEqual(len(queries), 9)
+        self.assertEqual(
+            set(OrderItem.objects.values_list('configuration__label',
+                                              flat=True)),
+            {'Table | Large'})
+
+
+class TestConfigurationLabels(TestCase):
+    """
+    Test case for the rendering of the unique configuration labels of
+    many order items
+    """
+
+    def setUp(self):
+        order = baker.make(Order)
+        for index in range(10):
+            product = baker.make(Product, name=f'Product {index}')
+            option = baker.make(Option, product=product)
+            item = baker.make(OrderItem, order=order, product=product,
+                              product_finish=baker.make(FinishOption))
+            item.option_values.set(
+                baker.make(OptionValue, option=option, _quantity=2))
+            baker.make(ComponentFinish, order_item=item, _quantity=2)
+
+    def test_unique_configuration_uses_prefetch(self):
+        """
+        Test that the unique configurations of prefetched items are
+        rendered without querying each item
+        """
+        with CaptureQueriesContext(connection) as queries:
+            labels = [item.unique_configuration for item in (
+                OrderItem.objects.select_related(
+                    'product', 'product_finish').prefetch_related(
+                    'option_values',
+                    'item_component_finishes__finish_option'))]
+        self.assertEqual(len(queries), 4)
+        self.assertCountEqual(labels, [item.unique_configuration
+                                       for item in OrderItem.objects.all()])
+
+
+class TestConcurrentItemStatusUpdates(TransactionTestCase):
+    """
+    Test case for concurrent item status updates of the same order
+    """
+
+    def test_no_updates_are_lost(self):
+        """
+        Test that concurrent status updates of the items of an order
+        through the API are applied or rejected with a conflict, never
+        lost, and that the order counts and status match the items
+        """
+        user = baker.make(User)
+        order = baker.make(Order)
+        items = baker.make(OrderItem, order=order, _quantity=4)
+        num_threads = 8
+        updates_per_thread = 15
+        barrier = threading.Barrier(num_threads)
+        applied = Counter()
+        unchanged = []
+        conflicts = []
+        errors = []
+
+        def retry_locked(request):
+            # The shared cache in-memory SQLite test database fails
+            # statements on lock contention instead of waiting, so retry
+            for _ in range(200):
+                try:
+                    return request()
+                except OperationalError as e:
+                    if 'locked' not in str(e):
+                        raise
+                    time.sleep(0.005)
+            raise AssertionError('The request was locked out')
+
+        def request(method, item, data=None):
+            # Call the view directly, as the test client re-raises the
+            # exceptions of the requests of all the threads
+            view = OrderItemViewSet.as_view({'get': 'retrieve',
+                                             'patch': 'partial_update'})
+            request = getattr(APIRequestFactory(), method)(
+                f'/api/order-items/{item.pk}/', data, format='json')
+            force_authenticate(request, user=user)
+            response = view(request, pk=item.pk)
+            response.render()
+            return response
+
+        def update_statuses(seed):
+            rng = random.Random(seed)
+            try:
+                barrier.wait()
+                for _ in range(updates_per_thread):
+                    item = rng.choice(items)
+                    version = retry_locked(
+                        lambda: request('get', item)).data['version']
+                    response = retry_locked(lambda: request(
+                        'patch', item, {'item_status': rng.randint(1, 4),
+                                        'version': version}))
+                    if response.status_code == 409:
+                        conflicts.append(item.pk)
+                    elif response.status_code != 200:
+                        errors.append(response.status_code)
+                    elif response.data['version'] == version + 1:
+                        applied[item.pk] += 1
+                    else:
+                        # The item already had the status
+                        unchanged.append(item.pk)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=update_statuses, args=[seed])
+                   for seed in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertListEqual(errors, [])
+        self.assertEqual(sum(applied.values()) + len(unchanged)
+                         + len(conflicts),
+                         num_threads * updates_per_thread)
+        # Each applied update incremented the version of its item once
+        for item in OrderItem.objects.filter(order=order):
+            self.assertEqual(item.version, applied[item.pk])
+        statuses = list(OrderItem.objects.filter(
+            order=order).values_list('item_status', flat=True))
+        order.refresh_from_db()
+        self.assertDictEqual(order.status_counts(), {
+            status: statuses.count(status)
+            for status in Order.STATUS_COUNT_FIELDS})
+        self.assertEqual(order.order_status,
+                         Order.derive_order_status(statuses))
+
+
+class TestClientIdentityKeys(TestCase):
+    """
+    Test case for the normalized client identity keys
+    """
+
+    def test_keys_are_set_on_save(self):
+        """
+        Test that the identity keys are normalized on save, including
+        saves of specific fields
+        """
+        client = ClientModel.objects.create(
+            client_name=' Jane  DOE ', client_phone='99 123 456',
+            client_email=' Jane@Example.COM')
+        client.refresh_from_db()
+        self.assertEqual(client.name_key, 'jane doe')
+        self.assertEqual(client.phone_key, '+35799123456')
+        self.assertEqual(client.email_key, 'jane@example.com')
+
+        client.client_email = 'JANE.DOE@example.com'
+        client.save(update_fields=['client_email'])
+        client.refresh_from_db()
+        self.assertEqual(client.email_key, 'jane.doe@example.com')
+
+    def test_keys_are_set_on_raw_save(self):
+        """
+        Test that the identity keys are set on raw saves, as by loaddata
+        """
+        client = ClientModel(client_name='Jane Doe',
+                             client_phone='+35799123456',
+                             client_email='Jane@Example.com',
+                             created_on=datetime.date(2024, 1, 1))
+        client.save_base(raw=True)
+        client.refresh_from_db()
+        self.assertEqual(client.name_key, 'jane doe')
+        self.assertEqual(client.email_key, 'jane@example.com')
+
+    def test_fixture_clients_are_loaded(self):
+        """
+        Test that the clients of the orders fixture load with their keys,
+        which the identity constraint requires to be distinct
+        """
+        with open(FIXTURE_PATH) as fixture:
+            clients = [obj for obj in json.load(fixture)
+                       if obj['model'] == 'orders.client']
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as fixture:
+            json.dump(clients, fixture)
+            fixture.flush()
+            call_command('loaddata', fixture.name, verbosity=0)
+
+        self.assertEqual(ClientModel.objects.count(), len(clients))
+        self.assertFalse(ClientModel.objects.filter(email_key='').exists())
+
+    def test_keys_are_set_on_queryset_update(self):
+        """
+        Test that queryset updates of the client details update the keys,
+        including updates to expressions
+        """
+        client = ClientModel.objects.create(
+            client_name='Jane Doe', client_phone='+35799123456',
+            client_email='jane@example.com')
+        ClientModel.objects.filter(pk=client.pk).update(
+            client_email='JANE.DOE@example.com', client_phone='99 654 321')
+        client.refresh_from_db()
+        self.assertEqual(client.email_key, 'jane.doe@example.com')
+        self.assertEqual(client.phone_key, '+35799654321')
+
+        ClientModel.objects.filter(pk=client.pk).update(
+            client_name=Upper('client_name'))
+        client.refresh_from_db()
+        self.assertEqual(client.client_name, 'JANE DOE')
+        self.assertEqual(client.name_key, 'jane doe')
+
+
+class TestClientUpsert(TestCase):
+    """
+    Test case for the client creation keyed on the normalized email and phone
+    """
+
+    def setUp(self):
+        self.client_data = {'client_name': 'Jane Doe',
+                            'client_phone': '+35799123456',
+                            'client_email': 'jane@example.com'}
+
+    def test_existing_client_is_reused(self):
+        """
+        Test that creating a client with the email and phone of an existing
+        client uses it, keeping its name, instead of creating a duplicate
+        """
+        client = get_update_create_client(None, None, self.client_data)
+        other_client = get_update_create_client(None, None, {
+            'client_name': 'Jane Smith',
+            'client_phone': '99 123 456',
+            'client_email': 'JANE@example.com'})
+
+        self.assertEqual(other_client.pk, client.pk)
+        self.assertEqual(other_client.client_name, 'Jane Doe')
+        self.assertEqual(ClientModel.objects.count(), 1)
+        client.refresh_from_db()
+        self.assertEqual(client.client_name, 'Jane Doe')
+
+    def test_conflicting_update_is_rejected(self):
+        """
+        Test that updating a client to the email and phone of another
+        client raises a validation error
+        """
+        get_update_create_client(None, None, self.client_data)
+        other_client = baker.make(ClientModel, client_phone='+35799000000',
+                                  client_email='other@example.com')
+
+        with self.assertRaises(ValidationError):
+            get_update_create_client('update_client', other_client.id,
+                                     self.client_data)
+        self.assertEqual(ClientModel.objects.count(), 2)
+
+
+class TestConcurrentClientUpsert(TransactionTestCase):
+    """
+    Test case for concurrent submissions of the same new client
+    """
+
+    def test_concurrent_creates_make_one_client(self):
+        """
+        Test that concurrent creations of the same client
+        create a single client
+        """
+        num_threads = 8
+        barrier = threading.Barrier(num_threads)
+        client_ids = []
+        errors = []
+
+        def upsert_client():
+            # The shared cache in-memory SQLite test database fails
+            # statements on lock contention instead of waiting, so retry
+            for _ in range(100):
+                try:
+                    return get_update_create_client(None, None, {
+                        'client_name': 'Concurrent Client',
+                        'client_phone': '+35799999999',
+                        'client_email': 'concurrent@example.com'})
+                except OperationalError as e:
+                    # Locked tables also fail the FTS5 index constructor
+                    if not ('locked' in str(e)
+                            or 'vtable constructor failed' in str(e)):
+                        raise
+                    time.sleep(0.01)
+            raise AssertionError('The client upsert was locked out')
+
+        def create_client():
+            try:
+                # Start all the creations at the same time
+                barrier.wait()
+                client_ids.append(upsert_client().pk)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=create_client)
+                   for _ in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertListEqual(errors, [])
+        self.assertEqual(ClientModel.objects.count(), 1)
+        self.assertSetEqual(set(client_ids),
+                            {ClientModel.objects.get().pk})
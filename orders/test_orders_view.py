@@ -1,9 +1,11 @@
+from django.db import connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth.models import User
 from model_bakery import baker
-from orders.models import OrderItem, Order
-from products.models import Product
+from orders.models import OrderItem, Order, ComponentFinish
+from products.models import Product, OptionValue, FinishOption
 from rest_framework import status
 
 
@@ -95,6 +97,37 @@ class TestOrderViewSet(TestCase):
         self.assertEqual(data['count'], 2,
                          "Incorrect number of orders returned")
 
+    def test_list_orders_query_count(self):
+        """
+        Test that the number of queries of the orders list does not grow
+        with the number of items and their configurations
+        """
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.list_api_url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(queries)
+
+        def make_configured_items(quantity):
+            for _ in range(quantity):
+                item = baker.make(OrderItem, order=self.order,
+                                  product=self.product,
+                                  product_finish=baker.make(FinishOption))
+                item.option_values.add(baker.make(OptionValue))
+                baker.make(ComponentFinish, order_item=item)
+                item.update_configuration()
+
+        make_configured_items(1)
+        queries = count_queries()
+        make_configured_items(12)
+        self.assertEqual(count_queries(), queries)
+
+        items = self.client.get(self.list_api_url).json()['results'][1][
+            'items']
+        self.assertEqual(items[-1]['unique_configuration'],
+                         OrderItem.objects.get(
+                             pk=items[-1]['id']).unique_configuration)
+
     def test_retrieve_order(self):
         """
         Test the retrieve endpoint for a specific order.
@@ -119,6 +152,26 @@ class TestOrderViewSet(TestCase):
         self.order2.refresh_from_db()
         self.assertEqual(self.order2.paid, 2)
 
+    def test_update_order_keeps_totals(self):
+        """
+        Test that the totals and item status counts, maintained from the
+        items, can't be changed through the API
+        """
+        data = {
+            'order_value': '1.00',
+            'discount': '0.00',
+            'items_delivered': 5,
+        }
+        order_value = self.order2.order_value
+        discount = self.order2.discount
+        response = self.client.patch(self.detail_api_url, data,
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.order2.refresh_from_db()
+        self.assertEqual(self.order2.order_value, order_value)
+        self.assertEqual(self.order2.discount, discount)
+        self.assertEqual(self.order2.items_delivered, 1)
+
     def test_update_order_status(self):
         """
         Test updating an item status of an order's item to
@@ -133,6 +186,39 @@ class TestOrderViewSet(TestCase):
         self.order2.refresh_from_db()
         self.assertEqual(self.order2.order_status, 4)
 
+    def test_update_item_returns_order_and_version(self):
+        """
+        Test that an item update returns the new item version and the
+        order status and counts updated by it
+        """
+        response = self.client.patch(self.item_api_url,
+                                     {'item_status': 4, 'version': 0},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data['version'], 1)
+        self.assertEqual(data['order']['order_status'], 4)
+        self.assertEqual(data['order']['items_delivered'], 2)
+
+    def test_update_outdated_item_conflicts(self):
+        """
+        Test that an update based on an outdated item version is rejected
+        with a conflict, without changing the item or its order
+        """
+        self.client.patch(self.item_api_url, {'priority_level': 3},
+                          content_type='application/json')
+
+        response = self.client.patch(self.item_api_url,
+                                     {'item_status': 4, 'version': 0},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertIn('changed by another user', response.json()['detail'])
+        self.order_item2.refresh_from_db()
+        self.assertEqual(self.order_item2.item_status, 2)
+        self.assertEqual(self.order_item2.version, 1)
+        self.order2.refresh_from_db()
+        self.assertEqual(self.order2.order_status, 2)
+
     def test_delete_order(self):
         """
         Test deleting an order.
@@ -27,4 +27,13 @@ urlpatterns = [
     path('api/check-client/', views.check_client, name='check_client'),
     # search_clients API, with client_name as a query parameter set in the view
     path('api/search-clients/', views.search_clients, name='search_clients'),
+    # hit rate counters of the search_clients cache of this process
+    path('api/search-clients/cache-stats/', views.search_clients_cache_stats,
+         name='search_clients_cache_stats'),
+    # create order API, with the order passed as a JSON payload
+    path('api/create-order/', views.OrderCreateAPIView.as_view(),
+         name='api_create_order'),
+    # import orders API, with the orders streamed as NDJSON lines
+    path('api/import-orders/', views.OrderImportAPIView.as_view(),
+         name='api_import_orders'),
 ]
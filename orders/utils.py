@@ -0,0 +1,359 @@
+import re
+from collections import Counter, defaultdict
+from django.db import transaction, IntegrityError
+from django.core.exceptions import ValidationError
+from products.models import (Product, OptionValue, FinishOption,
+                             ProductComponent, Component)
+from .models import (Client, Order, OrderItem, ComponentFinish,
+                     Configuration)
+
+
+# Pattern of the dynamic configuration fields added to each item form
+CONFIG_FIELD_PATTERN = re.compile(
+    r'^items-(?P<index>\d+)-(?:'
+    r'option_(?P<option_id>\d+)|'
+    r'component_finish-(?P<component_id>\d+)|'
+    r'option_finish_component-(?P<option_component_id>\d+))$')
+
+
+def parse_id(value):
+    """Convert a submitted id to an integer, returning None if invalid."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def upsert_clients(clients):
+    """
+    Inserts the unsaved clients, or uses the existing client with the same
+    normalized email and phone, keeping its details, with two queries: an
+    INSERT ... ON CONFLICT DO NOTHING, safe under concurrent submissions,
+    and a SELECT of the stored clients. A single upsert returning the
+    primary keys would still need the SELECT for the stored details, as
+    existing clients are only changed with the explicit update_client
+    action. The clients must have distinct identity keys. Sets the primary
+    key and stored details of each client, returning the clients.
+    """
+    # The only unique fields of the clients, besides the primary key, are
+    # the identity keys, so the ignored conflicts are the existing clients
+    Client.objects.bulk_create(clients, ignore_conflicts=True)
+    # Conflicting inserts do not return the primary keys, so fetch the
+    # stored clients with one query
+    stored = {
+        (client.email_key, client.phone_key): client
+        for client in Client.objects.filter(
+            email_key__in={client.email_key for client in clients},
+            phone_key__in={client.phone_key for client in clients})}
+    for client in clients:
+        stored_client = stored[(client.email_key, client.phone_key)]
+        client.pk = stored_client.pk
+        client.client_name = stored_client.client_name
+        client.name_key = stored_client.name_key
+        client.created_on = stored_client.created_on
+    return clients
+
+
+# Function to handle client creation
+def get_update_create_client(action, client_id, cleaned_data):
+    # If the user is updating the client details
+    if action == 'update_client' and client_id:
+        client = Client.objects.get(id=client_id)
+        # Update the client's details with the new form data
+        client.client_name = cleaned_data[
+            'client_name']
+        client.client_phone = cleaned_data[
+            'client_phone']
+        client.client_email = cleaned_data[
+            'client_email']
+        try:
+            # use a savepoint to recover from a conflicting update
+            with transaction.atomic():
+                client.save()
+        except IntegrityError:
+            raise ValidationError(
+                "Another client already has this email and phone number.")
+
+    elif action == 'use_existing' and client_id:
+        # Use existing client without updating details
+        client = Client.objects.get(id=client_id)
+
+    else:
+        # Create new client if no client ID or action is passed,
+        # or use the existing client with the same email and phone
+        client, = upsert_clients([Client(
+            client_name=cleaned_data['client_name'],
+            client_phone=cleaned_data['client_phone'],
+            client_email=cleaned_data['client_email']
+        )])
+
+    return client
+
+
+class ItemConfiguration:
+    """
+    Holds the configuration fields submitted for a single order item form.
+    """
+
+    def __init__(self):
+        # Selected OptionValue ids keyed by Option id
+        self.option_values = {}
+        # Selected FinishOption id keyed by Component id for the components
+        # of the product that do not depend on an option value
+        self.component_finishes = {}
+        # Selected FinishOption id keyed by Component id for the components
+        # associated with a selected option value
+        self.option_finishes = {}
+
+
+def parse_item_configurations(post):
+    """
+    Route the configuration fields of the order items formset into an
+    ItemConfiguration per form index, walking the POST data once.
+    """
+    configurations = defaultdict(ItemConfiguration)
+    for key in post:
+        match = CONFIG_FIELD_PATTERN.match(key)
+        if not match:
+            continue
+        config = configurations[match.group('index')]
+        if match.group('option_id'):
+            config.option_values[match.group('option_id')] = \
+                post.getlist(key)
+        elif match.group('component_id'):
+            config.component_finishes[match.group('component_id')] = \
+                post.get(key)
+        else:
+            config.option_finishes[match.group('option_component_id')] = \
+                post.get(key)
+    return configurations
+
+
+class OrderCatalog:
+    """
+    Resolves every catalog object referenced by an order submission with one
+    query per model, so the configuration of each order item can be
+    validated in memory.
+    """
+
+    def __init__(self, option_value_ids=(), component_ids=(),
+                 finish_option_ids=(), product_ids=()):
+        # Ignore ids that are not integers, these fail validation later
+        option_value_ids = {parse_id(i) for i in option_value_ids} - {None}
+        component_ids = {parse_id(i) for i in component_ids} - {None}
+        finish_option_ids = {parse_id(i) for i in finish_option_ids} - {None}
+        product_ids = {parse_id(i) for i in product_ids} - {None}
+
+        self.products = (Product.objects.in_bulk(product_ids)
+                         if product_ids else {})
+        self.option_values = OptionValue.objects.select_related(
+            'option').in_bulk(option_value_ids)
+        self.components = Component.objects.in_bulk(component_ids)
+        self.finish_options = FinishOption.objects.in_bulk(finish_option_ids)
+
+        # Map the components that depend on an option value to their
+        # (product, option value) pair
+        self.option_components = defaultdict(list)
+        product_components = ProductComponent.objects.filter(
+            option_value_id__in=option_value_ids
+        ).select_related('component').order_by('id')
+        for pc in product_components:
+            self.option_components[(pc.product_id, pc.option_value_id)
+                                   ].append(pc.component)
+
+    @classmethod
+    def from_configurations(cls, configurations):
+        """
+        Build the catalog from the item configurations of all the forms
+        of the order items formset.
+        """
+        option_value_ids = []
+        component_ids = []
+        finish_option_ids = []
+        for config in configurations:
+            for value_ids in config.option_values.values():
+                option_value_ids.extend(value_ids)
+            for finishes in (config.component_finishes,
+                             config.option_finishes):
+                component_ids.extend(finishes.keys())
+                finish_option_ids.extend(finishes.values())
+        return cls(option_value_ids, component_ids, finish_option_ids)
+
+    @classmethod
+    def from_items(cls, items):
+        """
+        Build the catalog from the order items data of the order creation
+        API and imports.
+        """
+        return cls(
+            option_value_ids=[ov for item in items
+                              for ov in item['option_values']],
+            component_ids=[cf['component'] for item in items
+                           for cf in item['component_finishes']],
+            finish_option_ids=[cf['finish_option'] for item in items
+                               for cf in item['component_finishes']],
+            product_ids=[item['product'] for item in items])
+
+    def resolve_items(self, items):
+        """
+        Validate the order items data of the order creation API and imports,
+        replacing the submitted ids with the catalog objects in place.
+        Returns a list with the errors of each item.
+        """
+        errors = []
+        for item in items:
+            try:
+                item['product'] = self.get_product(item['product'])
+                item['option_values'] = [
+                    self.get_product_option_value(ov, item['product'].id)
+                    for ov in item['option_values']]
+                item['component_finishes'] = [
+                    (self.get_component(cf['component']),
+                     self.get_finish_option(cf['finish_option']))
+                    for cf in item['component_finishes']]
+                # Default to the product's base price
+                item.setdefault('base_price', item['product'].base_price)
+                if (item.get('discount') or 0) > item['base_price']:
+                    raise ValidationError(
+                        "The discount exceeds the base price.")
+                errors.append({})
+            except ValidationError as e:
+                errors.append({'non_field_errors': e.messages})
+        return errors
+
+    def get_option_value(self, value_id, option_id):
+        """
+        Return the OptionValue, validating that it exists and that it is
+        associated with the Option.
+        """
+        option_value = self.option_values.get(parse_id(value_id))
+        if (option_value is None or
+                option_value.option_id != parse_id(option_id)):
+            raise ValidationError(
+                f"Invalid option value selected: {value_id}")
+        return option_value
+
+    def get_product(self, product_id):
+        """Return the Product, validating that it exists."""
+        product = self.products.get(parse_id(product_id))
+        if product is None:
+            raise ValidationError(f"Invalid product selected: {product_id}")
+        return product
+
+    def get_product_option_value(self, value_id, product_id):
+        """
+        Return the OptionValue, validating that it exists and that it is
+        an option of the Product.
+        """
+        option_value = self.option_values.get(parse_id(value_id))
+        if (option_value is None or
+                option_value.option.product_id != parse_id(product_id)):
+            raise ValidationError(
+                f"Invalid option value selected: {value_id}")
+        return option_value
+
+    def get_component(self, component_id):
+        """Return the Component, validating that it exists."""
+        component = self.components.get(parse_id(component_id))
+        if component is None:
+            raise ValidationError(
+                f"Invalid component selected: {component_id}")
+        return component
+
+    def get_finish_option(self, finish_option_id):
+        """Return the FinishOption, validating that it exists."""
+        finish_option = self.finish_options.get(parse_id(finish_option_id))
+        if finish_option is None:
+            raise ValidationError(
+                f"Invalid finish option selected: {finish_option_id}")
+        return finish_option
+
+    def get_option_components(self, product_id, option_value_id):
+        """
+        Return the components of the product that are associated with
+        the option value.
+        """
+        return self.option_components.get(
+            (product_id, parse_id(option_value_id)), [])
+
+
+def build_order_items(order, items_data):
+    """
+    Builds the unsaved order items of a new order from the resolved items
+    data of the order creation API and imports, with a copy of the item per
+    unit of quantity, and sets the order's derived fields from them.
+    Returns the items in the format expected by bulk_create_order_items.
+    """
+    items = []
+    for item_data in items_data:
+        option_value_ids = [ov.id for ov in item_data['option_values']]
+        finishes = [(component.id, finish_option.id)
+                    for component, finish_option
+                    in item_data['component_finishes']]
+        for _ in range(item_data['quantity']):
+            order_item = OrderItem(
+                order=order,
+                product=item_data['product'],
+                base_price=item_data['base_price'],
+                discount=item_data.get('discount'),
+                item_status=item_data.get('item_status', 1),
+                priority_level=item_data['priority_level'],
+            )
+            order_item.calculate_item_value()
+            items.append((order_item, option_value_ids, finishes))
+
+    # Set the order totals, item status counts and status from the items
+    # in memory
+    order_items = [order_item for order_item, _, _ in items]
+    order.order_value = sum(item.item_value for item in order_items)
+    order.discount = sum(item.discount or 0 for item in order_items)
+    status_counts = Counter(item.item_status for item in order_items)
+    for status, field in Order.STATUS_COUNT_FIELDS.items():
+        setattr(order, field, status_counts[status])
+    order.order_status = Order.status_from_counts(status_counts)
+    return items
+
+
+def bulk_create_order_items(items):
+    """
+    Inserts new order items along with their option values and component
+    finishes, using one bulk query per table.
+    Takes a list of (order_item, option_value_ids, component_finishes)
+    tuples, where order_item is an unsaved OrderItem of a saved Order and
+    component_finishes a list of (component_id, finish_option_id) pairs.
+    As bulk inserts bypass the OrderItem.save hooks, the item derived fields
+    and configurations are set here and the caller is responsible for the
+    order's derived fields.
+    """
+    for order_item, _, _ in items:
+        order_item.calculate_item_value()
+        order_item.update_completed()
+    # The configurations are known, so intern them all before the insert
+    for (order_item, _, _), configuration_id in zip(
+            items, Configuration.objects.intern([
+                (order_item.product_id, option_value_ids,
+                 order_item.product_finish_id, finishes)
+                for order_item, option_value_ids, finishes in items])):
+        order_item.configuration_id = configuration_id
+
+    with transaction.atomic():
+        order_items = OrderItem.objects.bulk_create(
+            [order_item for order_item, _, _ in items])
+
+        OptionValueLink = OrderItem.option_values.through
+        OptionValueLink.objects.bulk_create([
+            OptionValueLink(orderitem_id=order_item.id,
+                            optionvalue_id=option_value_id)
+            for order_item, (_, option_value_ids, _) in zip(order_items, items)
+            for option_value_id in set(option_value_ids)
+        ])
+
+        ComponentFinish.objects.bulk_create([
+            ComponentFinish(order_item_id=order_item.id,
+                            component_id=component_id,
+                            finish_option_id=finish_option_id)
+            for order_item, (_, _, finishes) in zip(order_items, items)
+            for component_id, finish_option_id in finishes
+        ])
+
+    return order_items
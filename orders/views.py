@@ -1,4 +1,3 @@
-import re
 import json
 from django.shortcuts import render, get_object_or_404, redirect
 from django.core.exceptions import ValidationError
@@ -10,18 +9,29 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db import transaction
 from django.db.models import Count, Q, Prefetch
-from rest_framework import viewsets, permissions, status, response
+from rest_framework import (viewsets, generics, permissions, status,
+                            response)
 from rest_framework.decorators import action
+from rest_framework.views import APIView
 from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
 from slotted_need.views import BaseLoginRequiredView
-from .models import Client, Order, OrderItem, ComponentFinish
+from slotted_need.tracking import ConcurrentUpdateError
+from .models import (Client, Order, OrderItem, ComponentFinish,
+                     defer_order_updates, apply_order_delta)
 from products.models import (Product, Option, OptionValue, FinishOption,
                              ProductComponent, Component, Finish)
 from .forms import OrderForm, OrderItemFormSet
+from .normalizers import normalize_name, normalize_phone, normalize_email
 from .filters import OrderItemFilter, OrderFilter
-from .serializers import OrderItemSerializer, OrderSerializer
+from .serializers import (OrderItemSerializer, OrderSerializer,
+                          OrderCreateSerializer)
+from .imports import OrderImporter
+from .search import find_clients
+from .caches import client_search_cache
+from .utils import (OrderCatalog, parse_item_configurations,
+                    get_update_create_client)
 
 
 @require_POST
@@ -32,11 +42,16 @@ def check_client(request):
         client_phone = request.POST.get('client_phone')
         client_email = request.POST.get('client_email')
 
+        # Normalize the client details to match the indexed identity keys
+        name_key = normalize_name(client_name)
+        phone_key = normalize_phone(client_phone)
+        email_key = normalize_email(client_email)
+
         # Check for an exact match
         exact_match = Client.objects.filter(
-            client_name__iexact=client_name,
-            client_phone__iexact=client_phone,
-            client_email__iexact=client_email
+            name_key=name_key,
+            phone_key=phone_key,
+            email_key=email_key
         ).first()
 
         if exact_match:
@@ -44,12 +59,15 @@ def check_client(request):
                 'id': exact_match.id,
             }})
 
-        # Check for partial match (name, phone or email)
-        partial_match = Client.objects.filter(
-            Q(client_name__iexact=client_name) |
-            (Q(client_phone__iexact=client_phone) |
-             Q(client_email__iexact=client_email))
-        ).first()
+        # Check for partial match (name, phone or email),
+        # ignoring blank details
+        partial_filters = Q()
+        for field, key in (('name_key', name_key), ('phone_key', phone_key),
+                           ('email_key', email_key)):
+            if key:
+                partial_filters |= Q(**{field: key})
+        partial_match = (Client.objects.filter(partial_filters).first()
+                         if partial_filters else None)
 
         if partial_match:
             return JsonResponse({'partial_match': {
@@ -63,35 +81,6 @@ def check_client(request):
         return JsonResponse({'exact_match': False, 'partial_match': False})
 
 
-# Function to handle client creation
-def get_update_create_client(action, client_id, cleaned_data):
-    # If the user is updating the client details
-    if action == 'update_client' and client_id:
-        client = Client.objects.get(id=client_id)
-        # Update the client's details with the new form data
-        client.client_name = cleaned_data[
-            'client_name']
-        client.client_phone = cleaned_data[
-            'client_phone']
-        client.client_email = cleaned_data[
-            'client_email']
-        client.save()
-
-    elif action == 'use_existing' and client_id:
-        # Use existing client without updating details
-        client = Client.objects.get(id=client_id)
-
-    else:
-        # Create new client if no client ID or action is passed
-        client = Client.objects.create(
-            client_name=cleaned_data['client_name'],
-            client_phone=cleaned_data['client_phone'],
-            client_email=cleaned_data['client_email']
-        )
-
-    return client
-
-
 # View to handle the create order form
 @login_required
 def create_order(request):
@@ -119,24 +108,32 @@ def create_order(request):
                                                       client_id,
                                                       order_form.cleaned_data)
 
-                    # Capture calculated totals from the form
-                    order_value = order_form.cleaned_data.get('order_value', 0)
+                    # Capture the deposit from the form, the totals are
+                    # added to the order as its items are saved
                     deposit = order_form.cleaned_data['deposit']
 
                     # proceed to create order object
                     order = Order.objects.create(
                         client=client,
-                        order_value=order_value,
                         deposit=deposit
                     )
 
-                    # Now bind the formset to the saved Order instance
-                    order_item_formset = OrderItemFormSet(
-                        request.POST, instance=order)
-
-                    # Validate the formset again with the correct instance
-                    if order_item_formset.is_valid():
-
+                    # Reuse the formset validated against the unsaved Order,
+                    # binding it to the saved instance to persist the items
+                    order_item_formset.instance = order
+
+                    # Route the configuration fields of each item form
+                    # in a single pass over the POST data
+                    configurations = parse_item_configurations(request.POST)
+                    # Resolve all the catalog objects referenced by the
+                    # items configurations with one query per model
+                    catalog = OrderCatalog.from_configurations(
+                        configurations.values())
+
+                    # Defer the order status updates of each item save and
+                    # recompute the order's derived status and totals once
+                    # all the items and their copies are saved
+                    with defer_order_updates():
                         # process each form in the formset
                         # to save the order items
                         for form in order_item_formset:
@@ -148,38 +145,35 @@ def create_order(request):
                             order_item.order = order
                             order_item.save()
                             form.save_m2m()
-                            # Get the form index
+                            # Get the configuration fields of the form
                             form_index = form.prefix.split('-')[1]
+                            config = configurations[form_index]
                             # Process option values
-                            process_option_values(request,
-                                                  form_index,
-                                                  order_item)
+                            option_value_ids = process_option_values(
+                                config, order_item, catalog)
                             # Process component finishes
-                            process_component_finishes(request,
-                                                       form_index,
-                                                       order_item)
+                            process_component_finishes(config,
+                                                       order_item,
+                                                       catalog)
                             # Process option finishes
-                            process_option_finishes(request,
-                                                    form_index,
-                                                    order_item)
+                            process_option_finishes(config,
+                                                    order_item,
+                                                    option_value_ids,
+                                                    catalog)
                             # Create additional order items instances
                             # based on quantity with same configurations
-                            for _ in range(quantity - 1):
-                                copy_order_item(order_item)
+                            copy_order_item(order_item, copies=quantity - 1)
 
-                        # notify user with success message
-                        messages.success(request,
-                                         'Order created successfully!')
+                    # Intern the configurations of all the items once their
+                    # option values and finishes are saved
+                    order.items.all().update_configurations()
 
-                        # Redirect to the same page to avoid form resubmission
-                        return redirect('create_order')
+                    # notify user with success message
+                    messages.success(request,
+                                     'Order created successfully!')
 
-                    else:
-                        # If formset is invalid after binding to the
-                        # saved Order, show errors
-                        messages.error(request,
-                                       'Please correct the errors in the order'
-                                       ' items.')
+                    # Redirect to the same page to avoid form resubmission
+                    return redirect('create_order')
 
             # catch any other errors as validation errors
             except ValidationError as e:
@@ -211,69 +205,34 @@ def create_order(request):
 
 
 # *** HELPER FUNCTIONS ***
-def process_option_values(request, form_index, order_item):
-    # Define field naming pattern
-    option_field_pattern = re.compile(
-        rf'^items-{form_index}-option_\d+$')
-
-    # Get option field names
-    option_field_names = [
-        key for key in request.POST
-        if option_field_pattern.match(key)]
-
+def process_option_values(config, order_item, catalog):
     # Initialise emtpy list of option values
     selected_option_value_ids = []
 
-    # Loop through field names
-    for field_name in option_field_names:
-        # Extract the option_id
-        option_id = field_name.split('-option_')[1]
-        # Get the selected values for this option
-        selected_values = request.POST.getlist(field_name)
+    # Loop through the selected values of each option
+    for option_id, selected_values in config.option_values.items():
         # Validate and collect the selected OptionValue IDs
         for value_id in selected_values:
             # Validate that the OptionValue exists and
             # is associated with the Option
-            if not OptionValue.objects.filter(id=value_id,
-                                              option_id=option_id).exists():
-                raise ValidationError(
-                    f"Invalid option value selected: {value_id}")
-            selected_option_value_ids.append(value_id)
+            option_value = catalog.get_option_value(value_id, option_id)
+            selected_option_value_ids.append(option_value.id)
 
     # Associate option values with the order item
     order_item.option_values.set(selected_option_value_ids)
 
+    return selected_option_value_ids
 
-def process_component_finishes(request, form_index, order_item):
-    # Define field naming pattern
-    comp_finish_field_pattern = re.compile(
-        rf'^items-{form_index}-component_finish-\d+$')
-    # Get component finish fields
-    comp_finish_field_names = [key for key in request.POST
-                               if comp_finish_field_pattern.match(key)]
-
-    for field_name in comp_finish_field_names:
-        # Extract the component_id
-        component_id = field_name.split('-component_finish-')[1]
-        finish_option_id = request.POST.get(field_name)
 
+def process_component_finishes(config, order_item, catalog):
+    for component_id, finish_option_id in config.component_finishes.items():
         # Skip this field if no finish option is selected
         if not finish_option_id:
             continue
 
-        # Validate the Component
-        if not Component.objects.filter(id=component_id).exists():
-            raise ValidationError(
-                f"Invalid component selected: {component_id}")
-
-        # Validate the FinishOption
-        if not FinishOption.objects.filter(id=finish_option_id).exists():
-            raise ValidationError(
-                f"Invalid finish option selected: "
-                f"{finish_option_id}")
-
-        component = Component.objects.get(id=component_id)
-        finish_option = FinishOption.objects.get(id=finish_option_id)
+        # Validate the Component and the FinishOption
+        component = catalog.get_component(component_id)
+        finish_option = catalog.get_finish_option(finish_option_id)
 
         # Associate the finish option with the component and order item
         order_item.item_component_finishes.create(
@@ -282,37 +241,24 @@ def process_component_finishes(request, form_index, order_item):
         )
 
 
-def process_option_finishes(request, form_index, order_item):
-    # get selected OptionValue ids
-    selected_option_value_ids = order_item.option_values.values_list(
-        'id', flat=True)
-    # loop through OptionValue ids
+def process_option_finishes(config, order_item, selected_option_value_ids,
+                            catalog):
+    # loop through the selected OptionValue ids
     for option_value_id in selected_option_value_ids:
-        # Find ProductComponents associated with this OptionValue
-        product_components = ProductComponent.objects.filter(
-            product=order_item.product,
-            option_value_id=option_value_id
-        )
+        # Find the components of the product associated with this OptionValue
+        components = catalog.get_option_components(order_item.product_id,
+                                                   option_value_id)
 
-        # loop through relevant product components
-        for pc in product_components:
-            component = pc.component
-            # Build field name
-            field_name = (f'items-{form_index}-option_finish_'
-                          f'component-{component.id}')
-            finish_option_id = request.POST.get(field_name)
+        # loop through relevant components
+        for component in components:
+            finish_option_id = config.option_finishes.get(str(component.id))
 
             # Skip if no finish option is selected
             if not finish_option_id:
                 continue
 
             # Validate the FinishOption
-            if not FinishOption.objects.filter(id=finish_option_id).exists():
-                raise ValidationError(
-                    f"Invalid finish option selected: "
-                    f"{finish_option_id}")
-
-            finish_option = FinishOption.objects.get(id=finish_option_id)
+            finish_option = catalog.get_finish_option(finish_option_id)
 
             # Associate the finish option with the component and order item
             order_item.item_component_finishes.create(
@@ -321,30 +267,63 @@ def process_option_finishes(request, form_index, order_item):
             )
 
 
-def copy_order_item(order_item):
+def copy_order_item(order_item, copies=1):
     """
-    Creates an instance copy of the given OrderItem with the same
-    option_values and ComponentFinishes.
+    Creates the given number of instance copies of the given OrderItem with
+    the same option_values, ComponentFinishes and configuration.
+    The copies, their option value links and their ComponentFinishes are
+    inserted with one bulk query each, so the number of queries does not grow
+    with the quantity. As bulk inserts bypass the OrderItem.save hooks, the
+    copies are added to the order's totals, item status counts and status
+    here, deferred to the end of the caller's batch of order updates, if
+    any.
     """
-    order_item_copy = OrderItem.objects.create(
-        order=order_item.order,
-        product=order_item.product,
-        base_price=order_item.base_price,
-        discount=order_item.discount,
-        item_value=order_item.item_value,
-    )
-    # set the same option values
-    order_item_copy.option_values.set(
-        order_item.option_values.all())
-    # Duplicate ComponentFinishes
-    for icf in order_item.item_component_finishes.\
-            all():
-        ComponentFinish.objects.create(
-            order_item=order_item_copy,
-            component=icf.component,
-            finish_option=icf.finish_option,
+    if copies < 1:
+        return []
+
+    # Insert all the copies in one query
+    order_item_copies = OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order_item.order,
+            product=order_item.product,
+            base_price=order_item.base_price,
+            discount=order_item.discount,
+            item_value=order_item.item_value,
+            product_finish=order_item.product_finish,
+            configuration_id=order_item.configuration_id,
         )
-    return order_item_copy
+        for _ in range(copies)
+    ])
+    # Add the copies to the order's totals and item status counts
+    apply_order_delta(order_item.order_id,
+                      copies * order_item.item_value,
+                      copies * (order_item.discount or 0),
+                      {order_item_copies[0].item_status: copies})
+
+    # set the same option values through the M2M linking table
+    option_value_ids = list(
+        order_item.option_values.values_list('id', flat=True))
+    OptionValueLink = OrderItem.option_values.through
+    OptionValueLink.objects.bulk_create([
+        OptionValueLink(orderitem_id=order_item_copy.id,
+                        optionvalue_id=option_value_id)
+        for order_item_copy in order_item_copies
+        for option_value_id in option_value_ids
+    ])
+
+    # Duplicate ComponentFinishes
+    component_finishes = list(
+        order_item.item_component_finishes.values_list(
+            'component_id', 'finish_option_id'))
+    ComponentFinish.objects.bulk_create([
+        ComponentFinish(order_item=order_item_copy,
+                        component_id=component_id,
+                        finish_option_id=finish_option_id)
+        for order_item_copy in order_item_copies
+        for component_id, finish_option_id in component_finishes
+    ])
+
+    return order_item_copies
 
 
 # *** ORDER LIST VIEW ***
@@ -515,9 +494,9 @@ def search_clients(request):
         # get query path parameter from request url
         query = request.GET.get('q', '')
         if query:
-            # filter the client objects based on client name,
-            # limit to 10 results
-            clients = Client.objects.filter(client_name__icontains=query)[:10]
+            # search the client names, emails and phone numbers with the
+            # client search index, limit to the 10 best matches
+            clients = find_clients(query, limit=10)
             # create client data using list comprehension
             client_data = [
                 {'name': client.client_name,
@@ -533,6 +512,13 @@ def search_clients(request):
     return JsonResponse({'error': 'POST method not allowed'}, status=405)
 
 
+# API function returning the hit rate counters of the client search cache
+@login_required
+@require_GET
+def search_clients_cache_stats(request):
+    return JsonResponse(client_search_cache.stats())
+
+
 # define pagination class
 class Pagination(PageNumberPagination):
     page_size_query_param = 'page_size'  # Maps to 'page_size' from DataTables
@@ -566,6 +552,24 @@ class OrderItemViewSet(viewsets.ModelViewSet, LoginRequiredMixin):
     ]
     ordering = ['-priority_level']  # Default ordering
 
+    def update(self, request, *args, **kwargs):
+        try:
+            # Update the item and its order together
+            with transaction.atomic():
+                return super().update(request, *args, **kwargs)
+        except ConcurrentUpdateError:
+            # The item changed since it was fetched or loaded
+            return response.Response(
+                {'detail': 'The item was changed by another user. '
+                           'Reload it and try again.'},
+                status=status.HTTP_409_CONFLICT
+            )
+
+    def perform_update(self, serializer):
+        serializer.save()
+        # Return the order status and totals updated by the item change
+        serializer.instance.order.refresh_derived_fields()
+
     # Define fetching queryset process
     def get_queryset(self):
         # Start with the base queryset
@@ -600,7 +604,8 @@ class OrderItemViewSet(viewsets.ModelViewSet, LoginRequiredMixin):
             'order__client',
             'product',
             'product_finish',
-            'product_finish__finish'
+            'product_finish__finish',
+            'configuration'
         ).prefetch_related(
             'option_values',
             Prefetch(
@@ -684,8 +689,16 @@ class OrderViewSet(viewsets.ModelViewSet,
     """
     A ViewSet for viewing and editing Order instances.
     """
-    # fetch queryset with optimised query for related objects
-    queryset = Order.objects.prefetch_related('items').all().order_by('-id')
+    # fetch queryset with optimised query for related objects, including
+    # the related objects of the serialized items
+    queryset = Order.objects.select_related('client').prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related(
+            'product', 'product_finish__finish', 'configuration')),
+        'items__option_values',
+        Prefetch('items__item_component_finishes',
+                 queryset=ComponentFinish.objects.select_related(
+                     'finish_option__finish', 'component')),
+    ).all().order_by('-id')
     serializer_class = OrderSerializer
     pagination_class = Pagination
     permission_classes = [permissions.IsAuthenticated]
@@ -765,6 +778,56 @@ class OrderViewSet(viewsets.ModelViewSet,
                                  status=status.HTTP_200_OK)
 
 
+# API view to create an order with its client and items from a JSON payload
+class OrderCreateAPIView(generics.CreateAPIView):
+    """
+    Creates an order from a nested JSON payload, without going through
+    the order form and formset.
+    """
+    serializer_class = OrderCreateSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        order = serializer.save()
+
+        # Return response
+        return response.Response(
+            {'success': True,
+             'message': f'Order {order.id} created.',
+             'id': order.id,
+             'order_value': order.order_value},
+            status=status.HTTP_201_CREATED
+        )
+
+
+# API view to import orders streamed as NDJSON, one order per line
+class OrderImportAPIView(APIView):
+    """
+    Imports the orders of an NDJSON request body in chunks of the
+    'chunk_size' query parameter, skipping already imported orders.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, format=None):
+        try:
+            chunk_size = int(request.query_params.get('chunk_size', 500))
+            if chunk_size < 1:
+                raise ValueError
+        except ValueError:
+            return response.Response(
+                {'error': 'Invalid chunk_size. Must be a positive integer.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Stream the lines of the request body
+        lines = request.stream if request.stream is not None else []
+        summary = OrderImporter(chunk_size=chunk_size).run(lines)
+
+        return response.Response(summary, status=status.HTTP_200_OK)
+
+
 class OrderListView(TemplateView,
                     BaseLoginRequiredView,
                     ):
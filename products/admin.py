@@ -1,7 +1,8 @@
 import nested_admin
 from django.contrib import admin
 from .models import (Product, Option, OptionValue, Component, Finish,
-                     FinishOption, ProductComponent, ComponentPart)
+                     FinishOption, ProductComponent, ComponentPart,
+                     defer_cost_rollup)
 
 
 # Define the ProductAdmin page with OptionInline to add Options in same view
@@ -15,6 +16,7 @@ class ProductAdmin(nested_admin.NestedModelAdmin):
         class OptionValueInline(nested_admin.NestedTabularInline):
             model = OptionValue
             extra = 0
+            readonly_fields = ['component_cost']
 
             # Optimize OptionValue queryset to avoid N+1 issues
             def get_queryset(self, request):
@@ -33,7 +35,7 @@ class ProductAdmin(nested_admin.NestedModelAdmin):
     class ProductComponentInline(nested_admin.NestedStackedInline):
         model = ProductComponent
         extra = 0
-        readonly_fields = ['component_unit_measurement']
+        readonly_fields = ['component_unit_measurement', 'line_cost']
 
         # Method to display the related unit_measurement from Component
         def component_unit_measurement(self, obj):
@@ -42,7 +44,7 @@ class ProductAdmin(nested_admin.NestedModelAdmin):
             return "-"
         component_unit_measurement.short_description = 'Unit Measurement'
         fields = ['component', 'option_value', 'quantity',
-                  'component_unit_measurement']
+                  'component_unit_measurement', 'line_cost']
 
         # Optimize ProductComponent queryset to avoid N+1 issues
         def get_queryset(self, request):
@@ -68,7 +70,9 @@ class ProductAdmin(nested_admin.NestedModelAdmin):
             return super().formfield_for_foreignkey(db_field, request,
                                                     **kwargs)
 
-    list_display = ('name', 'slug', 'description', 'base_price',)
+    list_display = ('name', 'slug', 'description', 'base_price',
+                    'component_cost',)
+    readonly_fields = ['component_cost']
     inlines = [OptionInline, ProductComponentInline, ]
 
     # Allows for the selection of multiple finishes
@@ -83,6 +87,11 @@ class ProductAdmin(nested_admin.NestedModelAdmin):
         return queryset.prefetch_related('options', 'options__values',
                                          'components', 'finishes')
 
+    def save_related(self, request, form, formsets, change):
+        # Roll the costs of the saved product components up once
+        with defer_cost_rollup():
+            super().save_related(request, form, formsets, change)
+
 
 # Define the ComponentAdmin page to add components
 @admin.register(Component)
@@ -103,17 +112,11 @@ class ComponentAdmin(nested_admin.NestedModelAdmin):
     list_filter = ('supplier_details', )
     prepopulated_fields = {'slug': ('name',)}
 
-    def save_model(self, request, obj, form, change):
-        # Save the Component object first
-        super().save_model(request, obj, form, change)
-
     def save_related(self, request, form, formsets, change):
-        # Save the related ComponentParts after saving the Component
-        super().save_related(request, form, formsets, change)
-        # Recalculate unit cost for the component
-        obj = form.instance  # Get the Component instance
-        obj.calculate_unit_cost()
-        obj.save()
+        # Roll the costs of the saved ComponentParts up once, to the unit
+        # cost of the component and the costs of its products
+        with defer_cost_rollup():
+            super().save_related(request, form, formsets, change)
 
 
 @admin.register(Finish)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from products.models import Component, Product, rollup_costs
+
+
+class Command(BaseCommand):
+    help = ("Recalculate the stored costs of all the components, product "
+            "components, products and option values, e.g. after queryset "
+            "updates bypassing the cost rollup of the model saves.")
+
+    def handle(self, *args, **options):
+        component_ids = set(Component.objects.values_list('pk', flat=True))
+        product_ids = set(Product.objects.values_list('pk', flat=True))
+        rollup_costs(component_ids, product_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up the costs of {len(component_ids)} components and "
+            f"{len(product_ids)} products."))
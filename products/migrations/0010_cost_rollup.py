@@ -0,0 +1,63 @@
+# Generated by Django 5.1 on 2026-10-18 08:21
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import (ExpressionWrapper, F, OuterRef, Subquery, Sum,
+                              Value)
+from django.db.models.functions import Coalesce
+
+
+def rollup_costs(apps, schema_editor):
+    """
+    Calculate the line costs of the existing product components, and the
+    component costs of the products and option values from them.
+    """
+    Component = apps.get_model('products', 'Component')
+    ProductComponent = apps.get_model('products', 'ProductComponent')
+    Product = apps.get_model('products', 'Product')
+    OptionValue = apps.get_model('products', 'OptionValue')
+    cost = models.DecimalField(max_digits=10, decimal_places=2)
+    zero = Value(Decimal('0.00'))
+
+    ProductComponent.objects.update(line_cost=ExpressionWrapper(
+        F('quantity') * Subquery(Component.objects.filter(
+            pk=OuterRef('component')).values('unit_cost')),
+        output_field=cost))
+    product_lines = ProductComponent.objects.filter(
+        product=OuterRef('pk'), option_value__isnull=True
+    ).order_by().values('product')
+    Product.objects.update(component_cost=Coalesce(Subquery(
+        product_lines.annotate(total=Sum('line_cost')).values('total')),
+        zero))
+    option_lines = ProductComponent.objects.filter(
+        option_value=OuterRef('pk')).order_by().values('option_value')
+    OptionValue.objects.update(component_cost=Coalesce(Subquery(
+        option_lines.annotate(total=Sum('line_cost')).values('total')),
+        zero))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_component_unit_measurement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='optionvalue',
+            name='component_cost',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='component_cost',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='productcomponent',
+            name='line_cost',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.RunPython(rollup_costs,
+                             reverse_code=migrations.RunPython.noop),
+    ]
@@ -1,5 +1,13 @@
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
 from django.db import models
+from django.db.models import (DecimalField, Exists, ExpressionWrapper, F,
+                              OuterRef, Subquery, Sum, Value)
+from django.db.models.functions import Coalesce, NullIf
 from django.core.validators import MinValueValidator
+from slotted_need.caches import bump_data_version
+from slotted_need.tracking import TrackedFieldsMixin
 
 
 class Finish(models.Model):
@@ -15,7 +23,7 @@ class Finish(models.Model):
         return self.name
 
 
-class FinishOption(models.Model):
+class FinishOption(TrackedFieldsMixin, models.Model):
     finish = models.ForeignKey(Finish, related_name='options',
                                on_delete=models.CASCADE)
     name = models.CharField(max_length=50)
@@ -27,7 +35,7 @@ class FinishOption(models.Model):
 # Create a ComponentPart model class for defining the lowest granular level of
 # parts that make up a complete Component
 
-class ComponentPart(models.Model):
+class ComponentPart(TrackedFieldsMixin, models.Model):
     """Represents the most granular parts of a component."""
     name = models.CharField(max_length=50, unique=True)
     slug = models.SlugField(max_length=50, unique=True)
@@ -47,9 +55,31 @@ class ComponentPart(models.Model):
     def __str__(self):
         return f"{self.name} x {self.quantity} | @ €{self.unit_cost}"
 
+    def save(self, *args, **kwargs):
+        # Only a new part, or a change of its cost, quantity or component,
+        # changes the cost of its component
+        changed_fields = self.changed_fields()
+        cost_changed = (changed_fields is None or self._state.adding
+                        or bool({'unit_cost', 'quantity', 'component'}
+                                & changed_fields))
+        saved_component_id = self.__dict__.get(
+            '_field_snapshot', {}).get('component', self.component_id)
+
+        super().save(*args, **kwargs)
+
+        if cost_changed:
+            rollup_costs(component_ids={saved_component_id,
+                                        self.component_id})
+
+    def delete(self, *args, **kwargs):
+        component_id = self.component_id
+        deleted = super().delete(*args, **kwargs)
+        rollup_costs(component_ids={component_id})
+        return deleted
+
 
 # Create a Component model class as related class to Product model
-class Component(models.Model):
+class Component(TrackedFieldsMixin, models.Model):
     name = models.CharField(max_length=50, unique=True)
     slug = models.SlugField(max_length=50, unique=True)
     description = models.TextField(blank=True, null=True)
@@ -77,37 +107,34 @@ class Component(models.Model):
     def __str__(self):
         return f"{self.name}"
 
-    def calculate_unit_cost(self):
-        """
-        If the component has parts, calculate the total unit cost as the sum
-        of the unit costs of its parts multiplied by the quantity of each part.
-        """
-        parts = self.parts.all()
-        if parts.exists():
-            total_cost = 0
-            for part in parts:
-                if part.unit_cost is not None:
-                    total_cost += part.unit_cost * part.quantity
-            self.unit_cost = total_cost if total_cost > 0 else None
-        return self.unit_cost
-
     def save(self, *args, **kwargs):
         """
-        Ensures unit cost is calculated and updated after related
-        ComponentPart objects are saved.
+        Rolls the changes of the unit cost up to the costs of the products
+        using the component. The unit cost of a component with parts is
+        calculated from them, and only an existing Component can have parts.
         """
-        # Save the Component first to ensure it has a primary key
+        changed_fields = self.changed_fields()
+        cost_changed = not self._state.adding and (
+            changed_fields is None or 'unit_cost' in changed_fields)
+
+        # save the changed fields of the Component object
         super().save(*args, **kwargs)
 
-        # Calculate the unit cost after saving the related parts
-        self.calculate_unit_cost()
+        if cost_changed and rollup_costs(component_ids={self.pk}):
+            # Reload the unit cost calculated from the parts, if any
+            self.refresh_from_db(fields=['unit_cost'])
 
-        # Save again after calculating unit cost
-        super().save(*args, **kwargs)
+    def delete(self, *args, **kwargs):
+        # The products using the component, which cost it no longer adds to
+        product_ids = set(self.productcomponent_set.values_list(
+            'product_id', flat=True))
+        deleted = super().delete(*args, **kwargs)
+        rollup_costs(product_ids=product_ids)
+        return deleted
 
 
 # Create Product model class as the main parent model
-class Product(models.Model):
+class Product(TrackedFieldsMixin, models.Model):
     name = models.CharField(max_length=50, unique=True)
     slug = models.SlugField(max_length=50, unique=True)
     description = models.TextField(blank=True, null=True)
@@ -118,6 +145,10 @@ class Product(models.Model):
                                         related_name='products')
     finishes = models.ManyToManyField(Finish, blank=True,
                                       related_name='products')
+    # Cost of the components of every configuration of the product,
+    # maintained by rollup_costs
+    component_cost = models.DecimalField(max_digits=10, decimal_places=2,
+                                         default=0, editable=False)
 
     class Meta:
         ordering = ["name"]
@@ -125,6 +156,25 @@ class Product(models.Model):
     def __str__(self):
         return f"{self.name}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Expire the cached charts listing the products
+        bump_data_version()
+
+    def delete(self, *args, **kwargs):
+        deleted = super().delete(*args, **kwargs)
+        bump_data_version()
+        return deleted
+
+    def configuration_cost(self, option_values):
+        """
+        Return the cost of the components of a configuration of the
+        product, from the given option values of the product.
+        """
+        return self.component_cost + sum(
+            (option_value.component_cost for option_value in option_values),
+            Decimal('0.00'))
+
 
 # Create an Option model to define the options for a product config that can
 # be created along with a product
@@ -136,21 +186,54 @@ class Option(models.Model):
     def __str__(self):
         return f"{self.name}"
 
+    def delete(self, *args, **kwargs):
+        # Deleting the option values nulls the option value of their product
+        # components, which become common to all the configurations
+        return OptionValue.objects.filter(option=self).delete_with(
+            lambda: super(Option, self).delete(*args, **kwargs))
+
+
+class OptionValueQuerySet(models.QuerySet):
+    def delete(self):
+        return self.delete_with(super().delete)
+
+    def delete_with(self, delete):
+        """
+        Run the delete of the option values, or of objects cascading to
+        them, and roll up the costs of the products of their product
+        components, which the delete nulls the option value of.
+        """
+        product_ids = set(ProductComponent.objects.filter(
+            option_value__in=self).values_list('product_id', flat=True))
+        deleted = delete()
+        rollup_costs(product_ids=product_ids)
+        return deleted
+
 
 # Create the OptionValue model that defines the options for an Option model
-class OptionValue(models.Model):
+class OptionValue(TrackedFieldsMixin, models.Model):
     option = models.ForeignKey(Option, related_name='values',
                                on_delete=models.CASCADE)
     value = models.CharField(max_length=50)
+    # Cost of the components added by the option value to the product,
+    # maintained by rollup_costs
+    component_cost = models.DecimalField(max_digits=10, decimal_places=2,
+                                         default=0, editable=False)
+
+    objects = OptionValueQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.option} - {self.value}"
 
+    def delete(self, *args, **kwargs):
+        return OptionValue.objects.filter(pk=self.pk).delete_with(
+            lambda: super(OptionValue, self).delete(*args, **kwargs))
+
 
 # Create a ProductComponent intermediary model to link the Product with its
 # components in the many-to-many relationship and to be able to define a
 # quantity of each component that make up the product
-class ProductComponent(models.Model):
+class ProductComponent(TrackedFieldsMixin, models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     component = models.ForeignKey(Component, on_delete=models.CASCADE)
     option_value = models.ForeignKey(OptionValue, on_delete=models.SET_NULL,
@@ -158,7 +241,118 @@ class ProductComponent(models.Model):
                                      related_name='product_components')
     quantity = models.DecimalField(default=1, decimal_places=2, max_digits=4,
                                    validators=[MinValueValidator(0.00)])
+    # Cost of the quantity of the component, maintained by rollup_costs
+    line_cost = models.DecimalField(max_digits=10, decimal_places=2,
+                                    blank=True, null=True, editable=False)
 
     def __str__(self):
         return (f"{self.component.name} ({self.quantity} x "
                 f"{self.component.get_unit_measurement_display()})")
+
+    def save(self, *args, **kwargs):
+        # Only a new line, or a change of its quantity, component, option
+        # value or product, changes the costs of the products
+        changed_fields = self.changed_fields()
+        cost_changed = (changed_fields is None or self._state.adding
+                        or bool({'product', 'component', 'option_value',
+                                 'quantity'} & changed_fields))
+        saved_product_id = self.__dict__.get(
+            '_field_snapshot', {}).get('product', self.product_id)
+
+        super().save(*args, **kwargs)
+
+        if cost_changed:
+            rollup_costs(product_ids={saved_product_id, self.product_id})
+
+    def delete(self, *args, **kwargs):
+        product_id = self.product_id
+        deleted = super().delete(*args, **kwargs)
+        rollup_costs(product_ids={product_id})
+        return deleted
+
+
+# Thread-local state of the active batch of deferred cost rollups
+_deferred_rollup = threading.local()
+
+
+@contextmanager
+def defer_cost_rollup():
+    """
+    Defers the cost rollups of the part, component and product component
+    changes to the end of the batch, rolling the costs of all the touched
+    components and products up once, e.g. for the inlines of an admin
+    form. Nested batches are merged into the outermost one.
+    """
+    # Merge a nested batch into the active one
+    if getattr(_deferred_rollup, 'ids', None) is not None:
+        yield
+        return
+
+    _deferred_rollup.ids = (set(), set())
+    try:
+        yield
+        component_ids, product_ids = _deferred_rollup.ids
+    finally:
+        _deferred_rollup.ids = None
+    rollup_costs(component_ids, product_ids)
+
+
+def rollup_costs(component_ids=(), product_ids=()):
+    """
+    Recalculates the stored costs of the bill of materials affected by
+    changes of the given components and products, in bulk:
+    - the unit cost of the components with parts, from their parts
+    - the line cost of the product components using the components, or
+      of the products
+    - the component cost of the affected products, from their components
+      common to all configurations, and of their option values, from the
+      components added by each option value.
+    Returns whether the costs were recalculated, or deferred to the end
+    of the active batch.
+    """
+    component_ids = set(component_ids) - {None}
+    product_ids = set(product_ids) - {None}
+    deferred = getattr(_deferred_rollup, 'ids', None)
+    if deferred is not None:
+        deferred[0].update(component_ids)
+        deferred[1].update(product_ids)
+        return False
+    if not (component_ids or product_ids):
+        return False
+
+    cost = DecimalField(max_digits=10, decimal_places=2)
+    zero = Value(Decimal('0.00'))
+    if component_ids:
+        # The unit cost of a component with parts is the sum of the costs
+        # of its parts, or None if they have no costs
+        parts = ComponentPart.objects.filter(
+            component=OuterRef('pk')).order_by().values('component')
+        Component.objects.filter(pk__in=component_ids).filter(
+            Exists(parts)).update(unit_cost=NullIf(Subquery(
+                parts.annotate(total=Sum(ExpressionWrapper(
+                    F('unit_cost') * F('quantity'), output_field=cost)))
+                .values('total')), zero))
+
+    lines = ProductComponent.objects.filter(
+        models.Q(component_id__in=component_ids)
+        | models.Q(product_id__in=product_ids))
+    product_ids |= set(lines.values_list('product_id', flat=True))
+    lines.update(line_cost=ExpressionWrapper(
+        F('quantity') * Subquery(Component.objects.filter(
+            pk=OuterRef('component')).values('unit_cost')),
+        output_field=cost))
+
+    # The costs of the components common to all the configurations of
+    # the products, and added by each of their option values
+    product_lines = ProductComponent.objects.filter(
+        product=OuterRef('pk'), option_value__isnull=True
+    ).order_by().values('product')
+    Product.objects.filter(pk__in=product_ids).update(
+        component_cost=Coalesce(Subquery(product_lines.annotate(
+            total=Sum('line_cost')).values('total')), zero))
+    option_lines = ProductComponent.objects.filter(
+        option_value=OuterRef('pk')).order_by().values('option_value')
+    OptionValue.objects.filter(option__product_id__in=product_ids).update(
+        component_cost=Coalesce(Subquery(option_lines.annotate(
+            total=Sum('line_cost')).values('total')), zero))
+    return True
@@ -0,0 +1,189 @@
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from model_bakery import baker
+from products.models import (Product, Option, OptionValue, Component,
+                             ComponentPart, ProductComponent,
+                             defer_cost_rollup)
+
+
+class TestCostRollup(TestCase):
+    """
+    Test case for the rollup of the part costs to the components, product
+    components, products and option values
+    """
+
+    def setUp(self):
+        self.leg = Component.objects.create(name='Leg', slug='leg')
+        self.top = Component.objects.create(name='Top', slug='top',
+                                            unit_cost=Decimal('30.00'))
+        self.glass = Component.objects.create(name='Glass', slug='glass',
+                                              unit_cost=Decimal('50.00'))
+        self.product = baker.make(Product)
+        option = baker.make(Option, product=self.product)
+        self.glass_top = baker.make(OptionValue, option=option)
+        self.wood_top = baker.make(OptionValue, option=option)
+        ProductComponent.objects.create(product=self.product,
+                                        component=self.leg, quantity=4)
+        ProductComponent.objects.create(product=self.product,
+                                        component=self.top,
+                                        option_value=self.wood_top)
+        ProductComponent.objects.create(product=self.product,
+                                        component=self.glass,
+                                        option_value=self.glass_top)
+        self.other_product = baker.make(Product)
+        ProductComponent.objects.create(product=self.other_product,
+                                        component=self.top, quantity=2)
+
+    def make_part(self, component, unit_cost, quantity=1):
+        return ComponentPart.objects.create(
+            name=f'{component.name} part {unit_cost}',
+            slug=f'{component.slug}-part-{unit_cost}'.replace('.', '-'),
+            component=component, unit_cost=Decimal(unit_cost),
+            quantity=quantity)
+
+    def assertCosts(self, product_cost, wood_cost, glass_cost):
+        self.product.refresh_from_db()
+        self.wood_top.refresh_from_db()
+        self.glass_top.refresh_from_db()
+        self.assertEqual(self.product.component_cost, Decimal(product_cost))
+        self.assertEqual(self.wood_top.component_cost, Decimal(wood_cost))
+        self.assertEqual(self.glass_top.component_cost, Decimal(glass_cost))
+
+    def test_part_changes_roll_up(self):
+        """
+        Test that the part changes roll up to the cost of the component
+        and of the configurations of the products using it
+        """
+        part = self.make_part(self.leg, '2.50', quantity=2)
+        self.leg.refresh_from_db()
+        self.assertEqual(self.leg.unit_cost, Decimal('5.00'))
+        self.assertCosts('20.00', '30.00', '50.00')
+
+        part.quantity = 3
+        part.save()
+        self.assertCosts('30.00', '30.00', '50.00')
+        self.assertEqual(
+            self.product.configuration_cost([self.glass_top]),
+            Decimal('80.00'))
+
+        part.delete()
+        self.make_part(self.leg, '1.00')
+        self.assertCosts('4.00', '30.00', '50.00')
+
+    def test_component_cost_rolls_up(self):
+        """
+        Test that the unit cost of a component without parts rolls up to
+        the option values and products using it
+        """
+        self.top.unit_cost = Decimal('40.00')
+        self.top.save()
+
+        self.assertCosts('0.00', '40.00', '50.00')
+        self.other_product.refresh_from_db()
+        self.assertEqual(self.other_product.component_cost, Decimal('80.00'))
+
+    def test_product_component_changes_roll_up(self):
+        """
+        Test that moving a product component between option values, and
+        deleting it, updates the costs of the option values
+        """
+        line = ProductComponent.objects.get(component=self.glass)
+        line.option_value = self.wood_top
+        line.save()
+        self.assertCosts('0.00', '80.00', '0.00')
+
+        line.option_value = None
+        line.save()
+        self.assertCosts('50.00', '30.00', '0.00')
+
+        line.delete()
+        self.assertCosts('0.00', '30.00', '0.00')
+
+    def test_rollup_is_bulk(self):
+        """
+        Test that a rollup takes the same number of queries however many
+        product components use the component
+        """
+        for index in range(10):
+            ProductComponent.objects.create(
+                product=baker.make(Product), component=self.leg)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.make_part(self.leg, '1.00')
+        self.assertEqual(len(queries), 6)
+
+    def test_unaffected_costs_are_not_recalculated(self):
+        """
+        Test that a change only recalculates the costs of the products
+        using the changed component
+        """
+        with CaptureQueriesContext(connection) as queries:
+            self.make_part(self.leg, '1.00')
+        product_updates = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('UPDATE "products_product"')]
+        self.assertEqual(len(product_updates), 1)
+        self.assertIn(str(self.product.pk), product_updates[0])
+        self.assertNotIn(f' {self.other_product.pk}', product_updates[0])
+
+    def test_deferred_rollup(self):
+        """
+        Test that the rollups of a batch run once on exit
+        """
+        with CaptureQueriesContext(connection) as queries:
+            with defer_cost_rollup():
+                for cost in ('1.00', '2.00', '3.00'):
+                    self.make_part(self.leg, cost)
+                self.assertCosts('0.00', '30.00', '50.00')
+        self.assertEqual(len([query for query in queries
+                              if 'UPDATE "products_component"'
+                              in query['sql']]), 1)
+        self.assertCosts('24.00', '30.00', '50.00')
+
+    def test_component_delete_rolls_up(self):
+        """
+        Test that deleting a component removes its cost from the products
+        """
+        self.make_part(self.leg, '1.00')
+        self.leg.delete()
+        self.assertCosts('0.00', '30.00', '50.00')
+
+    def test_option_value_delete_rolls_up(self):
+        """
+        Test that deleting an option value, which makes its components
+        common to all the configurations, rolls up the product cost
+        """
+        self.glass_top.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.component_cost, Decimal('50.00'))
+
+        OptionValue.objects.filter(pk=self.wood_top.pk).delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.component_cost, Decimal('80.00'))
+
+    def test_option_delete_rolls_up(self):
+        """
+        Test that deleting an option, with its values, rolls up the
+        product cost
+        """
+        self.glass_top.option.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.component_cost, Decimal('80.00'))
+
+    def test_rollup_costs_command(self):
+        """
+        Test that the command recalculates the costs changed by queryset
+        updates, which bypass the rollups
+        """
+        self.make_part(self.leg, '1.00')
+        ComponentPart.objects.update(unit_cost=Decimal('2.00'))
+
+        out = StringIO()
+        call_command('rollup_costs', stdout=out)
+        self.assertIn('Rolled up the costs of 3 components and 2 products',
+                      out.getvalue())
+        self.assertCosts('8.00', '30.00', '50.00')
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import time
+from django.apps import apps
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F
+from rest_framework.response import Response
+
+
+# Seconds the charts of an older data version are served while a single
+# request recomputes them, after which every request recomputes them
+MAX_STALE = 300
+# Seconds a recompute holds its lock, if it fails to release it
+RECOMPUTE_LOCK_TIMEOUT = 30
+# Seconds the cached charts are kept
+CHART_TTL = 24 * 60 * 60
+
+
+def get_data_version():
+    """
+    Return the current version of the chart data, stored in the database,
+    so the writes of every worker process expire the cached charts.
+    """
+    ChartDataVersion = apps.get_model('orders', 'ChartDataVersion')
+    return ChartDataVersion.objects.filter(pk=1).values_list(
+        'version', flat=True).first() or 0
+
+
+def _bump_data_version():
+    ChartDataVersion = apps.get_model('orders', 'ChartDataVersion')
+    if not ChartDataVersion.objects.filter(pk=1).update(
+            version=F('version') + 1):
+        # The counter row is missing, so start it
+        ChartDataVersion.objects.bulk_create(
+            [ChartDataVersion(pk=1, version=1)], ignore_conflicts=True)
+
+
+def data_version_bump_pending():
+    """
+    Return whether the current transaction wrote chart data, whose version
+    is bumped on commit.
+    """
+    return connection.in_atomic_block and any(
+        func is _bump_data_version for _, func, _ in connection.run_on_commit)
+
+
+def bump_data_version():
+    """
+    Bump the version of the chart data after a write of the orders, order
+    items, clients or products, so the cached charts are recomputed. The
+    version is bumped once per transaction, on commit, so the charts
+    recomputed before are expired and the counter row is not locked for
+    the rest of the transaction.
+    """
+    if not connection.in_atomic_block:
+        _bump_data_version()
+    elif not data_version_bump_pending():
+        # The writes are committed by then, so a failed bump, e.g. on a
+        # locked database, is logged rather than failing the request, and
+        # the charts are expired by the next bump
+        transaction.on_commit(_bump_data_version, robust=True)
+
+
+def chart_cache_key(name, query_params):
+    """Return the cache key of the chart with the given query params."""
+    params = sorted((key, sorted(query_params.getlist(key)))
+                    for key in query_params)
+    digest = hashlib.sha256(json.dumps(params).encode()).hexdigest()
+    return f'chart:{name}:{digest}'
+
+
+def get_or_compute_chart(name, query_params, compute):
+    """
+    Return the response of the chart with the given query params from the
+    cache, if computed for the current data version, or computed with the
+    compute function. Once the data changed, the cached chart is still
+    returned, stale, while one request recomputes it, for up to MAX_STALE
+    seconds. Only the successful responses are cached.
+    Returns the response and the cache status: hit, stale or miss.
+    """
+    if data_version_bump_pending():
+        # The charts of the uncommitted writes of the transaction are not
+        # cached, nor served from the cache
+        return compute(), 'miss'
+    key = chart_cache_key(name, query_params)
+    lock_key = f'{key}:lock'
+    version = get_data_version()
+    entry = cache.get(key)
+    locked = False
+    if entry is not None:
+        if entry['version'] == version:
+            return Response(entry['data']), 'hit'
+        if entry['stale_since'] is None:
+            # Start the stale period on the first read of a newer version
+            entry['stale_since'] = time.time()
+            cache.set(key, entry, timeout=CHART_TTL)
+        # Return the stale chart while another request recomputes it
+        locked = cache.add(lock_key, 1, timeout=RECOMPUTE_LOCK_TIMEOUT)
+        if (not locked
+                and time.time() - entry['stale_since'] < MAX_STALE):
+            return Response(entry['data']), 'stale'
+    try:
+        response = compute()
+        if response.status_code == 200:
+            cache.set(key, {'version': version, 'data': response.data,
+                            'stale_since': None},
+                      timeout=CHART_TTL)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return response, 'miss'
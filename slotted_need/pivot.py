@@ -0,0 +1,85 @@
+import numpy as np
+
+
+class Pivot:
+    """
+    Dense matrix of the values of grouped query results, e.g. of
+    values(row, column).annotate(value), by row and column key. The rows
+    are pivoted in a single vectorized pass, the missing cells filled with
+    zeros, instead of looking up each cell in the results.
+    """
+
+    def __init__(self, matrix, row_keys, column_keys):
+        self.matrix = matrix
+        self.row_keys = list(row_keys)
+        self.column_keys = list(column_keys)
+
+    @classmethod
+    def from_rows(cls, rows, row_field, column_field, value_field,
+                  row_keys=None, column_keys=None, dtype=np.int64):
+        """
+        Pivot the rows, dicts or tuples indexed by the given fields, into a
+        matrix of the given row and column keys, by default the keys found
+        in the rows in their order. The values of the rows with other keys
+        are dropped, and those of the rows with the same keys summed.
+        """
+        rows = list(rows)
+        row_values = [row[row_field] for row in rows]
+        column_values = [row[column_field] for row in rows]
+        if row_keys is None:
+            row_keys = list(dict.fromkeys(row_values))
+        if column_keys is None:
+            column_keys = list(dict.fromkeys(column_values))
+        row_index = {key: index for index, key in enumerate(row_keys)}
+        column_index = {key: index for index, key in enumerate(column_keys)}
+
+        rows_at = np.fromiter((row_index.get(key, -1) for key in row_values),
+                              dtype=np.intp, count=len(rows))
+        columns_at = np.fromiter(
+            (column_index.get(key, -1) for key in column_values),
+            dtype=np.intp, count=len(rows))
+        values = np.fromiter((row[value_field] or 0 for row in rows),
+                             dtype=dtype, count=len(rows))
+
+        matrix = np.zeros((len(row_index), len(column_index)), dtype=dtype)
+        known = (rows_at >= 0) & (columns_at >= 0)
+        # Add unbuffered, so the values of repeated cells are summed
+        np.add.at(matrix, (rows_at[known], columns_at[known]), values[known])
+        return cls(matrix, row_keys, column_keys)
+
+    def row_totals(self):
+        return self.matrix.sum(axis=1)
+
+    def column_totals(self):
+        return self.matrix.sum(axis=0)
+
+    def total(self):
+        return self.matrix.sum()
+
+    def sort_rows(self, descending=True):
+        """
+        Return the pivot with the rows sorted by their totals, the ties in
+        their order.
+        """
+        totals = self.row_totals()
+        order = np.argsort(-totals if descending else totals, kind='stable')
+        return Pivot(self.matrix[order],
+                     [self.row_keys[index] for index in order],
+                     self.column_keys)
+
+    def top_rows(self, limit, other_key='Other'):
+        """
+        Return the pivot of the rows with the largest totals, sorted, and
+        the sum of the rest in a single row of the given other key.
+        """
+        ranked = self.sort_rows()
+        if len(ranked.row_keys) <= limit:
+            return ranked
+        return Pivot(
+            np.vstack([ranked.matrix[:limit],
+                       ranked.matrix[limit:].sum(axis=0, keepdims=True)]),
+            ranked.row_keys[:limit] + [other_key], self.column_keys)
+
+    def rows(self):
+        """Return the row keys with their values, as lists of numbers."""
+        return zip(self.row_keys, self.matrix.tolist())
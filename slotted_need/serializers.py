@@ -12,6 +12,7 @@ class ChartDatasetSerializer(serializers.Serializer):
 class ProdRevChartDataSerializer(serializers.Serializer):
     labels = serializers.ListField(child=serializers.CharField())
     values = serializers.ListField(child=serializers.FloatField())
+    total_entries = serializers.IntegerField()
 
 
 class DebtorChartDataSerializer(serializers.Serializer):
@@ -30,3 +31,4 @@ class ItemStatusConfigChartDataSerializer(serializers.Serializer):
     labels = serializers.ListField(child=serializers.CharField())
     values = serializers.ListField(child=serializers.IntegerField())
     colors = serializers.ListField(child=serializers.CharField())
+    total_entries = serializers.IntegerField()
@@ -1,12 +1,26 @@
-from django.test import TestCase, Client
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.db import OperationalError, transaction
+from django.http import QueryDict
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         Client)
+from django.utils import timezone
 from django.urls import reverse
 from django.contrib.auth.models import User
-from django.db.models import Sum, Count, DecimalField
+from django.db.models import F, Sum, Count, DecimalField
 from django.db.models.functions import Coalesce
 import numbers
-from orders.models import Client as ClientModel, OrderItem
+from orders.models import ChartDataVersion, Client as ClientModel, OrderItem
 from products.models import Product
 from model_bakery import baker
+from rest_framework.test import APIRequestFactory, force_authenticate
+from slotted_need.caches import chart_cache_key, get_data_version
+from slotted_need.utils import OTHER_RGB, entity_rgb, entity_rgba_colors
+from slotted_need.views import (ChartAPIView, DashboardAPIView,
+                                ItemStatusConfigAPIView)
 
 # prepare regex pattern for the rgba colour string
 START = r'^rgba\('
@@ -129,6 +143,62 @@ class TestProductRevenueDataAPI(TestCase):
         self.assertListEqual(expected_labels, sorted(data['labels']))
         self.assertListEqual(expected_values, sorted(data['values']))
 
+    def test_product_revenue_top_products(self):
+        """
+        Test that the products after the limit are aggregated into "Other"
+        and that the next offset drills down into them
+        """
+        for value in ('50.00', '40.00', '30.00'):
+            baker.make('orders.OrderItem', order=self.order,
+                       base_price=Decimal(value), discount=0)
+        revenues = sorted([float(item.item_value)
+                           for item in self.order.items.all()],
+                          reverse=True)
+
+        data = self.client.get(reverse(self.api_name),
+                               {'limit': 2}).json()
+        self.assertEqual(len(data['labels']), 3)
+        self.assertEqual(data['labels'][-1], 'Other')
+        self.assertListEqual(data['values'][:2], revenues[:2])
+        self.assertAlmostEqual(data['values'][-1], sum(revenues[2:]))
+        self.assertEqual(data['total_entries'], 5)
+
+        data = self.client.get(reverse(self.api_name),
+                               {'limit': 2, 'offset': 2}).json()
+        self.assertListEqual(data['values'][:2], revenues[2:4])
+        self.assertAlmostEqual(data['values'][-1], revenues[4])
+
+    def test_product_revenue_date_range(self):
+        """
+        Test that the revenue of the products is summed over the orders in
+        the date range, both ends included
+        """
+        today = timezone.localdate()
+        revenue = sum(float(item.item_value)
+                      for item in self.order.items.all())
+
+        data = self.client.get(reverse(self.api_name), {
+            'date_from': today.isoformat(),
+            'date_to': today.isoformat()}).json()
+        self.assertAlmostEqual(sum(data['values']), revenue)
+        self.assertEqual(data['total_entries'], 2)
+
+        data = self.client.get(reverse(self.api_name), {
+            'date_from': (today + timedelta(days=1)).isoformat()}).json()
+        self.assertListEqual(data['labels'], [])
+
+        response = self.client.get(reverse(self.api_name),
+                                   {'date_to': '18/10/2026'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_product_revenue_invalid_limit(self):
+        """
+        Test that an invalid limit or offset is rejected
+        """
+        for params in ({'limit': 0}, {'limit': 'all'}, {'offset': -1}):
+            response = self.client.get(reverse(self.api_name), params)
+            self.assertEqual(response.status_code, 400)
+
     def test_product_revenue_data_non_user(self):
         """
         Test a request without logged-in user to ensure
@@ -331,6 +401,55 @@ class TestItemStatusProductAPI(TestCase):
             self.assertIsInstance(dataset['borderWidth'],
                                   numbers.Number)
 
+    def test_item_status_product_date_range(self):
+        """
+        Test that only the items of the orders in the date range are
+        counted
+        """
+        yesterday = timezone.localdate() - timedelta(days=1)
+        data = self.client.get(reverse(self.api_name), {
+            'date_to': yesterday.isoformat()}).json()
+        self.assertEqual(data['total_items'], 0)
+
+        data = self.client.get(reverse(self.api_name), {
+            'date_from': yesterday.isoformat()}).json()
+        self.assertEqual(data['total_items'],
+                         OrderItem.objects.filter(completed=False).count())
+
+    def test_item_status_product_stable_colors(self):
+        """
+        Test that the products keep their colors when other products are
+        added to the chart
+        """
+        data = self.client.get(reverse(self.api_name)).json()
+        colors = {dataset['label']: dataset['backgroundColor']
+                  for dataset in data['datasets']}
+
+        baker.make('orders.OrderItem', product=baker.make(Product, name='A'))
+        data = self.client.get(reverse(self.api_name)).json()
+        self.assertEqual(len(data['datasets']), len(colors) + 1)
+        for dataset in data['datasets']:
+            if dataset['label'] != 'A':
+                self.assertEqual(dataset['backgroundColor'],
+                                 colors[dataset['label']])
+
+    def test_item_status_product_many_products(self):
+        """
+        Test that more products than the hues of a palette get distinct
+        colors, instead of failing
+        """
+        baker.make(Product, _quantity=400, _bulk_create=True)
+        # Write an item, so the chart is recomputed
+        baker.make('orders.OrderItem')
+
+        response = self.client.get(reverse(self.api_name))
+        self.assertEqual(response.status_code, 200)
+        datasets = response.json()['datasets']
+        self.assertEqual(len(datasets), Product.objects.count())
+        self.assertEqual(
+            len({dataset['backgroundColor'] for dataset in datasets}),
+            len(datasets))
+
     def test_item_status_product_data_non_user(self):
         """
         Test a request without logged-in user to ensure
@@ -346,6 +465,48 @@ class TestItemStatusProductAPI(TestCase):
                             msg='Anauthorised access allowed')
 
 
+class TestEntityColors(SimpleTestCase):
+    """
+    Test case for the stable colors of the chart entities
+    """
+
+    def test_colors_are_stable(self):
+        """
+        Test that an entity gets the same color whatever the other
+        entities, and that the colors of the kinds differ
+        """
+        self.assertEqual(entity_rgba_colors('product', [7, 3])[1],
+                         entity_rgba_colors('product', [3])[0])
+        self.assertNotEqual(entity_rgb('product', 3),
+                            entity_rgb('configuration', 3))
+        self.assertEqual(entity_rgb('product', None), OTHER_RGB)
+
+    def test_colors_are_unlimited_and_distinct(self):
+        """
+        Test that thousands of entities get distinct, valid colors
+        """
+        colors = entity_rgba_colors('product', range(1, 5001))
+        self.assertEqual(len(set(colors)), 5000)
+        for color in colors[:50] + colors[-50:]:
+            self.assertRegex(color, RGBA_REGEX)
+        self.assertNotIn(entity_rgba_colors('product', [None])[0], colors)
+
+    def test_border_colors(self):
+        """
+        Test that the border colors are the opaque background colors
+        """
+        background, border = entity_rgba_colors(
+            'product', [1], alpha=0.5, border_color=True)[0]
+        self.assertEqual(background.replace('0.5)', '1)'), border)
+
+    def test_colors_are_memoized(self):
+        """Test that the colors are computed once per process"""
+        entity_rgb('product', 123456)
+        hits = entity_rgb.cache_info().hits
+        entity_rgba_colors('product', [123456])
+        self.assertEqual(entity_rgb.cache_info().hits, hits + 1)
+
+
 class TestItemStatusConfigAPI(TestCase):
     """
     Test case for testing the ItemStatusConfigAPIView
@@ -420,6 +581,42 @@ class TestItemStatusConfigAPI(TestCase):
         # check that there are no duplicated labels
         self.assertEqual(len(data['labels']), len(set(data['labels'])))
 
+    def test_item_status_config_many_configurations(self):
+        """
+        Test that more configurations than the chart colors are aggregated
+        into "Other" after the default limit, instead of failing
+        """
+        baker.make('orders.OrderItem', _quantity=380, _bulk_create=True)
+
+        response = self.client.get(reverse(self.api_name))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['labels']), 21)
+        self.assertEqual(len(data['colors']), 21)
+        self.assertEqual(data['labels'][-1], 'Other')
+        self.assertEqual(sum(data['values']), 400)
+        self.assertEqual(data['total_entries'], 400)
+
+    def test_item_status_config_drilldown(self):
+        """
+        Test that the offset returns the configurations aggregated into
+        "Other", ranked by count
+        """
+        item = self.order_items[0]
+        baker.make('orders.OrderItem', product=item.product,
+                   product_finish=item.product_finish, _quantity=2)
+
+        data = self.client.get(reverse(self.api_name),
+                               {'limit': 5}).json()
+        self.assertEqual(data['labels'][0], item.configuration.label)
+        self.assertListEqual(data['values'], [3, 1, 1, 1, 1, 15])
+
+        drilldown = self.client.get(reverse(self.api_name),
+                                    {'limit': 5, 'offset': 5}).json()
+        self.assertListEqual(drilldown['values'], [1] * 5 + [10])
+        self.assertFalse(set(data['labels'][:5])
+                         & set(drilldown['labels'][:5]))
+
     def test_item_status_config_non_user(self):
         """
         Test a request without logged-in user to ensure
@@ -433,3 +630,236 @@ class TestItemStatusConfigAPI(TestCase):
         # check for non 200 status code
         self.assertNotEqual(response.status_code, 200,
                             msg='Anauthorised access allowed')
+
+
+class TestDashboardAPI(TestCase):
+    """
+    Test case for testing the DashboardAPIView
+    """
+
+    def setUp(self):
+        self.api_name = 'dashboard_data'
+        # Create a superuser / admin
+        self.user = baker.make(User, is_staff=True, is_superuser=True)
+        self.user.set_password('testpass')
+        self.user.save()
+        self.client = Client()
+        self.client.login(username=self.user.username,
+                          password='testpass')
+
+        # Create test data
+        self.order_items = baker.make('orders.OrderItem', _quantity=5)
+
+    def test_dashboard_data(self):
+        """
+        Test that the dashboard data has the data of each chart API
+        """
+        response = self.client.get(reverse(self.api_name))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+
+        for section, api_name in (
+                ('product_revenue', 'product_revenue_data'),
+                ('debtors', 'debtors_balances_data'),
+                ('item_status_product', 'item_status_product_data'),
+                ('item_status_config', 'item_status_config_data')):
+            self.assertDictEqual(data[section],
+                                 self.client.get(reverse(api_name)).json())
+
+    def test_chart_views_implement_chart_response(self):
+        """
+        Test that the base chart view is abstract, and every chart of the
+        dashboard implements its response
+        """
+        with self.assertRaises(TypeError):
+            ChartAPIView()
+        for view_class in DashboardAPIView.sections.values():
+            self.assertFalse(view_class.__abstractmethods__)
+
+    def test_dashboard_sections(self):
+        """
+        Test that only the requested sections are built, with their
+        prefixed params
+        """
+        product = self.order_items[0].product
+        response = self.client.get(reverse(self.api_name), {
+            'sections': 'item_status_config',
+            'item_status_config.product_id': product.id})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+
+        self.assertListEqual(list(data), ['item_status_config'])
+        self.assertListEqual(data['item_status_config']['labels'],
+                             [self.order_items[0].configuration.label])
+
+    def test_dashboard_invalid_sections(self):
+        """
+        Test that unknown sections and invalid section params are rejected
+        """
+        response = self.client.get(reverse(self.api_name),
+                                   {'sections': 'sales'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(reverse(self.api_name),
+                                   {'product_revenue.limit': 0})
+        self.assertEqual(response.status_code, 400)
+        self.assertListEqual(list(response.json()), ['product_revenue'])
+
+    def test_dashboard_data_compressed(self):
+        """
+        Test that the dashboard data is compressed for the clients
+        accepting it
+        """
+        response = self.client.get(reverse(self.api_name),
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_dashboard_non_user(self):
+        """
+        Test a request without logged-in user to ensure
+        that it gets rejected
+        """
+        response = Client().get(reverse(self.api_name))
+        self.assertNotEqual(response.status_code, 200,
+                            msg='Anauthorised access allowed')
+
+
+class TestDashboardAPIThreads(TransactionTestCase):
+    """
+    Test case for the sections of the DashboardAPIView built on the
+    thread pool, outside of a transaction
+    """
+
+    def test_dashboard_data_in_threads(self):
+        """
+        Test that the sections built concurrently match the chart APIs
+        """
+        user = baker.make(User)
+        baker.make('orders.OrderItem', _quantity=5)
+        request = APIRequestFactory().get(reverse('dashboard_data'))
+        force_authenticate(request, user=user)
+
+        with mock.patch('slotted_need.views.ThreadPoolExecutor',
+                        wraps=ThreadPoolExecutor) as executor:
+            response = DashboardAPIView.as_view()(request)
+        self.assertTrue(executor.called)
+        self.assertEqual(response.status_code, 200)
+        self.assertDictEqual(
+            response.data['item_status_config'],
+            ItemStatusConfigAPIView().chart_response({}).data)
+
+
+class TestChartCache(TransactionTestCase):
+    """
+    Test case for the versioned cache of the chart APIs, outside of a
+    transaction, as the data version is bumped on commit
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.api_name = 'item_status_config_data'
+        # Create a superuser / admin
+        self.user = baker.make(User, is_staff=True, is_superuser=True)
+        self.user.set_password('testpass')
+        self.user.save()
+        self.client = Client()
+        self.client.login(username=self.user.username,
+                          password='testpass')
+
+        # Create test data
+        self.order_item = baker.make('orders.OrderItem')
+
+    def get_chart(self, **params):
+        response = self.client.get(reverse(self.api_name), params)
+        self.assertEqual(response.status_code, 200)
+        return response['X-Chart-Cache'], response.json()
+
+    def test_charts_are_cached(self):
+        """
+        Test that the charts are cached by query params
+        """
+        self.assertEqual(self.get_chart()[0], 'miss')
+        cache_status, data = self.get_chart()
+        self.assertEqual(cache_status, 'hit')
+        self.assertListEqual(data['values'], [1])
+        self.assertEqual(self.get_chart(limit=5)[0], 'miss')
+
+    def test_writes_expire_the_charts(self):
+        """
+        Test that the order item, order, client and product writes expire
+        the cached charts
+        """
+        product = self.order_item.product
+        writes = [
+            lambda: baker.make('orders.OrderItem'),
+            lambda: self.order_item.order.save(),
+            lambda: ClientModel.objects.update(client_name='Jane'),
+            lambda: baker.make(Product),
+            lambda: setattr(product, 'name', 'Renamed') or product.save(),
+        ]
+        for write in writes:
+            self.get_chart()
+            write()
+            self.assertEqual(self.get_chart()[0], 'miss')
+        self.assertListEqual(self.get_chart()[1]['values'], [1, 1])
+
+    def test_version_shared_by_the_workers(self):
+        """
+        Test that a write of another worker process, bumping the data
+        version in the database, expires the charts cached by this one
+        """
+        self.get_chart()
+        self.assertEqual(self.get_chart()[0], 'hit')
+        ChartDataVersion.objects.update(version=F('version') + 1)
+        self.assertEqual(self.get_chart()[0], 'miss')
+
+    def test_stale_chart_while_recomputing(self):
+        """
+        Test that the stale chart is returned while another request
+        recomputes it, and recomputed once stale for too long
+        """
+        self.get_chart()
+        baker.make('orders.OrderItem')
+        key = chart_cache_key('ItemStatusConfigAPIView', QueryDict())
+        # Another request is recomputing the chart
+        cache.add(f'{key}:lock', 1)
+
+        cache_status, data = self.get_chart()
+        self.assertEqual(cache_status, 'stale')
+        self.assertListEqual(data['values'], [1])
+
+        with mock.patch('slotted_need.caches.MAX_STALE', 0):
+            cache_status, data = self.get_chart()
+        self.assertEqual(cache_status, 'miss')
+        self.assertListEqual(data['values'], [1, 1])
+
+    def test_version_bumped_on_commit(self):
+        """
+        Test that the data version is bumped once on the commit of the
+        writes, and the charts are not cached in the transaction
+        """
+        version = get_data_version()
+        with transaction.atomic():
+            baker.make('orders.OrderItem', _quantity=3)
+            self.assertEqual(get_data_version(), version)
+            self.assertEqual(self.get_chart()[0], 'miss')
+            self.assertEqual(self.get_chart()[0], 'miss')
+        self.assertEqual(get_data_version(), version + 1)
+        self.assertEqual(self.get_chart()[0], 'miss')
+        self.assertEqual(self.get_chart()[0], 'hit')
+
+    def test_failed_bump_keeps_the_commit(self):
+        """
+        Test that a failure to bump the data version on commit does not
+        fail the committed writes
+        """
+        def locked_bump():
+            raise OperationalError('database is locked')
+
+        with mock.patch('slotted_need.caches._bump_data_version',
+                        locked_bump):
+            with self.assertLogs('django.db.backends.base', 'ERROR'):
+                with transaction.atomic():
+                    item = baker.make('orders.OrderItem')
+        self.assertTrue(OrderItem.objects.filter(pk=item.pk).exists())
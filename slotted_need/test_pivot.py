@@ -0,0 +1,109 @@
+from io import StringIO
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from slotted_need.pivot import Pivot
+
+
+class TestPivot(SimpleTestCase):
+    """
+    Test case for the pivot of grouped query results into dense matrices
+    """
+
+    def setUp(self):
+        self.rows = [
+            {'product_id': 2, 'item_status': 1, 'count': 3},
+            {'product_id': 1, 'item_status': 3, 'count': 5},
+            {'product_id': 2, 'item_status': 4, 'count': 1},
+            {'product_id': 3, 'item_status': 2, 'count': 7},
+        ]
+
+    def pivot(self, rows=None, **kwargs):
+        return Pivot.from_rows(self.rows if rows is None else rows,
+                               'product_id', 'item_status', 'count', **kwargs)
+
+    def test_zero_fill(self):
+        """
+        Test that the missing cells, and the rows and columns without
+        results, are filled with zeros
+        """
+        pivot = self.pivot(row_keys=[1, 2, 3, 4], column_keys=[1, 2, 3, 4])
+        self.assertEqual(pivot.matrix.tolist(), [[0, 0, 5, 0],
+                                                 [3, 0, 0, 1],
+                                                 [0, 7, 0, 0],
+                                                 [0, 0, 0, 0]])
+
+    def test_default_keys(self):
+        """
+        Test that the keys default to those of the results, in their order
+        """
+        pivot = self.pivot()
+        self.assertEqual(pivot.row_keys, [2, 1, 3])
+        self.assertEqual(pivot.column_keys, [1, 3, 4, 2])
+        self.assertEqual(pivot.matrix.tolist(), [[3, 0, 1, 0],
+                                                 [0, 5, 0, 0],
+                                                 [0, 0, 0, 7]])
+
+    def test_unknown_keys_and_repeats(self):
+        """
+        Test that the results of other keys are dropped, the repeated cells
+        summed and the null values counted as zeros
+        """
+        rows = self.rows + [
+            {'product_id': 9, 'item_status': 1, 'count': 100},
+            {'product_id': 2, 'item_status': 1, 'count': 2},
+            {'product_id': 1, 'item_status': 1, 'count': None},
+        ]
+        pivot = self.pivot(rows, row_keys=[1, 2], column_keys=[1, 3])
+        self.assertEqual(pivot.matrix.tolist(), [[0, 5], [5, 0]])
+
+    def test_tuple_rows(self):
+        """Test that the rows can be tuples, indexed by position"""
+        pivot = Pivot.from_rows([('a', 'x', 1.5), ('b', 'y', 2)], 0, 1, 2,
+                                dtype=float)
+        self.assertEqual(pivot.matrix.tolist(), [[1.5, 0], [0, 2]])
+
+    def test_totals(self):
+        """Test the row, column and grand totals"""
+        pivot = self.pivot(row_keys=[1, 2, 3], column_keys=[1, 2, 3, 4])
+        self.assertEqual(pivot.row_totals().tolist(), [5, 4, 7])
+        self.assertEqual(pivot.column_totals().tolist(), [3, 7, 5, 1])
+        self.assertEqual(pivot.total(), 16)
+
+    def test_empty(self):
+        """Test that pivoting no results gives a matrix of zeros"""
+        pivot = self.pivot([], row_keys=[1, 2], column_keys=[1])
+        self.assertEqual(pivot.matrix.tolist(), [[0], [0]])
+        self.assertEqual(pivot.total(), 0)
+
+    def test_sort_rows(self):
+        """
+        Test that the rows are sorted by their totals, the ties in their
+        order
+        """
+        pivot = self.pivot(row_keys=[4, 1, 2, 3], column_keys=[1, 2, 3, 4])
+        self.assertEqual(pivot.sort_rows().row_keys, [3, 1, 2, 4])
+        self.assertEqual(pivot.sort_rows(descending=False).row_keys,
+                         [4, 2, 1, 3])
+        self.assertEqual(pivot.sort_rows().matrix[0].tolist(), [0, 7, 0, 0])
+
+    def test_top_rows(self):
+        """
+        Test that the rows beyond the limit are summed in the other row
+        """
+        pivot = self.pivot(row_keys=[1, 2, 3], column_keys=[1, 2, 3, 4])
+        top = pivot.top_rows(1)
+        self.assertEqual(top.row_keys, [3, 'Other'])
+        self.assertEqual(top.matrix.tolist(), [[0, 7, 0, 0], [3, 0, 5, 1]])
+        self.assertEqual(top.total(), pivot.total())
+        self.assertEqual(
+            list(top.rows()), [(3, [0, 7, 0, 0]), ('Other', [3, 0, 5, 1])])
+        self.assertEqual(pivot.top_rows(3).row_keys, [3, 1, 2])
+
+    def test_benchmark_command(self):
+        """
+        Test that the benchmark builds the same matrix as the scan
+        """
+        out = StringIO()
+        call_command('benchmark_item_status_pivot', products=20, runs=1,
+                     stdout=out)
+        self.assertIn('20 products x 4 statuses', out.getvalue())
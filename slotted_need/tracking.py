@@ -0,0 +1,146 @@
+from django.db import DatabaseError, models, router
+from django.db.models import signals
+
+
+class TrackedFieldsMixin:
+    """
+    Model mixin tracking the changes of the concrete fields of instances
+    loaded from the database. The field values are snapshotted on load and
+    after each save, and saves of loaded instances only write the changed
+    fields, and are skipped if no field changed.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.snapshot_fields()
+        return instance
+
+    @classmethod
+    def tracked_fields(cls):
+        # The concrete fields except the primary key, by name
+        return [field for field in cls._meta.concrete_fields
+                if not field.primary_key]
+
+    def snapshot_fields(self, names=None):
+        """
+        Snapshot the loaded values of the fields with the given names or
+        attribute names, or of all the tracked fields.
+        """
+        snapshot = self.__dict__.setdefault('_field_snapshot', {})
+        for field in self.tracked_fields():
+            if names is not None and not {field.name,
+                                          field.attname} & set(names):
+                continue
+            # Skip the deferred fields, which are not loaded
+            if field.attname in self.__dict__:
+                snapshot[field.name] = self.__dict__[field.attname]
+
+    def changed_fields(self):
+        """
+        Return the names of the fields changed since the instance was loaded
+        or saved, or None if the instance was not loaded from the database.
+        """
+        snapshot = self.__dict__.get('_field_snapshot')
+        if snapshot is None:
+            return None
+        return {field.name for field in self.tracked_fields()
+                if field.attname in self.__dict__
+                and (field.name not in snapshot
+                     or snapshot[field.name] != self.__dict__[field.attname])}
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self.snapshot_fields(fields)
+
+    def save(self, *args, **kwargs):
+        changed = self.changed_fields()
+        if (changed is not None and not self._state.adding and not args
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            if not changed:
+                return
+            kwargs['update_fields'] = self.fields_to_save(changed)
+        super().save(*args, **kwargs)
+        self.snapshot_fields(kwargs.get('update_fields'))
+
+    def fields_to_save(self, changed):
+        """
+        Return the names of the fields to save, the changed fields and
+        the fields set on each save, e.g. auto_now dates.
+        """
+        return changed | {field.name for field in self.tracked_fields()
+                          if getattr(field, 'auto_now', False)}
+
+
+class ConcurrentUpdateError(DatabaseError):
+    """Raised when saving an instance changed by another save since loaded."""
+
+
+class VersionedMixin(TrackedFieldsMixin):
+    """
+    Model mixin for optimistic concurrency control, using an integer
+    version field incremented on every save. Saves of loaded instances
+    only update the row if its version is still the loaded one, with a
+    conditional UPDATE, and raise ConcurrentUpdateError otherwise, so no
+    concurrent change is silently overwritten. As with IntegrityError,
+    wrap saves that may conflict in transaction.atomic to recover.
+    """
+    version_field = 'version'
+
+    def save(self, *args, **kwargs):
+        snapshot = self.__dict__.get('_field_snapshot', {})
+        loaded_version = snapshot.get(self.version_field)
+        if (self._state.adding or loaded_version is None or args
+                or kwargs.get('force_insert')):
+            super().save(*args, **kwargs)
+            return
+        # A version set on the instance, e.g. from a request, must be the
+        # loaded one, as the changes are tracked from the load
+        if getattr(self, self.version_field) != loaded_version:
+            raise ConcurrentUpdateError(
+                f"{self._meta.object_name} {self.pk} was changed "
+                f"since version {getattr(self, self.version_field)}.")
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            changed = self.changed_fields()
+            if not changed:
+                return
+            update_fields = self.fields_to_save(changed)
+        elif not update_fields:
+            return
+        self.update_version(loaded_version, update_fields,
+                            kwargs.get('using'))
+
+    def update_version(self, expected_version, update_fields, using=None):
+        """
+        Save the fields with the incremented version in a single UPDATE
+        conditional on the expected version, sending the save signals.
+        Raises ConcurrentUpdateError if the row was changed, or deleted,
+        since that version.
+        """
+        model = type(self)
+        using = using or router.db_for_write(model, instance=self)
+        update_fields = frozenset({*update_fields, self.version_field})
+        setattr(self, self.version_field, expected_version + 1)
+        signals.pre_save.send(sender=model, instance=self, raw=False,
+                              using=using, update_fields=update_fields)
+        values = {field.attname: field.pre_save(self, False)
+                  for field in self.tracked_fields()
+                  if field.name in update_fields
+                  or field.attname in update_fields}
+        # A plain queryset, as the update of the model's manager may have
+        # side effects for bulk updates, which a save handles itself
+        updated = models.QuerySet(model, using=using).filter(
+            pk=self.pk, **{self.version_field: expected_version}
+        ).update(**values)
+        if not updated:
+            setattr(self, self.version_field, expected_version)
+            raise ConcurrentUpdateError(
+                f"{self._meta.object_name} {self.pk} was changed or "
+                f"deleted since version {expected_version}.")
+        self._state.db = using
+        self.snapshot_fields(update_fields)
+        signals.post_save.send(sender=model, instance=self, created=False,
+                               update_fields=update_fields, raw=False,
+                               using=using)
@@ -18,7 +18,8 @@ from django.contrib import admin
 from django.urls import path, include
 from .apis import router
 from .views import (HomeView, ProductRevenueDataAPIView, DebtorBalancesAPIView,
-                    ItemStatusProductAPIView, ItemStatusConfigAPIView)
+                    ItemStatusProductAPIView, ItemStatusConfigAPIView,
+                    DashboardAPIView)
 # from users.views import CustomLoginView
 
 
@@ -38,6 +39,8 @@ urlpatterns = [
          name='item_status_product_data'),
     path('api/item-status-config-data/', ItemStatusConfigAPIView.as_view(),
          name='item_status_config_data'),
+    path('api/dashboard/', DashboardAPIView.as_view(),
+         name='dashboard_data'),
     # Order views
     path('orders/', include('orders.urls')),
     # all-auth
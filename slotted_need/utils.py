@@ -1,45 +1,142 @@
-import seaborn as sns
+import colorsys
+import heapq
+import math
+import zlib
+from datetime import datetime
+from functools import lru_cache
 
 
-def generate_unique_rgba_colors(num_colors, alpha=0.6, border_color=False):
+# Number of entries of the ranked charts without a limit parameter, and the
+# largest limit accepted, the rest aggregated into an "Other" entry
+CHART_LIMIT = 20
+MAX_CHART_LIMIT = 100
+
+
+# Fraction of the hue circle between the colors of consecutive ids, the
+# golden ratio conjugate, so the hues of any run of ids are spread evenly
+HUE_STEP = (math.sqrt(5) - 1) / 2
+# Steps of the lightness and saturation between consecutive ids, those of
+# the R2 sequence, so the colors of close hues differ in both
+LIGHTNESS_STEP = 0.7548776662466927
+SATURATION_STEP = 0.5698402909980532
+# Lowest value and range of the lightness and saturation of the colors
+LIGHTNESS_RANGE = (0.35, 0.35)
+SATURATION_RANGE = (0.5, 0.35)
+# Color of the entries without an id, e.g. "Other"
+OTHER_RGB = (158, 158, 158)
+
+
+@lru_cache(maxsize=4096)
+def entity_rgb(kind, entity_id):
+    """
+    Returns the stable RGB color of an entity, e.g. a product, by its kind
+    and id, so it keeps its color across charts, requests and processes.
+    Any number of ids get distinct colors, memoized in the process.
+
+    Args:
+        kind (str): Kind of the entity, offsetting the hues of its ids from
+                    those of the other kinds.
+        entity_id (int): Id of the entity, or None for the "Other" color.
+
+    Returns:
+        tuple: The red, green and blue values, from 0 to 255.
+    """
+    if entity_id is None:
+        return OTHER_RGB
+    # crc32 rather than hash, which is salted per process for strings
+    kind_offset = zlib.crc32(kind.encode()) / 2 ** 32
+    hue = (kind_offset + entity_id * HUE_STEP) % 1
+    lightness = (LIGHTNESS_RANGE[0]
+                 + LIGHTNESS_RANGE[1] * (entity_id * LIGHTNESS_STEP % 1))
+    saturation = (SATURATION_RANGE[0]
+                  + SATURATION_RANGE[1] * (entity_id * SATURATION_STEP % 1))
+    return tuple(round(channel * 255) for channel in colorsys.hls_to_rgb(
+        hue, lightness, saturation))
+
+
+def entity_rgba_colors(kind, entity_ids, alpha=0.6, border_color=False):
     """
-    Generates a list of unique, visually distinct RGBA color strings using HSL.
+    Generates the list of the stable RGBA color strings of entities by id.
 
     Args:
-        num_colors (int): Number of unique colors to generate.
+        kind (str): Kind of the entities, e.g. 'product'.
+        entity_ids (iterable): Ids of the entities, None for "Other".
         alpha (float): Alpha value for RGBA colors (default: 0.6).
         border_color (boolean): If a matching border color is also required.
 
     Returns:
-        List[str] or List[tuples]: List of unique RGBA color strings or
-                                    list of tuples with pair of background
-                                    and border RGBA color strings.
+        List[str] or List[tuples]: List of RGBA color strings or list of
+                                    tuples with pair of background and
+                                    border RGBA color strings.
     """
-    # check if number of colors requested exceed possible unique hues
-    if num_colors > 360:
-        raise ValueError(
-            "Number of colors requested exceeds the unique hue variations.")
-
-    # Initialize color list
     colors = []
+    for entity_id in entity_ids:
+        r, g, b = entity_rgb(kind, entity_id)
+        background = f'rgba({r}, {g}, {b}, {alpha})'
+        colors.append((background, f'rgba({r}, {g}, {b}, 1)')
+                      if border_color else background)
+    return colors
 
-    # Get a visually distinct husl palette
-    palette = sns.color_palette('husl', num_colors)
-
-    # If border color is required
-    if border_color:
-        # create a list of tuples with background and border colors
-        colors = [
-            (f'rgba({int(r * 255)}, {int(g * 255)}, {int(b * 255)}, {alpha})',
-             f'rgba({int(r * 255)}, {int(g * 255)}, {int(b * 255)}, 1)')
-            for r, g, b in palette
-        ]
-
-    else:
-        # Create a list background color strings only
-        colors = [
-            f'rgba({int(r * 255)}, {int(g * 255)}, {int(b * 255)}, {alpha})'
-            for r, g, b in palette
-        ]
 
-    return colors
+def parse_limit_offset(query_params, default_limit=CHART_LIMIT):
+    """
+    Parse the limit and offset query parameters of a ranked chart.
+
+    Raises:
+        ValueError: If the limit is not an integer from 1 to MAX_CHART_LIMIT
+                    or the offset not a non-negative integer.
+    """
+    limit = int(query_params.get('limit', default_limit))
+    offset = int(query_params.get('offset', 0))
+    if not 1 <= limit <= MAX_CHART_LIMIT or offset < 0:
+        raise ValueError("Limit or offset out of range.")
+    return limit, offset
+
+
+def top_n_with_other(entries, limit, offset=0, other_label='Other'):
+    """
+    Selects the entries ranked from offset to offset + limit by descending
+    value with a heap, without sorting all of them, and aggregates the
+    values of the entries ranked after them into a single "Other" entry.
+    Drilling down into "Other" is requesting the next offset.
+
+    Args:
+        entries (iterable): (label, value) pairs, the ties ranked in their
+                            order.
+        limit (int): Number of entries to return, besides "Other".
+        offset (int): Number of top entries to skip (default: 0).
+        other_label (str): Label of the aggregated entry.
+
+    Returns:
+        tuple: The list of labels, the list of values and the total number
+               of entries.
+    """
+    entries = list(entries)
+    # Rank by value and then by position, so the ties keep their order
+    ranked = heapq.nlargest(offset + limit, enumerate(entries),
+                            key=lambda entry: (entry[1][1], -entry[0]))
+    window = [entry for _, entry in ranked[offset:]]
+    labels = [label for label, _ in window]
+    values = [value for _, value in window]
+
+    # Aggregate the entries ranked after the window
+    if len(entries) > offset + limit:
+        ranked_indexes = {index for index, _ in ranked}
+        labels.append(other_label)
+        values.append(sum(value for index, (_, value) in enumerate(entries)
+                          if index not in ranked_indexes))
+    return labels, values, len(entries)
+
+
+def parse_date_range(query_params):
+    """
+    Parse the date_from and date_to query parameters of a chart, in the
+    YYYY-MM-DD format, into dates, or None if not given.
+
+    Raises:
+        ValueError: If a date is not in the YYYY-MM-DD format.
+    """
+    return tuple(
+        datetime.strptime(query_params[param], '%Y-%m-%d').date()
+        if query_params.get(param) else None
+        for param in ('date_from', 'date_to'))
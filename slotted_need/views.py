@@ -1,20 +1,52 @@
-from datetime import datetime
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 import json
+import threading
+from django.db import connection, connections
+from django.http import QueryDict
+from django.utils.decorators import method_decorator
+from django.views.decorators.gzip import gzip_page
 from django.views.generic import TemplateView
 from rest_framework.views import APIView, View
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
-from django.db.models import Sum, Count, Q, DecimalField
+from django.db.models import Sum, Count, Min, Q, DecimalField
 from django.db.models.functions import Coalesce
 from products.models import Product
 from django.contrib.auth.mixins import LoginRequiredMixin
-from orders.models import Client, OrderItem, Order
+from orders.models import Client, OrderItem, Order, ProductDailyRollup
 from .serializers import (ProdRevChartDataSerializer,
                           DebtorChartDataSerializer,
                           ItemStatusProdDataSerializer,
                           ItemStatusConfigChartDataSerializer)
-from .utils import generate_unique_rgba_colors
+from .caches import get_or_compute_chart
+from .pivot import Pivot
+from .utils import (entity_rgba_colors, parse_date_range,
+                    parse_limit_offset, top_n_with_other, MAX_CHART_LIMIT)
+
+
+# The error of the invalid date range of the charts
+DATE_RANGE_ERROR = "Invalid date_from or date_to. Expected format: YYYY-MM-DD."
+
+
+def daily_rollups_in_range(date_from, date_to, prefix='daily_rollups__'):
+    """
+    Return the filter of the daily rollups, or the products by their daily
+    rollups, in the date range, both ends included.
+    """
+    filters = Q()
+    if date_from:
+        filters &= Q(**{f'{prefix}date__gte': date_from})
+    if date_to:
+        filters &= Q(**{f'{prefix}date__lte': date_to})
+    return filters
+
+
+# The error of the invalid limit and offset of the ranked charts
+LIMIT_OFFSET_ERROR = (f"Invalid limit or offset. The limit must be an "
+                      f"integer from 1 to {MAX_CHART_LIMIT} and the offset "
+                      f"a non-negative integer.")
 
 
 class BaseLoginRequiredView(LoginRequiredMixin, View):
@@ -53,17 +85,46 @@ class HomeView(TemplateView,
         return context
 
 
-# The API view that provides the data for the revenue chart in JSON format
-class ProductRevenueDataAPIView(APIView):
+class ChartAPIView(APIView, metaclass=ABCMeta):
+    """
+    Abstract base API view of a dashboard chart, building its response
+    from the query params alone, in chart_response, so the dashboard API
+    can build the charts outside of their own requests. The responses are
+    cached by query params until the next write of the chart data.
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request, format=None):
+        response, cache_status = self.cached_chart_response(
+            request.query_params)
+        response['X-Chart-Cache'] = cache_status
+        return response
+
+    def cached_chart_response(self, query_params):
+        """
+        Return the cached response of the chart for the query params, and
+        the cache status.
+        """
+        return get_or_compute_chart(
+            type(self).__name__, query_params,
+            lambda: self.chart_response(query_params))
+
+    @abstractmethod
+    def chart_response(self, query_params):
+        """
+        Return the response of the chart for the query params, with the
+        400 status for invalid params.
+        """
+
+
+# The API view that provides the data for the revenue chart in JSON format
+class ProductRevenueDataAPIView(ChartAPIView):
+
+    def chart_response(self, query_params):
 
         # Step 1: Extract Query Parameters
-        revenue_min = request.query_params.get('revenue_min', None)
-        revenue_max = request.query_params.get('revenue_max', None)
-        date_from = request.query_params.get('date_from', None)
-        date_to = request.query_params.get('date_to', None)
+        revenue_min = query_params.get('revenue_min', None)
+        revenue_max = query_params.get('revenue_max', None)
 
         # Step 2: Initialize Filters
         filters = Q()
@@ -85,42 +146,48 @@ class ProductRevenueDataAPIView(APIView):
 
         # Step 4: Apply Date Range Filters
         try:
-            if date_from:
-                date_from_parsed = datetime.strptime(date_from, '%Y-%m-%d')
-                filters &= Q(
-                    order_items__order__created_on__gte=date_from_parsed)
-            if date_to:
-                date_to_parsed = datetime.strptime(date_to, '%Y-%m-%d')
-                filters &= Q(
-                    order_items__order__created_on__lte=date_to_parsed)
+            date_from, date_to = parse_date_range(query_params)
         except ValueError:
-            return Response(
-                {"error":
-                    "Invalid date_from or date_to."
-                    " Expected format: YYYY-MM-DD."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            return Response({"error": DATE_RANGE_ERROR},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # Step 5: Apply the limit and offset of the ranked products
+        try:
+            limit, offset = parse_limit_offset(query_params)
+        except ValueError:
+            return Response({"error": LIMIT_OFFSET_ERROR},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-        # Step 5: Fetch and Annotate Products to calculate revenue per product
-        products = Product.objects.annotate(
+        # Step 6: Fetch and Annotate Products to sum their revenue from the
+        # daily rollups, restricted to the products with items in the date
+        # range, if any
+        products = Product.objects.all()
+        if date_from or date_to:
+            products = products.filter(
+                daily_rollups_in_range(date_from, date_to)
+                & Q(daily_rollups__item_count__gt=0))
+        products = products.annotate(
             total_revenue=Coalesce(
-                Sum('order_items__item_value'),
+                Sum('daily_rollups__revenue'),
                 0,
                 output_field=DecimalField()
             )
-        ).filter(filters).order_by('-total_revenue')
+        ).filter(filters).order_by('id').values_list('name', 'total_revenue')
 
-        # Step 6: Prepare data
-        product_names = [product.name for product in products]
-        revenue_values = [float(product.total_revenue) for product in products]
+        # Step 7: Prepare data, the top products by revenue and the rest
+        # aggregated into "Other"
+        product_names, revenue_values, total_entries = top_n_with_other(
+            ((name, float(revenue)) for name, revenue in products),
+            limit, offset)
 
-        # Step 7: Serialize data
+        # Step 8: Serialize data
         serializer = ProdRevChartDataSerializer(data={
             'labels': product_names,
             'values': revenue_values,
+            'total_entries': total_entries,
         })
 
-        # Step 8: Validate and return data
+        # Step 9: Validate and return data
         if serializer.is_valid():
             return Response(serializer.data,
                             status=status.HTTP_200_OK)
@@ -129,10 +196,9 @@ class ProductRevenueDataAPIView(APIView):
                             status=status.HTTP_400_BAD_REQUEST)
 
 
-class DebtorBalancesAPIView(APIView):
-    permission_classes = [IsAuthenticated]
+class DebtorBalancesAPIView(ChartAPIView):
 
-    def get(self, request, format=None):
+    def chart_response(self, query_params):
         # Calculate total debtor balance per client using reverse relationship
         debtors = Client.objects.filter(orders__paid=1).annotate(
             balance_owed=Coalesce(
@@ -160,61 +226,58 @@ class DebtorBalancesAPIView(APIView):
                             status=status.HTTP_400_BAD_REQUEST)
 
 
-class ItemStatusProductAPIView(APIView):
-    permission_classes = [IsAuthenticated]
-
-    def get(self, request, format=None):
-        # Fetch OrderItems filtering out completed orders
-        order_items = OrderItem.objects.filter(completed=False)
-        # Fetch products list
-        products = Product.objects.all()
+class ItemStatusProductAPIView(ChartAPIView):
 
-        # Aggregate counts by item_status
-        status_counts = list(
-            order_items.values(
-                'item_status', 'product__name').order_by(
-                    'item_status').annotate(
-                        count=Count('id')))
+    def chart_response(self, query_params):
+        # Get the date range of the orders, if any
+        try:
+            date_from, date_to = parse_date_range(query_params)
+        except ValueError:
+            return Response({"error": DATE_RANGE_ERROR},
+                            status=status.HTTP_400_BAD_REQUEST)
+        # Fetch the daily rollups of the items in the date range, filtering
+        # out the completed items, i.e. delivered and fully paid
+        rollups = ProductDailyRollup.objects.filter(
+            daily_rollups_in_range(date_from, date_to, prefix='')).exclude(
+            item_status=4, paid=2)
+        # Fetch the names of the products, which are the rows of the chart
+        products = list(Product.objects.values_list('id', 'name'))
+
+        # Aggregate counts by product and item_status
+        status_counts = rollups.values(
+            'product_id', 'item_status').order_by().annotate(
+                count=Sum('item_count'))
 
         # Pull the mapping with status codes to human-readable labels
         status_mapping = OrderItem.STATUS_CHOICES
         # Get the item status labels
         labels = [label for label in status_mapping.values()]
-        # Initialize empty datasets list
+        # Pivot the counts into the product by status matrix, so all
+        # statuses are represented, even with zero counts
+        counts = Pivot.from_rows(
+            status_counts, 'product_id', 'item_status', 'count',
+            row_keys=[product_id for product_id, _ in products],
+            column_keys=list(status_mapping.keys()))
+        # Get the rgba colors of the products, stable across the charts
+        colors = entity_rgba_colors(
+            'product', counts.row_keys, border_color=True)
+
         datasets = []
-        # Get unique rgba colors list using util function
-        colors = generate_unique_rgba_colors(len(products), border_color=True)
-
-        # Ensure all statuses are represented, even with zero counts
-        for idx, product in enumerate(products):
-            count_data = []
-            # Ensure all statuses are represented, even with zero counts
-            for status_code in status_mapping.keys():
-                # Find if this status exists in the aggregated data
-                matching = next((item for item in status_counts
-                                if item['product__name'] == product.name
-                                and item['item_status'] == status_code),
-                                None)
-                count_data.append(matching['count'] if matching else 0)
-
-            bg_color, bd_color = colors[idx]
-
-            dataset = {
-                'label': product.name,
+        for (_, name), count_data, (bg_color, bd_color) in zip(
+                products, counts.matrix.tolist(), colors):
+            datasets.append({
+                'label': name,
                 'data': count_data,
                 'backgroundColor': bg_color,
                 'borderColor': bd_color,
                 'borderWidth': 1
-            }
-            datasets.append(dataset)
+            })
 
         # Serialize the data
         serializer = ItemStatusProdDataSerializer(data={
             'labels': labels,
             'datasets': datasets,
-            'total_items': int(sum(
-                [sum(dataset['data'])for dataset in datasets]
-            ))
+            'total_items': int(counts.total())
         })
 
         # Validate and return response
@@ -225,54 +288,58 @@ class ItemStatusProductAPIView(APIView):
                             status=status.HTTP_400_BAD_REQUEST)
 
 
-class ItemStatusConfigAPIView(APIView):
-    permission_classes = [IsAuthenticated]
+class ItemStatusConfigAPIView(ChartAPIView):
 
-    def get(self, request, format=None):
+    def chart_response(self, query_params):
         # Get product_id from query parameters if provided
-        product_id = request.query_params.get('product_id', None)
+        product_id = query_params.get('product_id', None)
+        # Get the limit and offset of the ranked configurations
+        try:
+            limit, offset = parse_limit_offset(query_params)
+        except ValueError:
+            return Response({"error": LIMIT_OFFSET_ERROR},
+                            status=status.HTTP_400_BAD_REQUEST)
 
         # Fetch OrderItems filtering out made, delivered and archived orders
-        order_items = OrderItem.objects.filter(
-            completed=False).select_related(
-            'product').prefetch_related(
-            'option_values', 'item_component_finishes').order_by(
-            'id')
+        order_items = OrderItem.objects.filter(completed=False)
 
         # If product_id is provided, filter further by product
         if product_id:
             order_items = order_items.filter(product_id=product_id)
 
-        # Optimize the queryset to avoid N+1 problems
-        order_items = order_items.select_related('product').prefetch_related(
-            'option_values', 'item_component_finishes'
-        ).order_by('id')
+        # Count the items by their interned configuration, grouping on the
+        # configuration foreign key, in the order of their first item
+        config_rows = order_items.values(
+            'configuration_id', 'configuration__label').annotate(
+            count=Count('id'), first_item=Min('id')).order_by('first_item')
 
-        # Aggregate item counts by their unique configuration combo
+        # Merge the counts of any distinct configurations sharing a label,
+        # colored as the first of them
         config_counts = {}
-        for item in order_items:
-            # fetch the item's configuration property
-            config = item.unique_configuration
-            # pass the config to the counter dict and increment by 1
-            config_counts[config] = config_counts.get(config, 0) + 1
-
-        # Sort the config_counts dict by descending on count
-        sorted_config_counts = dict(sorted(config_counts.items(),
-                                           key=lambda x: x[1],
-                                           reverse=True))
-
-        # Get the item status labels
-        labels = [label for label in sorted_config_counts.keys()]
-        # Get values of config
-        values = [count for count in sorted_config_counts.values()]
-        # Create list of background colors
-        colors = generate_unique_rgba_colors(len(labels))
+        config_ids = {}
+        for row in config_rows:
+            config = row['configuration__label']
+            config_counts[config] = config_counts.get(config, 0) + row['count']
+            config_ids.setdefault(config, row['configuration_id'])
+
+        # Select the most common configurations, the ties in the order of
+        # their first item, and aggregate the rest into "Other"
+        labels, values, total_entries = top_n_with_other(
+            config_counts.items(), limit, offset)
+        # Create list of the background colors of the configurations, stable
+        # across the charts, and the "Other" color for the aggregated rest
+        has_other = total_entries > offset + limit
+        colors = entity_rgba_colors(
+            'configuration',
+            [config_ids[label] for label in labels[:len(labels) - has_other]]
+            + [None] * has_other)
 
         # Serialize the data
         serializer = ItemStatusConfigChartDataSerializer(data={
             'labels': labels,
             'values': values,
-            'colors': colors
+            'colors': colors,
+            'total_entries': total_entries,
         })
 
         # Validate and return response
@@ -281,3 +348,74 @@ class ItemStatusConfigAPIView(APIView):
         else:
             return Response(serializer.errors,
                             status=status.HTTP_400_BAD_REQUEST)
+
+
+# Number of threads, each with its own database connection, building the
+# sections of the dashboard API concurrently
+DASHBOARD_WORKERS = 4
+
+
+@method_decorator(gzip_page, name='dispatch')
+class DashboardAPIView(APIView):
+    """
+    API view returning the data of the dashboard charts in one compressed
+    payload, by section. The sections query param selects the sections,
+    all by default, and the params of a section are prefixed with its name,
+    e.g. item_status_config.product_id. The sections are built concurrently
+    on a thread pool.
+    """
+    permission_classes = [IsAuthenticated]
+    sections = {
+        'product_revenue': ProductRevenueDataAPIView,
+        'debtors': DebtorBalancesAPIView,
+        'item_status_product': ItemStatusProductAPIView,
+        'item_status_config': ItemStatusConfigAPIView,
+    }
+
+    def get(self, request, format=None):
+        # Get the requested sections, all if not specified
+        names = request.query_params.get('sections')
+        names = names.split(',') if names else list(self.sections)
+        unknown = set(names) - set(self.sections)
+        if unknown:
+            return Response(
+                {"error": f"Unknown sections: {', '.join(sorted(unknown))}. "
+                          f"Expected any of: {', '.join(self.sections)}."},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        # Route the prefixed query params to their sections
+        section_params = {name: QueryDict(mutable=True) for name in names}
+        for key, values in request.query_params.lists():
+            name, _, param = key.partition('.')
+            if name in section_params and param:
+                section_params[name].setlist(param, values)
+
+        def build_section(name):
+            try:
+                response, _ = self.sections[name]().cached_chart_response(
+                    section_params[name])
+                return response
+            finally:
+                # Close the connection of the worker thread
+                if threading.current_thread() is not main_thread:
+                    connections.close_all()
+
+        # The other threads cannot see the changes of an open transaction,
+        # e.g. with ATOMIC_REQUESTS, so build the sections in this thread
+        main_thread = threading.current_thread()
+        if connection.in_atomic_block or DASHBOARD_WORKERS < 2:
+            responses = [build_section(name) for name in names]
+        else:
+            with ThreadPoolExecutor(max_workers=min(
+                    DASHBOARD_WORKERS, len(names))) as executor:
+                responses = list(executor.map(build_section, names))
+
+        # Return the errors of the invalid sections, if any
+        errors = {name: response.data
+                  for name, response in zip(names, responses)
+                  if response.status_code != status.HTTP_200_OK}
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response({name: response.data
+                         for name, response in zip(names, responses)},
+                        status=status.HTTP_200_OK)
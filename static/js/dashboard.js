@@ -16,70 +16,92 @@ $(document).ready(function () {
     // Setup AJAX to include CSRF token
     ajaxSetupToken(csrftoken);
 
-    // Function to fetch and render the Debtors chart
-    function RenderProdRevChart(filters = {}) {
-        // API AJAX call to fetch revenue data and initialize product revenue chart
-        $.ajax({
-            url: '/api/product-revenue-data/',
-            type: 'GET',
-            data: filters,
-            dataType: 'json',
-            success: function (data) {
-                // get product revenue chart element
-                let ctx = document.getElementById('productRevenueChart').getContext('2d');
+    // Render the next page of a ranked chart when its "Other" entry is clicked
+    function drillDownOther(elements, data, filters, renderChart) {
+        if (!elements.length || data.labels[elements[0].index] !== 'Other') {
+            return;
+        }
+        // The entries shown besides "Other" are skipped
+        let offset = (parseInt(filters.offset) || 0) + data.labels.length - 1;
+        renderChart(Object.assign({}, filters, { offset: offset }));
+    }
 
-                // Destroy existing chart if it exists to prevent duplication
-                if (window.productRevenueChart instanceof Chart) {
-                    window.productRevenueChart.destroy();
-                }
+    // Function to fetch and render the Debtors chart
+    function RenderProdRevChart(filters = {}, preloaded = null) {
+        // Draw the chart from its data
+        function draw(data) {
+            // get product revenue chart element
+            let ctx = document.getElementById('productRevenueChart').getContext('2d');
+
+            // Destroy existing chart if it exists to prevent duplication
+            if (window.productRevenueChart instanceof Chart) {
+                window.productRevenueChart.destroy();
+            }
 
-                // initialise new chart
-                window.productRevenueChart = new Chart(ctx, {
-                    type: 'bar',
-                    data: {
-                        labels: data.labels,
-                        datasets: [{
-                            label: 'Revenue (€)',
-                            data: data.values,
-                            backgroundColor: 'rgba(110, 196, 133, 0.6)',
-                            borderColor: 'rgba(110, 196, 133, 1)',
-                            borderWidth: 1
-                        }]
-                    },
-                    options: {
-                        scales: {
-                            y: {
-                                beginAtZero: true,
-                                title: {
-                                    display: true,
-                                    text: 'Revenue (€)'
-                                }
-                            },
-                            x: {
-                                title: {
-                                    display: false,
-                                    text: 'Products'
-                                }
+            // initialise new chart
+            window.productRevenueChart = new Chart(ctx, {
+                type: 'bar',
+                data: {
+                    labels: data.labels,
+                    datasets: [{
+                        label: 'Revenue (€)',
+                        data: data.values,
+                        backgroundColor: 'rgba(110, 196, 133, 0.6)',
+                        borderColor: 'rgba(110, 196, 133, 1)',
+                        borderWidth: 1
+                    }]
+                },
+                options: {
+                    scales: {
+                        y: {
+                            beginAtZero: true,
+                            title: {
+                                display: true,
+                                text: 'Revenue (€)'
                             }
                         },
-                        plugins: {
+                        x: {
                             title: {
-                                display: true,
-                                text: 'Revenue by Product',
-                                font: {
-                                    size: 20
-                                }
-                            },
-                            legend: {
                                 display: false,
+                                text: 'Products'
+                            }
+                        }
+                    },
+                    plugins: {
+                        title: {
+                            display: true,
+                            text: 'Revenue by Product',
+                            font: {
+                                size: 20
                             }
                         },
-                        responsive: true,
-                        maintainAspectRatio: true
+                        legend: {
+                            display: false,
+                        }
+                    },
+                    responsive: true,
+                    maintainAspectRatio: true,
+                    // Drill down into the products aggregated in "Other"
+                    onClick: function (event, elements) {
+                        drillDownOther(elements, data, filters, RenderProdRevChart);
                     }
-                });
+                }
+            });
 
-            },
+        }
+
+        // Draw the data preloaded by the dashboard API, if any
+        if (preloaded) {
+            draw(preloaded);
+            return;
+        }
+        // API AJAX call to fetch revenue data and initialize product revenue chart
+        $.ajax({
+            url: '/api/product-revenue-data/',
+            type: 'GET',
+            data: filters,
+            dataType: 'json',
+            success: draw,
             // Error handling
             error: function (xhr, status, error) {
                 // display message
@@ -133,66 +155,74 @@ $(document).ready(function () {
     });
 
     // Function to fetch and render the Debtors chart
-    function RenderDebtorsChart(filters = {}) {
-        // API AJAX call to fetch debtors data and initialize debtors chart
-        $.ajax({
-            url: '/api/debtors-data/',
-            type: 'GET',
-            data: filters,
-            dataType: 'json',
-            success: function (data) {
-                // get product revenue chart element
-                let ctx = document.getElementById('debtorsChart').getContext('2d');
-                // initialize chartjs chart
-                let debtorsChart = new Chart(ctx, {
-                    type: 'bar',
-                    data: {
-                        labels: data.labels,
-                        datasets: [{
-                            label: 'Debtors (€)',
-                            data: data.values,
-                            backgroundColor: 'rgba(75, 192, 192, 0.6)',
-                            borderColor: 'rgba(75, 192, 192, 1)',
-                            borderWidth: 1
-                        }]
-                    },
-                    options: {
-                        scales: {
-                            y: {
-                                beginAtZero: true,
-                                title: {
-                                    display: true,
-                                    text: 'Amounts Owed (€)'
-                                }
-                            },
-                            x: {
-                                title: {
-                                    display: false,
-                                    text: 'Clients'
-                                }
+    function RenderDebtorsChart(filters = {}, preloaded = null) {
+        // Draw the chart from its data
+        function draw(data) {
+            // get product revenue chart element
+            let ctx = document.getElementById('debtorsChart').getContext('2d');
+            // initialize chartjs chart
+            let debtorsChart = new Chart(ctx, {
+                type: 'bar',
+                data: {
+                    labels: data.labels,
+                    datasets: [{
+                        label: 'Debtors (€)',
+                        data: data.values,
+                        backgroundColor: 'rgba(75, 192, 192, 0.6)',
+                        borderColor: 'rgba(75, 192, 192, 1)',
+                        borderWidth: 1
+                    }]
+                },
+                options: {
+                    scales: {
+                        y: {
+                            beginAtZero: true,
+                            title: {
+                                display: true,
+                                text: 'Amounts Owed (€)'
                             }
                         },
-                        plugins: {
+                        x: {
                             title: {
-                                display: true,
-                                text: 'Amounts Owed by Client',
-                                font: {
-                                    size: 20
-                                }
-                            },
-                            legend: {
-                                display: false
+                                display: false,
+                                text: 'Clients'
+                            }
+                        }
+                    },
+                    plugins: {
+                        title: {
+                            display: true,
+                            text: 'Amounts Owed by Client',
+                            font: {
+                                size: 20
                             }
                         },
-                        responsive: true,
-                        maintainAspectRatio: true
-                    }
-                });
+                        legend: {
+                            display: false
+                        }
+                    },
+                    responsive: true,
+                    maintainAspectRatio: true
+                }
+            });
 
-                // Update Total amount owed
-                let totalAmountOwed = formatWithThousandsSeparator(data.total);
-                $('#total-debtor-bal').val(totalAmountOwed);
-            },
+            // Update Total amount owed
+            let totalAmountOwed = formatWithThousandsSeparator(data.total);
+            $('#total-debtor-bal').val(totalAmountOwed);
+        }
+
+        // Draw the data preloaded by the dashboard API, if any
+        if (preloaded) {
+            draw(preloaded);
+            return;
+        }
+        // API AJAX call to fetch debtors data and initialize debtors chart
+        $.ajax({
+            url: '/api/debtors-data/',
+            type: 'GET',
+            data: filters,
+            dataType: 'json',
+            success: draw,
             // Error handling
             error: function (xhr, status, error) {
                 // display message
@@ -206,66 +236,74 @@ $(document).ready(function () {
     }
 
     // Function to fetch and render the Item Status by Product chart
-    function RenderItemStatusProductChart(filters = {}) {
-        // API AJAX call to fetch order items status data and initialize the doughnut chart
-        $.ajax({
-            url: '/api/item-status-product-data/',
-            type: 'GET',
-            dataType: 'json',
-            success: function (data) {
-                let ctx = document.getElementById('orderItemStatusProductChart').getContext('2d');
-                let orderItemsStatusChart = new Chart(ctx, {
-                    type: 'bar',
-                    data: {
-                        labels: data.labels,
-                        datasets: data.datasets
+    function RenderItemStatusProductChart(filters = {}, preloaded = null) {
+        // Draw the chart from its data
+        function draw(data) {
+            let ctx = document.getElementById('orderItemStatusProductChart').getContext('2d');
+            let orderItemsStatusChart = new Chart(ctx, {
+                type: 'bar',
+                data: {
+                    labels: data.labels,
+                    datasets: data.datasets
+                },
+                options: {
+                    responsive: true,
+                    maintainAspectRatio: true,
+                    plugins: {
+                        title: {
+                            display: true,
+                            text: 'Open Items by Status',
+                            font: {
+                                size: 20
+                            }
+                        },
+                        legend: {
+                            display: true,
+                            position: 'top',
+                        },
+                        tooltip: {
+                            enabled: true
+                        }
                     },
-                    options: {
-                        responsive: true,
-                        maintainAspectRatio: true,
-                        plugins: {
+                    scales: {
+                        y: {
+                            beginAtZero: true,
+                            stacked: true,
                             title: {
-                                display: true,
-                                text: 'Open Items by Status',
-                                font: {
-                                    size: 20
-                                }
-                            },
-                            legend: {
-                                display: true,
-                                position: 'top',
+                                display: false,
+                                text: 'Count of Items'
                             },
-                            tooltip: {
-                                enabled: true
+                            ticks: {
+                                stepSize: 1
                             }
                         },
-                        scales: {
-                            y: {
-                                beginAtZero: true,
-                                stacked: true,
-                                title: {
-                                    display: false,
-                                    text: 'Count of Items'
-                                },
-                                ticks: {
-                                    stepSize: 1
-                                }
-                            },
-                            x: {
-                                stacked: true,
-                                title: {
-                                    display: false,
-                                    text: 'Item Status'
-                                }
+                        x: {
+                            stacked: true,
+                            title: {
+                                display: false,
+                                text: 'Item Status'
                             }
-                        },
-                    }
-                });
+                        }
+                    },
+                }
+            });
 
-                // Update Total Items display input
-                let totalItems = formatWithThousandsSeparator(data.total_items);
-                $('#total-open-items').val(totalItems);
-            },
+            // Update Total Items display input
+            let totalItems = formatWithThousandsSeparator(data.total_items);
+            $('#total-open-items').val(totalItems);
+        }
+
+        // Draw the data preloaded by the dashboard API, if any
+        if (preloaded) {
+            draw(preloaded);
+            return;
+        }
+        // API AJAX call to fetch order items status data and initialize the doughnut chart
+        $.ajax({
+            url: '/api/item-status-product-data/',
+            type: 'GET',
+            dataType: 'json',
+            success: draw,
             // Error handling
             error: function (xhr, status, error) {
                 // display message
@@ -279,54 +317,66 @@ $(document).ready(function () {
     }
 
     // Function to fetch and render the Item Status by Product chart
-    function RenderItemStatusConfigChart(filters = {}) {
+    function RenderItemStatusConfigChart(filters = {}, preloaded = null) {
+        // Draw the chart from its data
+        function draw(data) {
+            let ctx = document.getElementById('orderItemStatusConfigChart').getContext('2d');
+
+            // Destroy existing chart if it exists to prevent duplication
+            if (window.orderItemsStatusChart instanceof Chart) {
+                window.orderItemsStatusChart.destroy();
+            }
+            
+            // Initialise new char
+            window.orderItemsStatusChart = new Chart(ctx, {
+                type: 'doughnut',
+                data: {
+                    labels: data.labels,
+                    datasets: [{
+                        label: 'Configuration Count',
+                        data: data.values,
+                        backgroundColor: data.colors,
+                    }]
+                },
+                options: {
+                    responsive: true,
+                    maintainAspectRatio: true,
+                    // Drill down into the configurations aggregated in "Other"
+                    onClick: function (event, elements) {
+                        drillDownOther(elements, data, filters, RenderItemStatusConfigChart);
+                    },
+                    plugins: {
+                        title: {
+                            display: false,
+                            text: 'Open Items by Configuration',
+                            font: {
+                                size: 20
+                            }
+                        },
+                        legend: {
+                            display: true,
+                            position: 'top',
+                        },
+                        tooltip: {
+                            enabled: true
+                        }
+                    },
+                }
+            });
+        }
+
+        // Draw the data preloaded by the dashboard API, if any
+        if (preloaded) {
+            draw(preloaded);
+            return;
+        }
         // API AJAX call to fetch order items status data and initialize the doughnut chart
         $.ajax({
             url: '/api/item-status-config-data/',
             type: 'GET',
             data: filters,  // Include filter parameters
             dataType: 'json',
-            success: function (data) {
-                let ctx = document.getElementById('orderItemStatusConfigChart').getContext('2d');
-
-                // Destroy existing chart if it exists to prevent duplication
-                if (window.orderItemsStatusChart instanceof Chart) {
-                    window.orderItemsStatusChart.destroy();
-                }
-                
-                // Initialise new char
-                window.orderItemsStatusChart = new Chart(ctx, {
-                    type: 'doughnut',
-                    data: {
-                        labels: data.labels,
-                        datasets: [{
-                            label: 'Configuration Count',
-                            data: data.values,
-                            backgroundColor: data.colors,
-                        }]
-                    },
-                    options: {
-                        responsive: true,
-                        maintainAspectRatio: true,
-                        plugins: {
-                            title: {
-                                display: false,
-                                text: 'Open Items by Configuration',
-                                font: {
-                                    size: 20
-                                }
-                            },
-                            legend: {
-                                display: true,
-                                position: 'top',
-                            },
-                            tooltip: {
-                                enabled: true
-                            }
-                        },
-                    }
-                });
-            },
+            success: draw,
             // Error handling
             error: function (xhr, status, error) {
                 // display message
@@ -531,11 +581,27 @@ $(document).ready(function () {
         e.stopPropagation();
     });
 
-    // initial charts load
-    RenderProdRevChart();
-    RenderDebtorsChart();
-    RenderItemStatusProductChart();
-    RenderItemStatusConfigChart();
+    // initial charts load, with a single request for the data of all the charts
+    $.ajax({
+        url: '/api/dashboard/',
+        type: 'GET',
+        dataType: 'json',
+        success: function (data) {
+            RenderProdRevChart({}, data.product_revenue);
+            RenderDebtorsChart({}, data.debtors);
+            RenderItemStatusProductChart({}, data.item_status_product);
+            RenderItemStatusConfigChart({}, data.item_status_config);
+        },
+        // Error handling
+        error: function (xhr, status, error) {
+            // display message
+            let errorMessage = `
+                                Error fetching dashboard data:
+                                error ${xhr.status} - ${error}: ${xhr.responseText ? xhr.responseText : ''}
+                                `;
+            displayMessage(errorMessage, 'error');
+        }
+    });
 
     // initialize tooltips
     initTooltips();
@@ -176,7 +176,7 @@ $(document).ready(function () {
                 className: 'sortable',
                 render: function (data, type, row) {
                     if (type === 'display') {
-                        let select = '<select class="form-select-sm priority-status fw-bolder text-wrap" data-id="' + row.id + '" aria-label="Priority status">';
+                        let select = '<select class="form-select-sm priority-status fw-bolder text-wrap" data-id="' + row.id + '" data-version="' + row.version + '" aria-label="Priority status">';
                         // Use global variable passed from context into JS and generate select options
                         let options = generateSelectOptions(priorityLevelChoices, data);
                         select += options;
@@ -199,7 +199,7 @@ $(document).ready(function () {
                 className: 'sortable',
                 render: function (data, type, row) {
                     if (type === 'display') {
-                        let select = `<select class="form-select-sm item-status fw-bolder text-wrap" data-id="${row.id}" aria-label="Select item status">`;
+                        let select = `<select class="form-select-sm item-status fw-bolder text-wrap" data-id="${row.id}" data-version="${row.version}" aria-label="Select item status">`;
                         // Use global variable passed from context into JS and generate select options
                         let options = generateSelectOptions(itemStatusChoices, data);
                         select += options;
@@ -477,10 +477,14 @@ $(document).ready(function () {
             url: `/api/order-items/${orderItemId}/`,
             type: 'PATCH',
             data: JSON.stringify({
-                'item_status': newStatus
+                'item_status': newStatus,
+                // the version the change is based on, rejected if outdated
+                'version': $(this).attr('data-version')
             }),
             contentType: 'application/json',
             success: function (response) {
+                // keep the version of the item's inputs current
+                $(`#orderitem-table select[data-id="${orderItemId}"]`).attr('data-version', response.version);
                 // hide the spinner
                 toggleSpinner(spinner);
             },
@@ -512,10 +516,14 @@ $(document).ready(function () {
             url: `/api/order-items/${orderitemId}/`,
             type: 'PATCH',
             data: JSON.stringify({
-                'priority_level': newPriority
+                'priority_level': newPriority,
+                // the version the change is based on, rejected if outdated
+                'version': $(this).attr('data-version')
             }),
             contentType: 'application/json',
             success: function (response) {
+                // keep the version of the item's inputs current
+                $(`#orderitem-table select[data-id="${orderitemId}"]`).attr('data-version', response.version);
                 // hide spinner
                 toggleSpinner(spinner);
             },
@@ -150,6 +150,7 @@ $(document).ready(function () {
                         // render the order status HTML
                         let orderStatusDiv = '<div>';
                         orderStatusDiv += renderOrderStatus(row.id, data, row.paid);
+                        orderStatusDiv += renderItemsProgress(row);
                         return orderStatusDiv += '</div>';
                     }
                     return data;
@@ -242,6 +243,26 @@ $(document).ready(function () {
 
     }
 
+    // Function that renders the progress breakdown of the order items by status,
+    // from the item status counts of the order
+    function renderItemsProgress(order) {
+        const counts = [
+            [order.items_delivered, 'bg-success', orderStatusChoices[4]],
+            [order.items_made, 'bg-info', orderStatusChoices[3]],
+            [order.items_in_progress, 'bg-warning', orderStatusChoices[2]],
+        ];
+        const total = counts.reduce((sum, [count]) => sum + count, order.items_not_started);
+        if (!total) {
+            return '';
+        }
+        let progress = `<div class="progress mt-1" style="height: 4px;" id="items-progress-${order.id}"
+        title="${counts.map(([count, , label]) => `${label}: ${count}`).join(', ')}, ${orderStatusChoices[1]}: ${order.items_not_started}">`;
+        for (const [count, style] of counts) {
+            progress += `<div class="progress-bar ${style}" role="progressbar" style="width: ${100 * count / total}%"></div>`;
+        }
+        return progress + '</div>';
+    }
+
     // Function that styles the row based on status
     function updateRowStyle(row, data) {
 
@@ -399,10 +420,14 @@ $(document).ready(function () {
             url: `/api/order-items/${orderitemId}/`,
             type: 'PATCH',
             data: JSON.stringify({
-                'item_status': newStatus
+                'item_status': newStatus,
+                // the version the change is based on, rejected if outdated
+                'version': $(this).attr('data-version')
             }),
             contentType: 'application/json',
             success: function (response) {
+                // keep the version of the item's inputs current
+                $(`#orders-table .item-status[data-id="${orderitemId}"], #orders-table .priority-status[data-id="${orderitemId}"]`).attr('data-version', response.version);
                 // Get order details
                 let orderData = response.order;
                 // Find the DataTable row
@@ -414,6 +439,8 @@ $(document).ready(function () {
                 let orderStatusDiv = document.createElement('div');
                 orderStatusDiv.innerHTML = orderStatusBadgeHTML;
                 orderStatusBadge.replaceWith(orderStatusDiv);
+                // Update the progress breakdown of the items
+                $(`#items-progress-${orderData.id}`).replaceWith(renderItemsProgress(orderData));
                 // get the new badge element
                 let newOrderStatusBadge = $(`#order-status-badge-${orderData.id}`);
                 // Refresh badge status styles
@@ -447,10 +474,14 @@ $(document).ready(function () {
             url: `/api/order-items/${orderitemId}/`,
             type: 'PATCH',
             data: JSON.stringify({
-                'priority_level': newStatus
+                'priority_level': newStatus,
+                // the version the change is based on, rejected if outdated
+                'version': $(this).attr('data-version')
             }),
             contentType: 'application/json',
             success: function (response) {
+                // keep the version of the item's inputs current
+                $(`#orders-table .item-status[data-id="${orderitemId}"], #orders-table .priority-status[data-id="${orderitemId}"]`).attr('data-version', response.version);
                 // hide the spinner on completion
                 toggleSpinner(spinner);
             },
@@ -264,7 +264,7 @@ function formatOrderItems(orderItems) {
                 <td>${generateOptionsList('component_finishes', item.item_component_finishes)}</td>
                 <td>€${item.item_value}</td>
                 <td>
-                    <select class="form-select-sm fw-bolder text-wrap item-status" data-id="${item.id}">
+                    <select class="form-select-sm fw-bolder text-wrap item-status" data-id="${item.id}" data-version="${item.version}">
                         ${generateSelectOptions(itemStatusChoices, item.item_status)}
                     </select>
                     <span class="text-center inline-spinner-div">
@@ -274,7 +274,7 @@ function formatOrderItems(orderItems) {
                     </span>
                 </td>
                 <td>
-                    <select class="form-select-sm fw-bolder text-wrap priority-status" data-id="${item.id}">
+                    <select class="form-select-sm fw-bolder text-wrap priority-status" data-id="${item.id}" data-version="${item.version}">
                         ${generateSelectOptions(priorityLevelChoices, item.priority_level)}
                     </select>
                     <span class="text-center inline-spinner-div">